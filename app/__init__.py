@@ -10,8 +10,9 @@ def create_app():
     app = Flask(__name__, static_folder='web', static_url_path='/web')
     app.config['MONGO_URI'] = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
     app.config['MONGO_DB'] = os.getenv('MONGO_DB', 'learning_rec')
-    app.config['REC_EPSILON'] = float(os.getenv('REC_EPSILON', '0.1'))
-    app.config['REC_MAX_CANDIDATES'] = int(os.getenv('REC_MAX_CANDIDATES', '200'))
+    # Recommender, cache, write-behind, chatbot and serving settings are read from the
+    # environment where they are used (see .env.example): the model is built outside any
+    # app context too, by app.serving's supervisor and scripts/build_snapshot.py.
 
     from .main import bp as main_bp
     app.register_blueprint(main_bp)
@@ -1,53 +1,248 @@
 """
 Gemini-powered chatbot with web search capabilities
 """
+import hashlib
 import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 import requests
-import google.generativeai as genai
-from typing import Dict, List, Any, Optional
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Iterator, List, Any, Optional
+from .utils.cache import DiskCache, TieredCache
+
+# search backend: (query, num_results) -> [{"title", "link", "snippet", "source"}]; raises on failure
+SearchBackend = Callable[[str, int], List[Dict[str, Any]]]
+
+
+def _normalize(text: str) -> str:
+    # case, whitespace and trailing punctuation don't change the answer
+    return re.sub(r'\s+', ' ', text.lower()).strip().strip('?!.').strip()
+
+
+def _cache_key(*parts: str) -> str:
+    return hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()
+
+
+def http_session(pool_size: int = 4) -> requests.Session:
+    """Session with keep-alive connections, shared by the search threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def serpapi_search(api_key: str, session: Optional[requests.Session] = None, timeout: float = 10) -> SearchBackend:
+    session = session or http_session()
+
+    def search(query: str, num_results: int) -> List[Dict[str, Any]]:
+        url = "https://serpapi.com/search"
+        params = {
+            "engine": "google",
+            "q": query,
+            "api_key": api_key,
+            "num": num_results
+        }
+
+        response = session.get(url, params=params, timeout=timeout)
+        # error responses count as failures (not cached, trip the breaker)
+        response.raise_for_status()
+        data = response.json()
+
+        results = []
+        if "organic_results" in data:
+            for result in data["organic_results"][:num_results]:
+                results.append({
+                    "title": result.get("title", ""),
+                    "link": result.get("link", ""),
+                    "snippet": result.get("snippet", ""),
+                    "source": result.get("source", "")
+                })
+        return results
+
+    return search
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker: after ``threshold`` failures in a row calls are
+    refused for ``reset_after`` seconds, then a single trial call is let through;
+    its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, threshold: int = 3, reset_after: float = 30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.threshold <= 0:
+            return True
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            self._trial = True
+            return True
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.threshold > 0 and (self.failures >= self.threshold or self.opened_at is not None):
+                self.opened_at = time.monotonic()
+
+
+class FakeModel:
+    """
+    Local stand-in for the Gemini model (CHATBOT_FAKE=1): echoes the question,
+    no network. With stream=True it yields one word per chunk, ``delay`` seconds apart.
+    """
+
+    class _Response:
+        def __init__(self, text: str):
+            self.text = text
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        self.calls += 1
+        question = prompt.split('\n', 1)[0].replace('User question: ', '')
+        text = f"(offline answer) You asked: {question}"
+        if not stream:
+            return self._Response(text)
+        return self._stream(text)
+
+    def _stream(self, text: str):
+        for i, word in enumerate(text.split(' ')):
+            if self.delay:
+                time.sleep(self.delay)
+            yield self._Response(word if i == 0 else ' ' + word)
+
+
+def fake_search(query: str, num_results: int) -> List[Dict[str, Any]]:
+    """Local stand-in for SerpAPI (CHATBOT_FAKE=1)."""
+    return [{"title": f"Result {i} for {query}", "link": f"https://example.com/{i}",
+             "snippet": f"About {query}", "source": "example.com"} for i in range(1, num_results + 1)]
+
 
 class GeminiChatbot:
-    def __init__(self):
+    def __init__(self, model: Any = None, search: Optional[SearchBackend] = None,
+                 chat_cache: Optional[TieredCache] = None, search_cache: Optional[TieredCache] = None,
+                 search_budget: Optional[float] = None, breaker: Optional[CircuitBreaker] = None):
+        """
+        ``model`` needs ``generate_content(prompt).text`` and ``search`` follows
+        SearchBackend; both default to Gemini/SerpAPI from the environment (or the
+        local fakes with CHATBOT_FAKE=1). Caches default to the CHAT_CACHE_* settings.
+
+        Web searches run on a small thread pool while the platform lookup runs on
+        the caller's thread. A request waits at most ``search_budget`` seconds
+        (CHAT_SEARCH_BUDGET_MS) for search results and answers without them
+        otherwise; ``breaker`` skips the search backend while it keeps failing.
+        """
+        workers = int(os.getenv('CHAT_SEARCH_WORKERS', '4'))
         self.gemini_api_key = os.getenv('GEMINI_API_KEY')
         self.serp_api_key = os.getenv('SERP_API_KEY')
-        
-        if not self.gemini_api_key:
-            raise ValueError("GEMINI_API_KEY environment variable is required")
-        
-        genai.configure(api_key=self.gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
-        
+        fake = os.getenv('CHATBOT_FAKE', '0') == '1'
+
+        if model is None and fake:
+            model = FakeModel(delay=float(os.getenv('CHATBOT_FAKE_DELAY_MS', '0')) / 1000.0)
+        if model is None:
+            if not self.gemini_api_key:
+                raise ValueError("GEMINI_API_KEY environment variable is required")
+            import google.generativeai as genai
+            genai.configure(api_key=self.gemini_api_key)
+            model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model = model
+
+        if search is None:
+            if fake:
+                search = fake_search
+            elif self.serp_api_key:
+                search = serpapi_search(self.serp_api_key, http_session(workers),
+                                        float(os.getenv('SERP_TIMEOUT', '10')))
+        self.search = search
+        if search_budget is None:
+            search_budget = float(os.getenv('CHAT_SEARCH_BUDGET_MS', '1500')) / 1000.0
+        self.search_budget = search_budget
+        self.breaker = breaker or CircuitBreaker(int(os.getenv('SERP_BREAKER_FAILURES', '3')),
+                                                 float(os.getenv('SERP_BREAKER_RESET_S', '30')))
+        self.search_stats = {'ok': 0, 'failed': 0, 'skipped': 0, 'dropped': 0}
+        # bumped from request threads and the search pool
+        self._stats_lock = threading.Lock()
+        # bounded: searches past the budget keep a worker until their HTTP timeout
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='chat-search')
+
+        if chat_cache is None or search_cache is None:
+            path = os.getenv('CHAT_CACHE_DB', '.cache/chatbot.sqlite3')
+            disk = DiskCache(path) if path else None
+            size = int(os.getenv('CHAT_CACHE_SIZE', '2000'))
+            chat_cache = chat_cache or TieredCache('chat', float(os.getenv('CHAT_CACHE_TTL', '86400')), size, disk)
+            search_cache = search_cache or TieredCache('serp', float(os.getenv('SERP_CACHE_TTL', '21600')), size, disk)
+        self.chat_cache = chat_cache
+        self.search_cache = search_cache
+
     def search_web(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
         """Search the web using SERP API"""
-        if not self.serp_api_key:
+        if self.search is None:
+            return []
+
+        key = _cache_key(_normalize(query), str(num_results))
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return cached
+        if not self.breaker.allow():
+            self._count('skipped')
             return []
-            
         try:
-            url = "https://serpapi.com/search"
-            params = {
-                "engine": "google",
-                "q": query,
-                "api_key": self.serp_api_key,
-                "num": num_results
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
-            
-            results = []
-            if "organic_results" in data:
-                for result in data["organic_results"][:num_results]:
-                    results.append({
-                        "title": result.get("title", ""),
-                        "link": result.get("link", ""),
-                        "snippet": result.get("snippet", ""),
-                        "source": result.get("source", "")
-                    })
-                    
-            return results
+            results = self.search(query, num_results)
         except Exception as e:
+            # failures are not cached
+            self.breaker.record(False)
+            self._count('failed')
             print(f"Web search error: {e}")
             return []
+        self.breaker.record(True)
+        self._count('ok')
+        self.search_cache.set(key, results)
+        return results
+
+    def _count(self, outcome: str):
+        with self._stats_lock:
+            self.search_stats[outcome] += 1
+
+    def _start_search(self, message: str) -> Optional['Future[List[Dict[str, Any]]]']:
+        query = self._search_query(message)
+        if query is None or self.search is None:
+            return None
+        return self._pool.submit(self.search_web, query, 3)
+
+    def _await_search(self, future: Optional['Future[List[Dict[str, Any]]]'], deadline: float) -> List[Dict[str, Any]]:
+        if future is None:
+            return []
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0.0))
+        except FutureTimeout:
+            # answer without results; a search already running still fills the cache
+            future.cancel()
+            self._count('dropped')
+            return []
     
     def get_learning_platforms(self, topic: str) -> List[Dict[str, str]]:
         """Get recommended learning platforms for a specific topic"""
@@ -98,50 +293,129 @@ class GeminiChatbot:
             {"name": "Khan Academy", "url": "https://khanacademy.org", "description": "Free courses on many subjects"}
         ]
     
-    def chat(self, message: str, context: Optional[str] = None) -> Dict[str, Any]:
-        """Chat with Gemini, optionally including web search results"""
-        try:
-            # Check if this seems like a question that would benefit from web search
-            search_triggers = ["latest", "recent", "current", "news", "what's new", "2024", "2025", "how to", "best practices", "tutorial"]
-            should_search = any(trigger in message.lower() for trigger in search_triggers)
-            
-            web_results = []
-            if should_search:
-                # Extract key terms for search
-                search_query = message
-                if "how to" in message.lower():
-                    search_query += " tutorial guide"
-                elif "latest" in message.lower() or "recent" in message.lower():
-                    search_query += " 2024 2025"
-                
-                web_results = self.search_web(search_query, 3)
-            
-            # Build the prompt
-            prompt = f"User question: {message}\n\n"
-            
-            if context:
-                prompt += f"Context about user's learning interests: {context}\n\n"
-            
-            if web_results:
-                prompt += "Recent web search results:\n"
-                for i, result in enumerate(web_results, 1):
-                    prompt += f"{i}. {result['title']}\n   {result['snippet']}\n   Source: {result['link']}\n\n"
-            
-            prompt += """Please provide a helpful, accurate response. If you used web search results, mention that you found recent information. 
+    def platforms_for_message(self, message: str) -> Optional[List[Dict[str, str]]]:
+        """Learning platforms to attach to a chat answer, or None if the message isn't about learning."""
+        if any(topic in message.lower() for topic in ['learn', 'course', 'tutorial', 'study']):
+            # Extract potential topics from message
+            topics = []
+            for word in message.lower().split():
+                if word in ['python', 'javascript', 'data', 'machine', 'web', 'ai']:
+                    topics.append(word)
+
+            if topics:
+                return self.get_learning_platforms(' '.join(topics))
+        return None
+
+    @staticmethod
+    def _search_query(message: str) -> Optional[str]:
+        # Check if this seems like a question that would benefit from web search
+        search_triggers = ["latest", "recent", "current", "news", "what's new", "2024", "2025", "how to", "best practices", "tutorial"]
+        if not any(trigger in message.lower() for trigger in search_triggers):
+            return None
+
+        # Extract key terms for search
+        search_query = message
+        if "how to" in message.lower():
+            search_query += " tutorial guide"
+        elif "latest" in message.lower() or "recent" in message.lower():
+            search_query += " 2024 2025"
+        return search_query
+
+    def _prepare(self, message: str):
+        # search on the pool while platforms are looked up here; (web results, platforms)
+        deadline = time.monotonic() + self.search_budget
+        future = self._start_search(message)
+        platforms = self.platforms_for_message(message)
+        return self._await_search(future, deadline), platforms
+
+    @staticmethod
+    def _build_prompt(message: str, context: Optional[str], web_results: List[Dict[str, Any]]) -> str:
+        prompt = f"User question: {message}\n\n"
+
+        if context:
+            prompt += f"Context about user's learning interests: {context}\n\n"
+
+        if web_results:
+            prompt += "Recent web search results:\n"
+            for i, result in enumerate(web_results, 1):
+                prompt += f"{i}. {result['title']}\n   {result['snippet']}\n   Source: {result['link']}\n\n"
+
+        prompt += """Please provide a helpful, accurate response. If you used web search results, mention that you found recent information. 
             Focus on learning resources, tutorials, and educational content when relevant. 
             Be concise but informative."""
-            
-            response = self.model.generate_content(prompt)
-            
-            return {
-                "response": response.text,
-                "web_results": web_results,
-                "has_search": bool(web_results)
-            }
-            
+        return prompt
+
+    @staticmethod
+    def _error_text(e: Exception) -> str:
+        return f"I'm having trouble connecting right now. Please try again later. Error: {str(e)}"
+
+    def chat(self, message: str, context: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Chat with Gemini, optionally including web search results. Adds
+        ``learning_platforms`` when the message is about learning a topic.
+        """
+        key = _cache_key(_normalize(message), _normalize(context or ''))
+        cached = self.chat_cache.get(key)
+        if cached is not None:
+            # platforms are added below; keep the cached entry intact
+            result = dict(cached)
+            platforms = self.platforms_for_message(message)
+        else:
+            web_results, platforms = self._prepare(message)
+            try:
+                response = self.model.generate_content(self._build_prompt(message, context, web_results))
+
+                result = {
+                    "response": response.text,
+                    "web_results": web_results,
+                    "has_search": bool(web_results)
+                }
+                # error answers below are never cached
+                self.chat_cache.set(key, dict(result))
+
+            except Exception as e:
+                result = {
+                    "response": self._error_text(e),
+                    "web_results": [],
+                    "has_search": False
+                }
+        if platforms:
+            result["learning_platforms"] = platforms
+        return result
+
+    def chat_stream(self, message: str, context: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of ``chat``. Yields events: one ``meta`` (web results
+        and learning platforms), a ``token`` per generated chunk, then ``done``
+        with the full response, or ``error`` instead of ``done``. Completed
+        answers share chat()'s cache.
+        """
+        key = _cache_key(_normalize(message), _normalize(context or ''))
+        cached = self.chat_cache.get(key)
+        if cached is not None:
+            meta = {"type": "meta", "web_results": cached["web_results"], "has_search": cached["has_search"]}
+            platforms = self.platforms_for_message(message)
+            if platforms:
+                meta["learning_platforms"] = platforms
+            yield meta
+            yield {"type": "token", "text": cached["response"]}
+            yield {"type": "done", "response": cached["response"]}
+            return
+        try:
+            web_results, platforms = self._prepare(message)
+            meta = {"type": "meta", "web_results": web_results, "has_search": bool(web_results)}
+            if platforms:
+                meta["learning_platforms"] = platforms
+            yield meta
+            parts = []
+            for chunk in self.model.generate_content(self._build_prompt(message, context, web_results), stream=True):
+                text = chunk.text
+                if text:
+                    parts.append(text)
+                    yield {"type": "token", "text": text}
         except Exception as e:
-            return {
-                "response": f"I'm having trouble connecting right now. Please try again later. Error: {str(e)}",
-                "web_results": [],
-                "has_search": False
-            }
+            yield {"type": "error", "response": self._error_text(e)}
+            return
+        response = ''.join(parts)
+        self.chat_cache.set(key, {"response": response, "web_results": web_results, "has_search": bool(web_results)})
+        yield {"type": "done", "response": response}
@@ -1,9 +1,24 @@
-from flask import Blueprint, Flask, jsonify, request
+from flask import Blueprint, Flask, Response, g, jsonify, request
+import itertools
+import json
 from dotenv import load_dotenv
 import os
+import atexit
+import threading
+import time
 from datetime import datetime
 from .utils.db import get_client_and_db
-from .recommenders.hybrid import HybridRecommender
+from .recommenders.hybrid import from_env as rec_from_env
+from .recommenders.collaborative import CollaborativeRecommender
+from .recommenders.persistence import latest_snapshot, load_snapshot
+from .recommenders.platforms import PlatformCatalog, DEFAULT_PATH as PLATFORMS_PATH
+from .trainer import BackgroundTrainer, ModelSnapshot
+from .shared_model import SharedModelReader
+from .utils.event_log import EventLog
+from .utils.write_behind import WriteBehindQueue
+from .utils.cache import TTLCache
+from .utils import metrics
+from bson import ObjectId
 from flask import current_app, send_from_directory
 from .chatbot import GeminiChatbot
 
@@ -11,11 +26,55 @@ bp = Blueprint('main', __name__)
 
 load_dotenv()
 
-_REC = None
-_ITEMS_CACHE = []
-_EVENTS_CACHE = []
-_USERS_CACHE = {}
+_TRAINER = None
+_TRAINER_LOCK = threading.Lock()
+_WRITES_LOCK = threading.Lock()
+# columnar events synced from Mongo by watermark; only touched by the trainer
+_EVENT_LOG = EventLog(CollaborativeRecommender._event_weight)
+_WRITES = None
 _CHATBOT = None
+_PLATFORMS = None
+# set by the multi-process supervisor (app.serving): published snapshots go to shared memory
+_PUBLISHER = None
+# set in app.serving workers: serializes appends to the shared delta log
+_DELTA_LOCK = None
+# ranked ids (pre-bandit) keyed on (user_id, limit, model version, user generation)
+_REC_CACHE = TTLCache(maxsize=int(os.getenv('REC_CACHE_SIZE', '10000')),
+                      ttl=float(os.getenv('REC_CACHE_TTL', '60')))
+# set to a fresh value when a user's events or profile change, orphaning their cached
+# rankings; values never repeat, so the map can be reset whenever the cache is
+_USER_GEN = {}
+_GEN_COUNTER = itertools.count(1)
+
+
+def _get_writes():
+    global _WRITES
+    if _WRITES is None:
+        # not _TRAINER_LOCK: builds flush the queue while the trainer is being created
+        with _WRITES_LOCK:
+            if _WRITES is None:
+                writes = WriteBehindQueue(
+                    lambda: get_client_and_db()[1],
+                    max_batch=int(os.getenv('WRITE_BEHIND_BATCH', '500')),
+                    flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_MS', '50')) / 1000.0,
+                    max_pending=int(os.getenv('WRITE_BEHIND_MAX_PENDING', '10000')),
+                    enabled=os.getenv('WRITE_BEHIND', '1') == '1',
+                    max_retries=int(os.getenv('WRITE_BEHIND_RETRIES', '5')),
+                    retry_backoff=float(os.getenv('WRITE_BEHIND_RETRY_BACKOFF_MS', '500')) / 1000.0,
+                    spill_path=os.getenv('WRITE_BEHIND_SPILL', ''),
+                )
+                # flush buffered writes on interpreter shutdown
+                atexit.register(writes.close)
+                _WRITES = writes
+    return _WRITES
+
+
+def _get_platforms():
+    global _PLATFORMS
+    if _PLATFORMS is None:
+        # read once; the catalog and its JSON fragments are immutable afterwards
+        _PLATFORMS = PlatformCatalog.load(os.getenv('PLATFORM_CATALOG') or PLATFORMS_PATH)
+    return _PLATFORMS
 
 
 def _get_chatbot():
@@ -29,32 +88,217 @@ def _get_chatbot():
     return _CHATBOT
 
 
-def _get_rec():
-    global _REC
-    if _REC is None:
-        epsilon = float(os.getenv('REC_EPSILON', '0.1'))
-        _REC = HybridRecommender(epsilon=epsilon)
-        _refresh_model()
-    return _REC
+def _new_rec():
+    return rec_from_env()
 
 
-def _refresh_model():
-    global _ITEMS_CACHE, _EVENTS_CACHE, _USERS_CACHE
+def _build_snapshot(version):
+    # runs on the trainer thread; readers keep using the published snapshot meanwhile
+    timer = metrics.stages('refit')
+    # events acknowledged before this build must be in Mongo for the sync below;
+    # ones still failing are replayed by the trainer until a build loads them
+    _get_writes().flush()
+    timer.mark('flush_writes')
+    client, db = get_client_and_db()
+    items = list(db.items.find({}, {'_id': 1, 'title': 1, 'description': 1, 'tags': 1, 'type': 1}))
+    timer.mark('load_items')
+    # streams only events newer than the log's watermark
+    _EVENT_LOG.sync(db.events, batch_size=int(os.getenv('REC_LOAD_BATCH_SIZE', '5000')))
+    timer.mark('sync_events')
+    users = {u['_id']: u for u in db.users.find({}, {'_id': 1, 'interests': 1, 'goals': 1})}
+    timer.mark('load_users')
+    rec = _new_rec()
+    rec.fit_log(items, _EVENT_LOG)
+    timer.mark('fit')
+    return ModelSnapshot(rec, items, _EVENT_LOG, users, version, time.time())
+
+
+def _load_disk_snapshot():
+    # memory-mapped snapshot written by scripts/build_snapshot.py, if configured
+    snapshot_dir = os.getenv('REC_SNAPSHOT_DIR', '')
+    path = latest_snapshot(snapshot_dir) if snapshot_dir else None
+    if not path:
+        return None
+    try:
+        rec, users, info = load_snapshot(path, rec=_new_rec())
+    except Exception as e:
+        print(f"Snapshot load error ({path}): {e}")
+        return None
+    return ModelSnapshot(rec, rec.items, None, users, 0, info['created_at'])
+
+
+def _load_bandits(rec):
+    # rehydrate bandit state persisted by /feedback; it carries over across refits
     try:
         client, db = get_client_and_db()
-        _ITEMS_CACHE = list(db.items.find({}, {'_id': 1, 'title': 1, 'description': 1, 'tags': 1, 'type': 1}))
-        _EVENTS_CACHE = list(db.events.find({}, {'_id': 0}))
-        _USERS_CACHE = {u['_id']: u for u in db.users.find({}, {'_id': 1, 'interests': 1, 'goals': 1})}
-        if _REC:
-            _REC.fit(_ITEMS_CACHE, _EVENTS_CACHE)
-    except Exception:
-        # Keep caches as-is if DB isn't available; service endpoints like /health still work
-        pass
+        cursor = db.rl_state.find({}, {'_id': 0, 'user_id': 1, 'arm': 1, 'count': 1, 'total_reward': 1})
+        rec.bandits.load(cursor.batch_size(int(os.getenv('REC_LOAD_BATCH_SIZE', '5000'))))
+        return True
+    except Exception as e:
+        print(f"Bandit state load error: {e}")
+        return False
+
+
+def _get_trainer():
+    global _TRAINER
+    if _TRAINER is None:
+        with _TRAINER_LOCK:
+            if _TRAINER is None:
+                interval = float(os.getenv('REC_RETRAIN_INTERVAL', '600'))
+                shared = os.getenv('REC_SHARED_MODEL', '')
+                loaded = _load_disk_snapshot() if not shared else None
+                if shared:
+                    # worker under app.serving: the supervisor fits and publishes the model
+                    trainer = SharedModelReader(shared, _new_rec, on_publish=_on_publish,
+                                                poll_interval=float(os.getenv('REC_SHARED_POLL_S', '1')),
+                                                lock=_DELTA_LOCK, on_delta=_invalidate_user_recs)
+                    # bandit state comes with the first generation
+                    trainer.refresh()
+                elif loaded is not None:
+                    _load_bandits(loaded.rec)
+                    trainer = BackgroundTrainer(_build_snapshot, loaded, interval=interval,
+                                                on_publish=_on_publish)
+                    # catch up on writes made after the snapshot at the next scheduled refit
+                    trainer.mark_dirty()
+                else:
+                    empty = ModelSnapshot(_new_rec(), [], None, {}, 0, time.time())
+                    # before the first build, which carries bandit state over (and publishes it under app.serving)
+                    _load_bandits(empty.rec)
+                    trainer = BackgroundTrainer(_build_snapshot, empty, interval=interval,
+                                                on_publish=_on_publish)
+                    # first build is synchronous; if the DB isn't available the empty
+                    # snapshot stays published and service endpoints like /health still work
+                    trainer.refit_now()
+                trainer.start()
+                _TRAINER = trainer
+    return _TRAINER
+
+
+def _on_publish(snap):
+    # cached rankings belong to the previous model; their generations can go with them
+    _USER_GEN.clear()
+    _REC_CACHE.clear()
+    if _PUBLISHER is not None:
+        _PUBLISHER.publish(snap)
+
+
+def _invalidate_user_recs(user_id):
+    _USER_GEN[user_id] = next(_GEN_COUNTER)
+
+
+def _snapshot():
+    return _get_trainer().current
+
+
+def _get_rec():
+    return _snapshot().rec
+
+
+_EVENT_FIELDS = ('_id', 'user_id', 'item_id', 'type', 'score')
+
+
+def _apply_event(event):
+    """Fold a freshly written event into the in-memory model instead of refitting."""
+    _invalidate_user_recs(event['user_id'])
+    if _TRAINER is None:
+        # model not loaded yet; the first build flushes the write-behind queue and reads it from Mongo
+        return
+    # only the fields the model reads: under app.serving the write is passed to the other workers
+    _TRAINER.apply_delta({'kind': 'event', 'event': {k: event[k] for k in _EVENT_FIELDS if k in event}})
+    # again once applied: a ranking computed meanwhile on the old state was cached under the first value
+    _invalidate_user_recs(event['user_id'])
+
+
+def _apply_user(data):
+    _invalidate_user_recs(data['_id'])
+    if _TRAINER is None:
+        return
+    _TRAINER.apply_delta({'kind': 'user', 'user': {k: data[k] for k in ('_id', 'interests', 'goals') if k in data}})
+    _invalidate_user_recs(data['_id'])
+
+
+def _collect_app_metrics():
+    # values owned by the cache, write-behind queue and trainer, read at scrape time
+    yield 'rec_cache_hits_total', 'counter', 'Ranking cache hits.', [({}, _REC_CACHE.hits)]
+    yield 'rec_cache_misses_total', 'counter', 'Ranking cache misses.', [({}, _REC_CACHE.misses)]
+    yield 'rec_cache_entries', 'gauge', 'Rankings currently cached.', [({}, len(_REC_CACHE))]
+    if _WRITES is not None:
+        stats = dict(_WRITES.stats)
+        yield 'write_behind_queue_depth', 'gauge', 'Buffered writes not yet flushed.', [({}, stats['queue_depth'])]
+        yield 'write_behind_retry_depth', 'gauge', 'Failed writes waiting for a retry.', [({}, stats['retry_depth'])]
+        yield ('write_behind_ops_total', 'counter', 'Buffered write operations by outcome.',
+               [({'result': 'flushed'}, stats['flushed_ops']), ({'result': 'failed'}, stats['failed_ops']),
+                ({'result': 'retried'}, stats['retried_ops']), ({'result': 'spilled'}, stats['spilled_ops'])])
+    if _CHATBOT is not None:
+        samples = []
+        for cache in (_CHATBOT.chat_cache, _CHATBOT.search_cache):
+            stats = dict(cache.stats)
+            samples += [({'cache': cache.namespace, 'result': 'memory_hit'}, stats['memory_hits']),
+                        ({'cache': cache.namespace, 'result': 'disk_hit'}, stats['disk_hits']),
+                        ({'cache': cache.namespace, 'result': 'miss'}, stats['misses'])]
+        yield 'chatbot_cache_requests_total', 'counter', 'Chat answer and web search cache lookups.', samples
+        stats = dict(_CHATBOT.search_stats)
+        yield ('chatbot_search_total', 'counter', 'Web searches by outcome (skipped = breaker open, '
+               'dropped = over the latency budget).', [({'result': k}, v) for k, v in sorted(stats.items())])
+        yield 'chatbot_search_breaker_open', 'gauge', 'Whether web search is currently bypassed.', \
+            [({}, int(_CHATBOT.breaker.is_open))]
+    if _TRAINER is not None:
+        snap = _TRAINER.current
+        yield 'rec_model_version', 'gauge', 'Version of the published model snapshot.', [({}, snap.version)]
+        yield 'rec_model_age_seconds', 'gauge', 'Seconds since the published model was built.', \
+            [({}, round(time.time() - snap.built_at, 3))]
+
+
+if metrics.ENABLED:
+    metrics.REGISTRY.register_collector(_collect_app_metrics)
+
+    @bp.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+
+    @bp.after_request
+    def _record_request(response):
+        endpoint = _endpoint_label()
+        # streamed bodies are timed by _timed_stream once the last chunk is sent
+        if not response.is_streamed:
+            metrics.HTTP_SECONDS.observe(time.perf_counter() - g.request_start, endpoint, request.method)
+        metrics.HTTP_REQUESTS.inc(endpoint, request.method, str(response.status_code))
+        return response
+
+
+def _endpoint_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _timed_stream(chunks):
+    """Wrap a streamed body so the request histogram covers the whole stream, not just the headers."""
+    if not metrics.ENABLED:
+        return chunks
+    # the request context is gone by the time the body is iterated
+    endpoint, method, start = _endpoint_label(), request.method, g.request_start
+
+    def generate():
+        try:
+            yield from chunks
+        finally:
+            metrics.HTTP_SECONDS.observe(time.perf_counter() - start, endpoint, method)
+
+    return generate()
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not metrics.ENABLED:
+        return jsonify({'error': 'metrics disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @bp.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'ok'})
+    body = {'status': 'ok'}
+    if _WRITES is not None:
+        body['write_behind'] = dict(_WRITES.stats)
+    return jsonify(body)
 
 
 @bp.route('/', methods=['GET'])
@@ -76,19 +320,20 @@ def create_user():
     if '_id' not in data:
         return jsonify({'error': 'missing _id'}), 400
     db.users.update_one({'_id': data['_id']}, {'$set': data}, upsert=True)
-    _refresh_model()
+    _apply_user(data)
     return jsonify({'ok': True})
 
 
 @bp.route('/events', methods=['POST'])
 def ingest_event():
-    client, db = get_client_and_db()
     data = request.get_json(force=True)
     required = ['user_id', 'item_id', 'type']
     if any(r not in data for r in required):
         return jsonify({'error': 'missing required fields'}), 400
-    db.events.insert_one({**data})
-    _refresh_model()
+    # assign _id up front: the insert is deferred but the model applies the event now
+    event = {**data, '_id': ObjectId()}
+    _get_writes().insert('events', event)
+    _apply_event(event)
     return jsonify({'ok': True})
 
 
@@ -98,17 +343,86 @@ def recommend():
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     limit = int(request.args.get('limit', '10'))
-    _get_rec()
-    user = _USERS_CACHE.get(user_id)
+    snap = _snapshot()
+    user = snap.users.get(user_id)
     if not user:
         return jsonify({'error': 'unknown user'}), 404
-    rec_ids = _REC.recommend(user, _ITEMS_CACHE, _EVENTS_CACHE, limit=limit)
+    key = (user_id, limit, snap.version, _USER_GEN.get(user_id, 0))
+    ranked = _REC_CACHE.get(key)
+    if ranked is None:
+        ranked = tuple(snap.rec.rank(user, limit=limit))
+        _REC_CACHE.set(key, ranked)
+    # exploration slot is re-drawn per request from the cached ranking
+    rec_ids = snap.rec.rerank(user_id, ranked, limit=limit)
     # attach item payloads
-    item_map = {it['_id']: it for it in _ITEMS_CACHE}
-    recs = [item_map[rid] for rid in rec_ids if rid in item_map]
+    recs = snap.rec.get_items(rec_ids)
     return jsonify({'user_id': user_id, 'recommendations': recs})
 
 
+def _positive_int(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return None
+    if n < 1 or (isinstance(value, float) and n != value):
+        return None
+    return n
+
+
+@bp.route('/recommendations/batch', methods=['POST'])
+def recommend_batch():
+    """Recommendations for many users, streamed as NDJSON (one user per line)."""
+    data = request.get_json(force=True)
+    user_ids = data.get('user_ids') or []
+    if not isinstance(user_ids, list) or not user_ids:
+        return jsonify({'error': 'user_ids required'}), 400
+    if not all(isinstance(uid, str) for uid in user_ids):
+        return jsonify({'error': 'user_ids must be strings'}), 400
+    # validated before the 200 starts streaming; errors inside the generator would truncate it
+    limit = _positive_int(data.get('limit', 10))
+    block_size = _positive_int(data.get('block_size', os.getenv('REC_BATCH_BLOCK_SIZE', '128')))
+    if limit is None or block_size is None:
+        return jsonify({'error': 'limit and block_size must be positive integers'}), 400
+    include_items = bool(data.get('include_items', False))
+    # one snapshot for the whole stream, even if a new model is published meanwhile
+    snap = _snapshot()
+
+    def generate():
+        known = []
+        for uid in user_ids:
+            user = snap.users.get(uid)
+            if user is None:
+                yield json.dumps({'user_id': uid, 'error': 'unknown user'}) + '\n'
+            else:
+                known.append(user)
+        for start in range(0, len(known), block_size):
+            lines = []
+            for uid, rec_ids in snap.rec.recommend_many(known[start:start + block_size], limit=limit,
+                                                        block_size=block_size):
+                row = {'user_id': uid, 'recommendations': rec_ids}
+                if include_items:
+                    row['items'] = snap.rec.get_items(rec_ids)
+                lines.append(json.dumps(row, default=str))
+            # one chunk per scored block
+            yield '\n'.join(lines) + '\n'
+
+    return Response(_timed_stream(generate()), mimetype='application/x-ndjson')
+
+
+@bp.route('/items/<item_id>/similar', methods=['GET'])
+def similar_items(item_id):
+    limit = _positive_int(request.args.get('limit', '10'))
+    if limit is None:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    rec = _get_rec()
+    if item_id not in rec.item_pos:
+        return jsonify({'error': 'unknown item'}), 404
+    similar = rec.get_items(rec.cbf.similar_items(item_id, top_k=limit))
+    return jsonify({'item_id': item_id, 'similar': similar})
+
+
 @bp.route('/recommend', methods=['POST'])
 def recommend_post():
     """New quiz-based recommendation endpoint"""
@@ -119,8 +433,14 @@ def recommend_post():
         current_tab = data.get('current_tab', 'all')
         
         # Generate mock recommendations based on interests and skill level
-        platforms = generate_mock_platforms(interests, level)
-        
+        catalog = _get_platforms()
+        selected = catalog.select(interests, level)
+        provider = current_app.json
+        if (not current_app.debug and getattr(provider, 'compact', None) is not False
+                and getattr(provider, 'sort_keys', False) and getattr(provider, 'ensure_ascii', False)):
+            # default compact JSON: splice the pre-serialized platform fragments
+            return Response(catalog.recommend_json(interests, level, selected), mimetype='application/json')
+        platforms = [catalog.platforms[i] for i in selected]
         return jsonify({
             'platforms': platforms,
             'total': len(platforms),
@@ -135,340 +455,9 @@ def recommend_post():
 
 def generate_mock_platforms(interests, level):
     """Generate mock learning platforms based on interests and skill level"""
-    
-    # Base platform templates
-    platform_templates = {
-        'python': [
-            {
-                'name': 'Python Complete Course',
-                'category': 'Programming',
-                'description': 'Master Python from basics to advanced concepts',
-                'image': 'https://via.placeholder.com/100x100/3776ab/white?text=PY',
-                'rating': 4.8,
-                'url': 'https://python.org',
-                'interests': ['python'],
-                'level': 'Beginner'
-            },
-            {
-                'name': 'Advanced Python Programming',
-                'category': 'Programming',
-                'description': 'Deep dive into Python decorators, metaclasses, and async programming',
-                'image': 'https://via.placeholder.com/100x100/3776ab/white?text=PY+',
-                'rating': 4.9,
-                'url': 'https://python.org',
-                'interests': ['python'],
-                'level': 'Advanced'
-            }
-        ],
-        'javascript': [
-            {
-                'name': 'JavaScript Fundamentals',
-                'category': 'Web Development',
-                'description': 'Learn modern JavaScript ES6+ features and DOM manipulation',
-                'image': 'https://via.placeholder.com/100x100/f7df1e/black?text=JS',
-                'rating': 4.7,
-                'url': 'https://developer.mozilla.org',
-                'interests': ['javascript'],
-                'level': 'Beginner'
-            },
-            {
-                'name': 'Advanced JavaScript & Node.js',
-                'category': 'Web Development',
-                'description': 'Master async/await, closures, and server-side JavaScript',
-                'image': 'https://via.placeholder.com/100x100/339933/white?text=NODE',
-                'rating': 4.8,
-                'url': 'https://nodejs.org',
-                'interests': ['javascript', 'nodejs'],
-                'level': 'Advanced'
-            }
-        ],
-        'data-science': [
-            {
-                'name': 'Data Science with Python',
-                'category': 'Data Science',
-                'description': 'Learn pandas, numpy, and data visualization techniques',
-                'image': 'https://via.placeholder.com/100x100/ff6b6b/white?text=DS',
-                'rating': 4.6,
-                'url': 'https://kaggle.com',
-                'interests': ['data-science', 'python'],
-                'level': 'Beginner'
-            },
-            {
-                'name': 'Advanced Data Analytics',
-                'category': 'Data Science',
-                'description': 'Statistical modeling, hypothesis testing, and advanced analytics',
-                'image': 'https://via.placeholder.com/100x100/4ecdc4/white?text=ADA',
-                'rating': 4.9,
-                'url': 'https://kaggle.com',
-                'interests': ['data-science', 'statistics'],
-                'level': 'Advanced'
-            }
-        ],
-        'machine-learning': [
-            {
-                'name': 'Machine Learning Basics',
-                'category': 'AI/ML',
-                'description': 'Introduction to supervised and unsupervised learning',
-                'image': 'https://via.placeholder.com/100x100/9b59b6/white?text=ML',
-                'rating': 4.7,
-                'url': 'https://scikit-learn.org',
-                'interests': ['machine-learning'],
-                'level': 'Beginner'
-            },
-            {
-                'name': 'Deep Learning & Neural Networks',
-                'category': 'AI/ML',
-                'description': 'Advanced ML with TensorFlow and PyTorch',
-                'image': 'https://via.placeholder.com/100x100/e74c3c/white?text=DL',
-                'rating': 4.9,
-                'url': 'https://tensorflow.org',
-                'interests': ['machine-learning', 'deep-learning'],
-                'level': 'Advanced'
-            }
-        ],
-        'web-development': [
-            {
-                'name': 'Complete Web Development',
-                'category': 'Web Development',
-                'description': 'HTML, CSS, JavaScript, and responsive design',
-                'image': 'https://via.placeholder.com/100x100/2ecc71/white?text=WEB',
-                'rating': 4.5,
-                'url': 'https://developer.mozilla.org',
-                'interests': ['web-development'],
-                'level': 'Beginner'
-            },
-            {
-                'name': 'Full Stack Development',
-                'category': 'Web Development', 
-                'description': 'React, Node.js, databases, and deployment',
-                'image': 'https://via.placeholder.com/100x100/3498db/white?text=FULL',
-                'rating': 4.8,
-                'url': 'https://reactjs.org',
-                'interests': ['web-development', 'react', 'nodejs'],
-                'level': 'Advanced'
-            }
-        ],
-        # Nepali Local Organizations and Platforms
-        'nepali-tech': [
-            {
-                'name': 'Deerwalk Institute of Technology',
-                'category': 'Higher Education',
-                'description': 'Leading IT education with industry partnerships in Nepal',
-                'image': 'https://via.placeholder.com/100x100/dc143c/white?text=DIT',
-                'rating': 4.7,
-                'url': 'https://deerwalk.edu.np',
-                'interests': ['programming', 'web-development', 'data-science'],
-                'level': 'Intermediate',
-                'location': 'Nepal'
-            },
-            {
-                'name': 'Kathmandu University (KU)',
-                'category': 'University',
-                'description': 'Computer Science and Engineering programs',
-                'image': 'https://via.placeholder.com/100x100/8b0000/white?text=KU',
-                'rating': 4.6,
-                'url': 'https://ku.edu.np',
-                'interests': ['programming', 'machine-learning', 'web-development'],
-                'level': 'Advanced',
-                'location': 'Nepal'
-            },
-            {
-                'name': 'Pulchowk Campus (IOE)',
-                'category': 'Engineering College',
-                'description': 'Premier engineering education in Nepal',
-                'image': 'https://via.placeholder.com/100x100/000080/white?text=IOE',
-                'rating': 4.8,
-                'url': 'https://pcampus.edu.np',
-                'interests': ['programming', 'machine-learning', 'data-science'],
-                'level': 'Advanced',
-                'location': 'Nepal'
-            },
-            {
-                'name': 'NIST College',
-                'category': 'IT College',
-                'description': 'Nepal Institute of Science and Technology',
-                'image': 'https://via.placeholder.com/100x100/4169e1/white?text=NIST',
-                'rating': 4.5,
-                'url': 'https://nist.edu.np',
-                'interests': ['programming', 'web-development', 'cybersecurity'],
-                'level': 'Intermediate',
-                'location': 'Nepal'
-            }
-        ],
-        'nepali-training': [
-            {
-                'name': 'Leapfrog Technology',
-                'category': 'IT Training',
-                'description': 'Professional software development training and internships',
-                'image': 'https://via.placeholder.com/100x100/00a86b/white?text=LFT',
-                'rating': 4.9,
-                'url': 'https://leapfrogacademy.com',
-                'interests': ['web-development', 'mobile-development', 'programming'],
-                'level': 'Intermediate',
-                'location': 'Nepal'
-            },
-            {
-                'name': 'Broadway Infosys',
-                'category': 'IT Training Center',
-                'description': 'Comprehensive IT training and certification programs',
-                'image': 'https://via.placeholder.com/100x100/ff6b35/white?text=BI',
-                'rating': 4.4,
-                'url': 'https://broadwayinfosys.com',
-                'interests': ['programming', 'web-development', 'data-science'],
-                'level': 'Beginner',
-                'location': 'Nepal'
-            },
-            {
-                'name': 'Skill Development Nepal',
-                'category': 'Training Institute',
-                'description': 'Professional skills training for IT and digital marketing',
-                'image': 'https://via.placeholder.com/100x100/9c88ff/white?text=SDN',
-                'rating': 4.3,
-                'url': 'https://skilldevelopmentnepal.com',
-                'interests': ['web-development', 'digital-marketing', 'programming'],
-                'level': 'Beginner',
-                'location': 'Nepal'
-            },
-            {
-                'name': 'F1Soft Academy',
-                'category': 'Tech Training',
-                'description': 'Banking software and fintech training programs',
-                'image': 'https://via.placeholder.com/100x100/1e90ff/white?text=F1',
-                'rating': 4.6,
-                'url': 'https://f1soft.com',
-                'interests': ['programming', 'web-development', 'fintech'],
-                'level': 'Intermediate',
-                'location': 'Nepal'
-            }
-        ],
-        'nepali-online': [
-            {
-                'name': 'Hamro Patro Tech',
-                'category': 'Online Learning',
-                'description': 'Local tech tutorials and programming courses in Nepali',
-                'image': 'https://via.placeholder.com/100x100/ff4757/white?text=HP',
-                'rating': 4.2,
-                'url': 'https://hamropatro.com',
-                'interests': ['programming', 'web-development', 'mobile-development'],
-                'level': 'Beginner',
-                'location': 'Nepal'
-            },
-            {
-                'name': 'CodeKatha Nepal',
-                'category': 'Programming Community',
-                'description': 'Learn programming through storytelling in Nepali context',
-                'image': 'https://via.placeholder.com/100x100/2ed573/white?text=CK',
-                'rating': 4.1,
-                'url': 'https://codekatha.com',
-                'interests': ['programming', 'web-development', 'algorithms'],
-                'level': 'Beginner',
-                'location': 'Nepal'
-            },
-            {
-                'name': 'Tech Pana Nepal',
-                'category': 'Tech News & Learning',
-                'description': 'Latest tech trends and learning resources for Nepali developers',
-                'image': 'https://via.placeholder.com/100x100/ffa502/white?text=TPN',
-                'rating': 4.0,
-                'url': 'https://techpana.com',
-                'interests': ['programming', 'web-development', 'tech-news'],
-                'level': 'Beginner',
-                'location': 'Nepal'
-            }
-        ],
-        'nepali-government': [
-            {
-                'name': 'Digital Nepal Framework',
-                'category': 'Government Initiative',
-                'description': 'Government digital literacy and IT skills programs',
-                'image': 'https://via.placeholder.com/100x100/ff3838/white?text=DN',
-                'rating': 4.0,
-                'url': 'https://digitalnepal.gov.np',
-                'interests': ['digital-literacy', 'cybersecurity', 'e-governance'],
-                'level': 'Beginner',
-                'location': 'Nepal'
-            },
-            {
-                'name': 'NRNA Knowledge Society',
-                'category': 'Professional Network',
-                'description': 'Non-Resident Nepali tech professionals knowledge sharing',
-                'image': 'https://via.placeholder.com/100x100/00d2d3/white?text=NRNA',
-                'rating': 4.3,
-                'url': 'https://nrna.org',
-                'interests': ['programming', 'entrepreneurship', 'networking'],
-                'level': 'Advanced',
-                'location': 'Global Nepali'
-            }
-        ]
-    }
-    
-    # Generate platforms based on selected interests and skill level
-    selected_platforms = []
-    
-    # Always include some relevant Nepali platforms for local context
-    nepali_categories = ['nepali-tech', 'nepali-training', 'nepali-online', 'nepali-government']
-    
-    for interest in interests:
-        # Add international platforms
-        if interest in platform_templates:
-            for platform in platform_templates[interest]:
-                # Filter by skill level appropriately
-                if level == 'Beginner':
-                    # Show all levels for beginners, but prioritize beginner courses
-                    selected_platforms.append(platform)
-                elif level == 'Intermediate':
-                    # Show beginner and intermediate, avoid basic beginner courses
-                    if platform['level'] in ['Beginner', 'Intermediate', 'Advanced']:
-                        selected_platforms.append(platform)
-                elif level == 'Advanced':
-                    # Prioritize intermediate and advanced courses
-                    if platform['level'] in ['Intermediate', 'Advanced']:
-                        selected_platforms.append(platform)
-    
-    # Add relevant Nepali platforms based on interests
-    for nepali_category in nepali_categories:
-        if nepali_category in platform_templates:
-            for platform in platform_templates[nepali_category]:
-                # Check if this Nepali platform matches user interests
-                platform_interests = platform.get('interests', [])
-                if any(interest in platform_interests for interest in interests):
-                    # Apply same skill level filtering
-                    if level == 'Beginner':
-                        selected_platforms.append(platform)
-                    elif level == 'Intermediate':
-                        if platform['level'] in ['Beginner', 'Intermediate', 'Advanced']:
-                            selected_platforms.append(platform)
-                    elif level == 'Advanced':
-                        if platform['level'] in ['Intermediate', 'Advanced']:
-                            selected_platforms.append(platform)
-    
-    # If no specific interests, show some popular Nepali tech platforms
-    if not interests or len(selected_platforms) < 3:
-        popular_nepali = [
-            platform_templates['nepali-tech'][0],  # Deerwalk
-            platform_templates['nepali-training'][0],  # Leapfrog
-            platform_templates['nepali-online'][0]  # Hamro Patro Tech
-        ]
-        for platform in popular_nepali:
-            if platform not in selected_platforms:
-                selected_platforms.append(platform)
-    
-    # Add some general courses if no specific interests selected
-    if not selected_platforms:
-        selected_platforms = [
-            {
-                'name': 'Choose Your Learning Path',
-                'category': 'General',
-                'description': 'Select your interests above to get personalized recommendations',
-                'image': 'https://via.placeholder.com/100x100/95a5a6/white?text=?',
-                'rating': 0,
-                'url': '#',
-                'interests': [],
-                'level': 'Beginner'
-            }
-        ]
-    
-    return selected_platforms[:12]  # Return max 12 platforms
+    catalog = _get_platforms()
+    # shared catalog dicts: treat as read-only
+    return [catalog.platforms[i] for i in catalog.select(interests, level)]
 
 
 @bp.route('/feedback', methods=['POST'])
@@ -477,26 +466,24 @@ def feedback():
     required = ['user_id', 'item_id', 'reward']
     if any(r not in data for r in required):
         return jsonify({'error': 'missing required fields'}), 400
-    _get_rec().feedback(data['user_id'], data['item_id'], float(data['reward']))
+    _get_trainer().apply_delta({'kind': 'feedback', 'user_id': data['user_id'], 'item_id': data['item_id'],
+                                'reward': float(data['reward'])})
     # persist bandit state per-user (optional): We'll store in collection rl_state
-    client, db = get_client_and_db()
-    # naive: overwrite with latest in-memory state
-    # For simplicity, store only the updated arm
-    db.rl_state.update_one(
+    # For simplicity, store only the updated arm; repeated feedback coalesces in the write-behind queue
+    _get_writes().upsert(
+        'rl_state',
         {'user_id': data['user_id'], 'arm': data['item_id']},
-        {
-            '$inc': {'count': 1, 'total_reward': float(data['reward'])},
-            '$set': {'last_reward': float(data['reward'])}
-        },
-        upsert=True,
+        inc={'count': 1, 'total_reward': float(data['reward'])},
+        set_fields={'last_reward': float(data['reward'])},
     )
     return jsonify({'ok': True})
 
 
 @bp.route('/train', methods=['POST'])
 def train():
-    _refresh_model()
-    return jsonify({'ok': True})
+    # refit runs on the trainer thread; the new model is published when ready
+    _get_trainer().request_refit()
+    return jsonify({'ok': True, 'queued': True}), 202
 
 
 @bp.route('/chat', methods=['POST'])
@@ -512,28 +499,44 @@ def chat():
     if not message:
         return jsonify({'error': 'Message is required'}), 400
     
+    # web search and learning platform lookup run concurrently inside chat()
+    response_data = chatbot.chat(message, _chat_context(user_id))
+    
+    return jsonify(response_data)
+
+
+def _chat_context(user_id):
     # Get user context for personalized responses
     context = None
-    if user_id and user_id in _USERS_CACHE:
-        user = _USERS_CACHE[user_id]
+    users = _TRAINER.current.users if _TRAINER is not None else {}
+    if user_id and user_id in users:
+        user = users[user_id]
         if 'interests' in user:
             context = f"User is interested in: {', '.join(user['interests'])}"
-    
-    response_data = chatbot.chat(message, context)
-    
-    # Add learning platform recommendations if relevant
-    if any(topic in message.lower() for topic in ['learn', 'course', 'tutorial', 'study']):
-        # Extract potential topics from message
-        topics = []
-        for word in message.lower().split():
-            if word in ['python', 'javascript', 'data', 'machine', 'web', 'ai']:
-                topics.append(word)
-        
-        if topics:
-            platforms = chatbot.get_learning_platforms(' '.join(topics))
-            response_data['learning_platforms'] = platforms
-    
-    return jsonify(response_data)
+    return context
+
+
+@bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Same as /chat, streamed as Server-Sent Events: meta, token..., then done (or error)."""
+    chatbot = _get_chatbot()
+    if not chatbot:
+        return jsonify({'error': 'Chatbot not available. Please check API keys.'}), 500
+
+    data = request.get_json(force=True)
+    message = data.get('message', '')
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+    context = _chat_context(data.get('user_id', ''))
+
+    def generate():
+        for event in chatbot.chat_stream(message, context):
+            kind = event.pop('type')
+            yield f"event: {kind}\ndata: {json.dumps(event)}\n\n"
+
+    # no proxy buffering, so each token reaches the browser as it is generated
+    return Response(_timed_stream(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @bp.route('/learning-platforms/<topic>', methods=['GET'])
@@ -551,8 +554,11 @@ def user_history(user_id):
     client, db = get_client_and_db()
     
     if request.method == 'GET':
-        # Get user history
+        # Get user history, including updates still in the write-behind queue
+        pending = _get_writes().pending('user_history', {'user_id': user_id})
         history = db.user_history.find_one({'user_id': user_id})
+        if pending:
+            history = {**(history or {}), **pending}
         if not history:
             # Create default history
             history = {
@@ -577,6 +583,8 @@ def user_history(user_id):
             **{k: v for k, v in data.items() if k != 'user_id'}
         }
         
+        # apply queued course-action updates first so this write lands after them
+        _get_writes().flush()
         result = db.user_history.update_one(
             {'user_id': user_id},
             {'$set': update_data},
@@ -600,16 +608,22 @@ def course_action():
     
     # Record the action in events
     event_data = {
+        '_id': ObjectId(),
         'user_id': user_id,
         'item_id': course_id,
         'type': action,
         'score': 1.0 if action in ['start', 'complete'] else 0.5,
         'ts': datetime.utcnow().isoformat()
     }
-    db.events.insert_one(event_data)
+    writes = _get_writes()
+    writes.insert('events', event_data)
     
-    # Update user history
-    history = db.user_history.find_one({'user_id': user_id}) or {
+    # Update user history (queued updates not yet flushed take precedence)
+    pending = writes.pending('user_history', {'user_id': user_id})
+    history = db.user_history.find_one({'user_id': user_id})
+    if pending:
+        history = {**(history or {}), **pending}
+    history = history or {
         'user_id': user_id,
         'completed_courses': [],
         'in_progress_courses': [],
@@ -652,14 +666,10 @@ def course_action():
     
     history['updated_at'] = datetime.utcnow()
     
-    db.user_history.update_one(
-        {'user_id': user_id},
-        {'$set': history},
-        upsert=True
-    )
+    writes.upsert('user_history', {'user_id': user_id}, set_fields=history)
     
-    # Refresh model with new data
-    _refresh_model()
+    # Fold the new event into the model; full refits happen on /train
+    _apply_event(event_data)
     
     return jsonify({'ok': True, 'skill_level': history['skill_level']})
 
@@ -671,11 +681,20 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', '5000'))
     # Try waitress in production mode if available
     use_waitress = os.getenv('USE_WAITRESS', '0') == '1'
-    if use_waitress:
+    workers = int(os.getenv('WEB_WORKERS', '1'))
+    if use_waitress and workers > 1:
+        # supervisor + workers sharing one copy of the model
+        from .serving import run
+        run(workers, '0.0.0.0', port, int(os.getenv('WEB_THREADS', '4')), float(os.getenv('REC_SHARED_POLL_S', '1')),
+            int(os.getenv('REC_SHARED_DELTA_SLOTS', '32768')))
+    elif use_waitress:
         try:
             from waitress import serve
             serve(app, host='0.0.0.0', port=port)
         except Exception:
             app.run(host='0.0.0.0', port=port)
+        finally:
+            if _WRITES is not None:
+                _WRITES.close()
     else:
         app.run(host='127.0.0.1', port=port, debug=True)
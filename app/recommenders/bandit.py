@@ -0,0 +1,116 @@
+import random
+import threading
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class _UserArms:
+    """One user's arms: arm id -> slot in parallel count/reward/mean arrays."""
+
+    __slots__ = ('slot', 'counts', 'rewards', 'means')
+
+    def __init__(self):
+        self.slot: Dict[str, int] = {}
+        # slot 0 stands for every arm never pulled (mean 0), so lookups need no branch
+        self.counts = array('d', [0.0])
+        self.rewards = array('d', [0.0])
+        self.means = array('d', [0.0])
+
+    def add(self, arm_id: str) -> int:
+        # array.append over-allocates geometrically: n new arms cost O(n) copying in total
+        self.counts.append(0.0)
+        self.rewards.append(0.0)
+        self.means.append(0.0)
+        j = self.slot[arm_id] = len(self.counts) - 1
+        return j
+
+
+class BanditStore:
+    """
+    Epsilon-greedy state for every user in one place. Each user keeps a dict
+    of arm id -> slot into compact float arrays of counts, total rewards and
+    running means: ``update`` is one dict lookup and three stores, and
+    ``select`` reads the candidates' precomputed means instead of dividing
+    per arm. Windows are 5-20 arms, so a list comprehension plus max() beats
+    a numpy gather, whose per-call overhead exceeds the work. See
+    scripts/bench_bandits.py for the comparison with per-user dicts.
+
+    Safe for concurrent use: user state is read and written under a single
+    lock. Striping the lock by user id was measured with
+    scripts/stress_bandits.py and was no faster (often slower): the critical
+    section is a few microseconds of work that holds the GIL throughout, so
+    threads serialize on the interpreter either way and picking a stripe
+    only adds a hash per call.
+    """
+
+    def __init__(self, epsilon: float = 0.1):
+        self.epsilon = epsilon
+        self._users: Dict[str, _UserArms] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def update(self, user_id: str, arm_id: str, reward: float, count: float = 1.0):
+        with self._lock:
+            st = self._users.get(user_id)
+            if st is None:
+                st = self._users[user_id] = _UserArms()
+            j = st.slot.get(arm_id)
+            if j is None:
+                j = st.add(arm_id)
+            c = st.counts[j] + count
+            r = st.rewards[j] + reward
+            st.counts[j] = c
+            st.rewards[j] = r
+            st.means[j] = r / c if c > 0 else 0.0
+
+    def _means(self, user_id: str, candidates: List[str]) -> Optional[List[float]]:
+        with self._lock:
+            st = self._users.get(user_id)
+            if st is None:
+                return None
+            get, means = st.slot.get, st.means
+            return [means[get(c, 0)] for c in candidates]
+
+    def averages(self, user_id: str, candidates: List[str]) -> np.ndarray:
+        """Average reward per candidate arm (0 for arms never pulled)."""
+        means = self._means(user_id, candidates)
+        return np.zeros(len(candidates)) if means is None else np.array(means)
+
+    def select(self, user_id: str, candidates: List[str]) -> Optional[str]:
+        if not candidates:
+            return None
+        if random.random() < self.epsilon:
+            return random.choice(candidates)
+        # exploit: pick highest average reward (first candidate wins ties)
+        means = self._means(user_id, candidates)
+        if means is None:
+            return candidates[0]
+        return candidates[means.index(max(means))]
+
+    def state(self, user_id: str) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            st = self._users.get(user_id)
+            if st is None:
+                return {}
+            return {arm: {'count': st.counts[j], 'total_reward': st.rewards[j]}
+                    for arm, j in st.slot.items()}
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Every (user, arm) as an rl_state-shaped document, the inverse of ``load``."""
+        with self._lock:
+            return [{'user_id': user_id, 'arm': arm, 'count': st.counts[j], 'total_reward': st.rewards[j]}
+                    for user_id, st in self._users.items() for arm, j in st.slot.items()]
+
+    def load(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Bulk-load rl_state documents ({user_id, arm, count, total_reward}); returns rows read."""
+        n = 0
+        for row in rows:
+            # merges into live state, so feedback that raced the load is kept
+            self.update(row['user_id'], row['arm'], float(row.get('total_reward', 0)),
+                        count=float(row.get('count', 0)))
+            n += 1
+        return n
@@ -1,19 +1,40 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Iterable
+import threading
 import numpy as np
+from scipy import sparse
+from ..utils import topk
 
 
 class CollaborativeRecommender:
     """
-    Lightweight user-based CF using cosine similarity over implicit feedback.
+    Lightweight CF using cosine similarity over implicit feedback.
     Interactions are aggregated per (user,item) with a weight from events.
+    The user-item matrix is kept sparse (CSR) so memory scales with events.
+
+    mode='user' scores items through similar users at request time.
+    mode='item' precomputes the top ``n_neighbors`` similar items per item at
+    fit time, so serving only touches the neighbors of the user's seen items.
     """
 
-    def __init__(self):
+    # merge buffered new (user,item) pairs into the CSR once this many pile up
+    max_pending = 1024
+
+    def __init__(self, mode: str = 'user', n_neighbors: int = 50, chunk_size: int = 256):
+        if mode not in ('user', 'item'):
+            raise ValueError(f"unknown CF mode: {mode}")
+        self.mode = mode
+        self.n_neighbors = n_neighbors
+        self.chunk_size = chunk_size  # item rows per similarity block when building neighbors
         self.user_index = {}
         self.item_index = {}
-        self.user_item = None  # np.ndarray
+        self.counts = None  # sparse.csr_matrix of raw aggregated weights
+        self.user_item = None  # sparse.csr_matrix, rows L2-normalized; shares structure with counts
+        self.row_norms = None  # np.ndarray, L2 norm (+eps) of each raw user row
+        self.item_neighbors = None  # sparse.csr_matrix (items x items), top-N cosine per row (mode='item')
         self.users: List[str] = []
         self.items: List[str] = []
+        self._pending: List[Tuple[int, int, float]] = []
+        self._lock = threading.Lock()
 
     @staticmethod
     def _event_weight(evt: Dict[str, Any]) -> float:
@@ -30,47 +51,231 @@ class CollaborativeRecommender:
             return 1.0
         return 0.5
 
+    @classmethod
+    def events_to_arrays(cls, events: List[Dict[str, Any]]):
+        """(users, items, user codes, item codes, weights) for a list of event dicts."""
+        users, rows = np.unique(np.array([e['user_id'] for e in events], dtype=object), return_inverse=True)
+        items, cols = np.unique(np.array([e['item_id'] for e in events], dtype=object), return_inverse=True)
+        weights = np.fromiter((cls._event_weight(e) for e in events), dtype=np.float32, count=len(events))
+        return users.tolist(), items.tolist(), rows, cols, weights
+
     def fit(self, events: List[Dict[str, Any]]):
+        self.fit_arrays(*self.events_to_arrays(events))
+
+    def fit_arrays(self, users: List[str], items: List[str], rows: np.ndarray, cols: np.ndarray, weights: np.ndarray):
+        """Fit from columnar interactions: rows/cols index into users/items."""
         # build indices
-        user_set = set()
-        item_set = set()
-        for e in events:
-            user_set.add(e['user_id'])
-            item_set.add(e['item_id'])
-        self.users = sorted(user_set)
-        self.items = sorted(item_set)
+        self.users = list(users)
+        self.items = list(items)
         self.user_index = {u: i for i, u in enumerate(self.users)}
         self.item_index = {it: i for i, it in enumerate(self.items)}
-        if not self.users or not self.items:
-            self.user_item = np.zeros((0, 0))
-            return
-        M = np.zeros((len(self.users), len(self.items)), dtype=np.float32)
-        for e in events:
-            ui = self.user_index[e['user_id']]
-            ii = self.item_index[e['item_id']]
-            M[ui, ii] += self._event_weight(e)
+        self._pending = []
+        # COO -> CSR sums duplicate (user,item) pairs
+        M = sparse.coo_matrix((weights, (rows, cols)), shape=(len(self.users), len(self.items)))
+        self._set_counts(M.tocsr())
+        if self.mode == 'item':
+            self.item_neighbors = self._build_item_neighbors(self.counts)
+
+    def _build_item_neighbors(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        n_items = counts.shape[1]
+        X = counts.T.tocsr()
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel()) + 1e-8
+        X = sparse.diags(1.0 / norms).dot(X).astype(np.float32).tocsr()
+        XT = X.T.tocsc()
+        k = min(self.n_neighbors, max(n_items - 1, 0))
+        rows, cols, vals = [], [], []
+        if k > 0:
+            # one dense (chunk x items) block at a time keeps fit memory bounded
+            for start in range(0, n_items, self.chunk_size):
+                stop = min(start + self.chunk_size, n_items)
+                block = (X[start:stop] @ XT).toarray()
+                block[np.arange(stop - start), np.arange(start, stop)] = 0.0
+                top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+                sims = np.take_along_axis(block, top, axis=1)
+                keep = sims > 0
+                rows.append(np.broadcast_to(np.arange(start, stop)[:, None], top.shape)[keep])
+                cols.append(top[keep])
+                vals.append(sims[keep])
+        if rows:
+            rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+        return sparse.csr_matrix((vals, (rows, cols)), shape=(n_items, n_items), dtype=np.float32)
+
+    def _set_counts(self, counts: sparse.csr_matrix):
+        counts.sum_duplicates()
+        self.counts = counts
         # normalize rows
-        norms = np.linalg.norm(M, axis=1, keepdims=True) + 1e-8
-        self.user_item = M / norms
+        norms = np.sqrt(np.asarray(counts.multiply(counts).sum(axis=1)).ravel()).astype(np.float32) + 1e-8
+        self.row_norms = norms
+        row_of_nnz = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        self.user_item = sparse.csr_matrix(
+            (counts.data / norms[row_of_nnz], counts.indices, counts.indptr), shape=counts.shape
+        )
+
+    def get_state(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """JSON-able metadata plus flat numpy arrays describing the fitted model."""
+        with self._lock:
+            if self.counts is None:
+                self._set_counts(sparse.csr_matrix((0, 0), dtype=np.float32))
+            if self._pending or self.counts.shape != (len(self.users), len(self.items)):
+                self._merge_pending()
+            meta = {'mode': self.mode, 'n_neighbors': self.n_neighbors, 'users': list(self.users),
+                    'items': list(self.items), 'shape': list(self.counts.shape)}
+            arrays = {'counts_data': self.counts.data, 'normalized_data': self.user_item.data,
+                      'indices': self.counts.indices, 'indptr': self.counts.indptr, 'row_norms': self.row_norms}
+            if self.item_neighbors is not None:
+                N = self.item_neighbors
+                arrays.update({'neighbors_data': N.data, 'neighbors_indices': N.indices, 'neighbors_indptr': N.indptr})
+        return meta, arrays
+
+    def set_state(self, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        """Restore from get_state(); arrays may be read-only (memory-mapped or shared)."""
+        self.mode = meta['mode']
+        self.n_neighbors = meta['n_neighbors']
+        self.users = list(meta['users'])
+        self.items = list(meta['items'])
+        self.user_index = {u: i for i, u in enumerate(self.users)}
+        self.item_index = {it: i for i, it in enumerate(self.items)}
+        self._pending = []
+        shape = tuple(meta['shape'])
+        indices, indptr = arrays['indices'], arrays['indptr']
+        self.counts = sparse.csr_matrix((arrays['counts_data'], indices, indptr), shape=shape, copy=False)
+        self.user_item = sparse.csr_matrix((arrays['normalized_data'], indices, indptr), shape=shape, copy=False)
+        self.row_norms = arrays['row_norms']
+        self.item_neighbors = None
+        if 'neighbors_data' in arrays:
+            self.item_neighbors = sparse.csr_matrix(
+                (arrays['neighbors_data'], arrays['neighbors_indices'], arrays['neighbors_indptr']),
+                shape=(shape[1], shape[1]), copy=False,
+            )
+
+    def add_event(self, evt: Dict[str, Any]):
+        """Fold a single event into the fitted matrix without refitting."""
+        self.add_interaction(evt['user_id'], evt['item_id'], self._event_weight(evt))
+
+    def add_interaction(self, user_id: str, item_id: str, weight: float):
+        with self._lock:
+            if self.counts is None:
+                self._set_counts(sparse.csr_matrix((0, 0), dtype=np.float32))
+                if self.mode == 'item':
+                    self.item_neighbors = sparse.csr_matrix((0, 0), dtype=np.float32)
+            # grow indices (and the matrix) for unseen users/items
+            if user_id not in self.user_index:
+                self.user_index[user_id] = len(self.users)
+                self.users.append(user_id)
+            if item_id not in self.item_index:
+                self.item_index[item_id] = len(self.items)
+                self.items.append(item_id)
+            ui = self.user_index[user_id]
+            ii = self.item_index[item_id]
+            start, end = self.counts.indptr[ui:ui + 2] if ui < self.counts.shape[0] else (0, 0)
+            hit = np.flatnonzero(self.counts.indices[start:end] == ii)
+            if not hit.size:
+                # new (user,item) pair changes the sparsity structure; buffer it
+                self._pending.append((ui, ii, weight))
+                if len(self._pending) >= self.max_pending:
+                    self._merge_pending()
+                return
+            # existing pair: update raw and normalized rows in place
+            if not self.counts.data.flags.writeable:
+                # state restored from a read-only snapshot: copy on first write
+                self.counts.data = np.array(self.counts.data)
+                self.user_item.data = np.array(self.user_item.data)
+                self.row_norms = np.array(self.row_norms)
+            self.counts.data[start + hit[0]] += weight
+            row = self.counts.data[start:end]
+            norm = np.float32(np.linalg.norm(row) + 1e-8)
+            self.row_norms[ui] = norm
+            self.user_item.data[start:end] = row / norm
+
+    def _merge_pending(self):
+        n_u, n_i = len(self.users), len(self.items)
+        counts = self.counts.copy()
+        counts.resize((n_u, n_i))
+        if self._pending:
+            r, c, w = zip(*self._pending)
+            counts = counts + sparse.csr_matrix((np.array(w, dtype=np.float32), (r, c)), shape=(n_u, n_i))
+        self._pending = []
+        self._set_counts(counts.tocsr())
+        if self.item_neighbors is not None and self.item_neighbors.shape[0] != n_i:
+            # items added since fit have no neighbors until the next full fit
+            neighbors = self.item_neighbors.copy()
+            neighbors.resize((n_i, n_i))
+            self.item_neighbors = neighbors
+
+    def item_indices(self, item_ids: Iterable[str]) -> np.ndarray:
+        """Integer column indices of the given item ids; unknown ids are skipped."""
+        return np.fromiter((self.item_index[i] for i in item_ids if i in self.item_index), dtype=np.int64)
+
+    def score_all(self, user_id: str) -> Optional[np.ndarray]:
+        """Dense CF scores for every item in ``self.items``; None for unknown users."""
+        if self.counts is None or user_id not in self.user_index:
+            return None
+        with self._lock:
+            if self._pending or self.counts.shape != (len(self.users), len(self.items)):
+                self._merge_pending()
+            user_item = self.user_item
+            neighbors = self.item_neighbors
+            u_idx = self.user_index[user_id]
+        u_vec = user_item[u_idx]
+        if self.mode == 'item':
+            # sum neighbor similarities over the user's seen items
+            return np.asarray((u_vec @ neighbors).todense()).ravel()
+        sims = user_item @ u_vec.T
+        # score items by similar users
+        return np.asarray((sims.T @ user_item).todense()).ravel()
+
+    def score_many(self, user_ids: List[str], cols: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Dense (len(user_ids) x len(self.items)) CF scores in one sparse matrix-matrix pass; zero rows for
+        unknown users. With ``cols`` only those item columns are returned (and densified).
+        """
+        width = len(cols) if cols is not None else None
+        if self.counts is None:
+            return np.zeros((len(user_ids), width or 0), dtype=np.float32)
+        with self._lock:
+            if self._pending or self.counts.shape != (len(self.users), len(self.items)):
+                self._merge_pending()
+            # rows looked up against this matrix: users added after the lock is released are unknown here
+            user_item = self.user_item
+            neighbors = self.item_neighbors
+            rows = np.fromiter((self.user_index.get(u, -1) for u in user_ids), dtype=np.int64, count=len(user_ids))
+        known = rows >= 0
+        out = np.zeros((len(user_ids), user_item.shape[1] if width is None else width), dtype=np.float32)
+        if known.any():
+            U = user_item[rows[known]]
+            if self.mode == 'item':
+                S = U @ neighbors
+            else:
+                S = (U @ user_item.T) @ user_item
+            if cols is not None:
+                S = S.tocsr()[:, cols]
+            out[known] = S.toarray()
+        return out
+
+    def neighbor_scores(self, user_ids: List[str]) -> Optional[sparse.csr_matrix]:
+        """
+        Sparse (len(user_ids) x len(self.items)) item-neighbor scores: the
+        union of the precomputed neighbor rows of each user's seen items,
+        weighted by the user's normalized interactions. Touches only those
+        rows. None unless mode='item' (there is no neighbor table otherwise).
+        """
+        if self.mode != 'item' or self.counts is None:
+            return None
+        with self._lock:
+            if self._pending or self.counts.shape != (len(self.users), len(self.items)):
+                self._merge_pending()
+            user_item = self.user_item
+            neighbors = self.item_neighbors
+            rows = np.fromiter((self.user_index.get(u, -1) for u in user_ids), dtype=np.int64, count=len(user_ids))
+        # unknown users get an empty row
+        pick = sparse.csr_matrix((np.ones(int((rows >= 0).sum()), dtype=np.float32),
+                                  (np.flatnonzero(rows >= 0), rows[rows >= 0])),
+                                 shape=(len(user_ids), user_item.shape[0]))
+        return sparse.csr_matrix(pick @ user_item @ neighbors)
 
     def recommend(self, user_id: str, exclude_item_ids: List[str], top_k: int = 10) -> List[Tuple[str, float]]:
-        if self.user_item is None or user_id not in self.user_index:
+        scores = self.score_all(user_id)
+        if scores is None:
             return []
-        u_idx = self.user_index[user_id]
-        u_vec = self.user_item[u_idx]
-        sims = self.user_item @ u_vec
-        # score items by similar users
-        scores = sims @ self.user_item
-        # zero out already seen
-        for ex in exclude_item_ids:
-            if ex in self.item_index:
-                scores[self.item_index[ex]] = -1e9
-        order = np.argsort(-scores)
-        recs = []
-        for j in order:
-            if scores[j] <= -1e8:
-                continue
-            recs.append((self.items[j], float(scores[j])))
-            if len(recs) >= top_k:
-                break
-        return recs
+        order = topk.top_k(scores, top_k, self.item_indices(exclude_item_ids))
+        return [(self.items[j], float(scores[j])) for j in order]
@@ -1,14 +1,23 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import numpy as np
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from ..utils import topk
 
 
 class ContentBasedRecommender:
-    def __init__(self):
+    def __init__(self, n_neighbors: int = 20, chunk_size: int = 512):
         self.vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2))
         self.item_ids: List[str] = []
+        self.item_index: Dict[str, int] = {}
         self.item_matrix = None
+        # precomputed "more like this" table: top n_neighbors rows per item, best first
+        self.n_neighbors = n_neighbors
+        self.chunk_size = chunk_size
+        self.neighbor_idx = None  # np.ndarray (n_items, k) int32
+        self.neighbor_sims = None  # np.ndarray (n_items, k) float32
+        self._postings = None  # item_matrix transposed to CSR: term -> items containing it, built lazily
 
     @staticmethod
     def _item_text(item: Dict[str, Any]) -> str:
@@ -22,34 +31,109 @@ class ContentBasedRecommender:
 
     def fit(self, items: List[Dict[str, Any]]):
         self.item_ids = [it['_id'] for it in items]
+        self.item_index = {iid: i for i, iid in enumerate(self.item_ids)}
+        self.neighbor_idx = self.neighbor_sims = None
+        self._postings = None
         corpus = [self._item_text(it) for it in items]
         if not corpus:
             self.item_matrix = np.zeros((0, 1))
             return
         tfidf = self.vectorizer.fit_transform(corpus)
         self.item_matrix = tfidf
+        if self.n_neighbors > 0:
+            self._build_neighbors()
+
+    def _build_neighbors(self):
+        n = self.item_matrix.shape[0]
+        k = min(self.n_neighbors, n - 1)
+        self.neighbor_idx = np.zeros((n, k), dtype=np.int32)
+        self.neighbor_sims = np.zeros((n, k), dtype=np.float32)
+        if k <= 0:
+            return
+        X = self.item_matrix.tocsr()
+        XT = X.T.tocsc()
+        # rows are L2-normalized by TfidfVectorizer, so dot products are cosines;
+        # one dense (chunk x items) block at a time keeps memory bounded
+        for start in range(0, n, self.chunk_size):
+            stop = min(start + self.chunk_size, n)
+            block = (X[start:stop] @ XT).toarray()
+            block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            sims = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-sims, axis=1, kind='stable')
+            self.neighbor_idx[start:stop] = np.take_along_axis(top, order, axis=1)
+            self.neighbor_sims[start:stop] = np.take_along_axis(sims, order, axis=1)
 
     def similar_items(self, item_id: str, top_k: int = 20) -> List[str]:
-        if self.item_matrix is None or item_id not in self.item_ids:
+        if self.item_matrix is None or item_id not in self.item_index:
             return []
-        idx = self.item_ids.index(item_id)
+        idx = self.item_index[item_id]
+        if self.neighbor_idx is not None and top_k <= self.neighbor_idx.shape[1]:
+            return [self.item_ids[j] for j in self.neighbor_idx[idx, :top_k]]
         sims = cosine_similarity(self.item_matrix[idx], self.item_matrix).flatten()
-        order = np.argsort(-sims)
-        recs = []
-        for j in order:
-            if j == idx:
-                continue
-            recs.append(self.item_ids[j])
-            if len(recs) >= top_k:
-                break
-        return recs
-
-    def score_user_to_items(self, user_profile_text: str, candidate_items: List[Dict[str, Any]]):
-        # Build temporary matrix for candidates
-        texts = [self._item_text(it) for it in candidate_items]
-        if not texts:
+        order = topk.top_k(sims, top_k, np.array([idx]))
+        return [self.item_ids[j] for j in order]
+
+    def get_state(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """JSON-able metadata plus flat numpy arrays describing the fitted model."""
+        meta = {'item_ids': self.item_ids, 'n_neighbors': self.n_neighbors, 'fitted': sparse.issparse(self.item_matrix)}
+        arrays = {}
+        if meta['fitted']:
+            X = self.item_matrix.tocsr()
+            vocab = self.vectorizer.vocabulary_
+            terms = [''] * len(vocab)
+            for term, j in vocab.items():
+                terms[j] = term
+            meta['vocabulary'] = terms
+            meta['matrix_shape'] = list(X.shape)
+            arrays.update({'idf': self.vectorizer.idf_, 'matrix_data': X.data,
+                           'matrix_indices': X.indices, 'matrix_indptr': X.indptr})
+            if self.neighbor_idx is not None:
+                arrays.update({'neighbor_idx': self.neighbor_idx, 'neighbor_sims': self.neighbor_sims})
+        return meta, arrays
+
+    def set_state(self, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        """Restore from get_state(); arrays may be read-only (memory-mapped or shared)."""
+        self.item_ids = list(meta['item_ids'])
+        self.item_index = {iid: i for i, iid in enumerate(self.item_ids)}
+        self.n_neighbors = meta['n_neighbors']
+        self.neighbor_idx = arrays.get('neighbor_idx')
+        self.neighbor_sims = arrays.get('neighbor_sims')
+        self._postings = None
+        if not meta['fitted']:
+            self.item_matrix = np.zeros((0, 1))
+            return
+        self.vectorizer.vocabulary_ = {term: j for j, term in enumerate(meta['vocabulary'])}
+        self.vectorizer.idf_ = arrays['idf']
+        self.item_matrix = sparse.csr_matrix(
+            (arrays['matrix_data'], arrays['matrix_indices'], arrays['matrix_indptr']),
+            shape=tuple(meta['matrix_shape']), copy=False,
+        )
+
+    def profile_vector(self, user_profile_text: str):
+        return self.vectorizer.transform([user_profile_text])
+
+    def score_profiles(self, profile_matrix) -> np.ndarray:
+        """Cosine of each profile row against every fitted item: (n_profiles x n_items)."""
+        return cosine_similarity(profile_matrix, self.item_matrix)
+
+    def match_profiles(self, profile_matrix) -> sparse.csr_matrix:
+        """
+        Sparse (n_profiles x n_items) cosine scores through the inverted index:
+        only the postings of each profile's nonzero terms are touched, and
+        items sharing no term with a profile (cosine 0) are absent.
+        """
+        if not sparse.issparse(self.item_matrix):
+            return sparse.csr_matrix((profile_matrix.shape[0], len(self.item_ids)))
+        postings = self._postings
+        if postings is None:
+            # transposing CSR -> CSC is free; one conversion gives term-major rows
+            postings = self._postings = self.item_matrix.T.tocsr()
+        # TF-IDF rows (items and profiles) are L2-normalized, so dot products are cosines
+        return sparse.csr_matrix(profile_matrix @ postings)
+
+    def score_profile(self, profile_vec, candidate_idx: np.ndarray) -> np.ndarray:
+        """Cosine of a profile vector against fitted item rows; no re-tokenization."""
+        if not len(candidate_idx):
             return np.array([])
-        X = self.vectorizer.transform(texts)
-        q = self.vectorizer.transform([user_profile_text])
-        sims = cosine_similarity(q, X).flatten()
-        return sims
+        return cosine_similarity(profile_vec, self.item_matrix[candidate_idx]).flatten()
@@ -1,71 +1,296 @@
-from typing import List, Dict, Any
+import os
+from typing import List, Dict, Any, Tuple, Iterator, Optional
 import numpy as np
+from scipy import sparse
 from .content_based import ContentBasedRecommender
 from .collaborative import CollaborativeRecommender
+from .torch_mf import ALSRecommender
+from .bandit import BanditStore
+from ..utils import metrics, topk
+from ..utils.cache import TTLCache
 
 
-class EpsilonGreedyBandit:
-    def __init__(self, epsilon: float = 0.1):
-        self.epsilon = epsilon
-        # state: {arm_id: {count: int, total_reward: float}}
-        self.state: Dict[str, Dict[str, float]] = {}
-
-    def update(self, arm_id: str, reward: float):
-        st = self.state.setdefault(arm_id, {"count": 0.0, "total_reward": 0.0})
-        st["count"] += 1.0
-        st["total_reward"] += float(reward)
-
-    def select(self, candidates: List[str]) -> str:
-        if not candidates:
-            return None
-        import random
-        if random.random() < self.epsilon:
-            return random.choice(candidates)
-        # exploit: pick highest average reward
-        best_arm = None
-        best_val = -1e9
-        for arm in candidates:
-            st = self.state.get(arm)
-            avg = (st["total_reward"] / st["count"]) if st and st["count"] > 0 else 0.0
-            if avg > best_val:
-                best_val = avg
-                best_arm = arm
-        return best_arm or candidates[0]
+def _zscore_rows(V: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    # row-wise version of the z-score in rank(), over each row's valid entries only
+    V = np.asarray(V, dtype=float)
+    cnt = np.maximum(valid.sum(axis=1, keepdims=True), 1)
+    mean = np.where(valid, V, 0.0).sum(axis=1, keepdims=True) / cnt
+    std = np.sqrt(np.where(valid, (V - mean) ** 2, 0.0).sum(axis=1, keepdims=True) / cnt)
+    has_spread = std > 0
+    m = np.where(has_spread, mean, 0.0)
+    s = np.where(has_spread, std, 1.0)
+    return (V - m) / (s + 1e-8)
+
+
+def _make_cf(mode: str, n_neighbors: int, als_options: Optional[Dict[str, Any]] = None):
+    # 'user'/'item' neighborhood CF, or 'als' matrix factorization
+    if mode == 'als':
+        return ALSRecommender(**(als_options or {}))
+    return CollaborativeRecommender(mode=mode, n_neighbors=n_neighbors)
 
 
 class HybridRecommender:
-    def __init__(self, epsilon: float = 0.1):
-        self.cbf = ContentBasedRecommender()
-        self.cf = CollaborativeRecommender()
-        self.bandits: Dict[str, EpsilonGreedyBandit] = {}
+    def __init__(self, epsilon: float = 0.1, cf_mode: str = 'user', cf_neighbors: int = 50, similar_items: int = 20,
+                 max_candidates: int = 0, als_options: Optional[Dict[str, Any]] = None,
+                 max_profiles: int = 10000):
+        self.cbf = ContentBasedRecommender(n_neighbors=similar_items)
+        self.cf = _make_cf(cf_mode, cf_neighbors, als_options)
+        self.als_options = als_options
+        self.bandits = BanditStore(epsilon)
         self.epsilon = epsilon
+        # cap on items that reach blending/re-ranking per user (0 = whole unseen catalog)
+        self.max_candidates = max_candidates
+        self.items: List[Dict[str, Any]] = []
+        self.item_ids: List[str] = []
+        self.item_pos: Dict[str, int] = {}
+        self._cf_pos = np.zeros(0, dtype=np.int64)
+        self.seen: Dict[str, np.ndarray] = {}  # user_id -> sorted catalog positions with events
+        self.popularity = np.zeros(0)  # event count per catalog position
+        self._pop_order = None  # catalog positions by descending popularity, built lazily
+        # user_id -> TF-IDF profile row; LRU-bounded so a long-lived process doesn't keep every user seen
+        self._profiles = TTLCache(maxsize=max_profiles, ttl=float('inf'))
 
     def fit(self, items: List[Dict[str, Any]], events: List[Dict[str, Any]]):
+        self.fit_arrays(items, *CollaborativeRecommender.events_to_arrays(events))
+
+    def fit_log(self, items: List[Dict[str, Any]], log):
+        """Fit from an EventLog's columnar arrays instead of event dicts."""
+        self.fit_arrays(items, log.users, log.items, log.user_idx, log.item_idx, log.weight)
+
+    def fit_arrays(self, items: List[Dict[str, Any]], users: List[str], event_items: List[str],
+                   user_codes: np.ndarray, item_codes: np.ndarray, weights: np.ndarray):
+        timer = metrics.stages('fit')
         self.cbf.fit(items)
-        self.cf.fit(events)
+        # profile vectors depend on the fitted vocabulary
+        self._profiles.clear()
+        timer.mark('cbf')
+        self.cf.fit_arrays(users, event_items, user_codes, item_codes, weights)
+        timer.mark('cf')
+        self.items = list(items)
+        self.item_ids = [it['_id'] for it in items]
+        self.item_pos = {iid: i for i, iid in enumerate(self.item_ids)}
+        # CF column for each catalog item (-1 if CF has never seen it)
+        self._cf_pos = np.array([self.cf.item_index.get(iid, -1) for iid in self.item_ids], dtype=np.int64)
+        self._index_events(users, event_items, user_codes, item_codes)
+        timer.mark('index')
+
+    def _index_events(self, users: List[str], event_items: List[str], user_codes: np.ndarray, item_codes: np.ndarray):
+        # per-user seen positions and popularity, so recommend() never scans events
+        vocab_pos = np.array([self.item_pos.get(iid, -1) for iid in event_items], dtype=np.int64)
+        pos = vocab_pos[item_codes] if len(item_codes) else np.zeros(0, dtype=np.int64)
+        known = pos >= 0
+        pos = pos[known]
+        self.popularity = np.bincount(pos, minlength=len(self.item_ids)).astype(float)
+        self._pop_order = None
+        self.seen = {}
+        if not pos.size:
+            return
+        codes = np.asarray(user_codes, dtype=np.int64)[known]
+        # unique (user, item) pairs sorted by user then item, split into per-user runs
+        pairs = np.unique(np.stack([codes, pos]), axis=1)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(pairs[0])) + 1])
+        run_users = [users[c] for c in pairs[0][starts]]
+        self.seen = dict(zip(run_users, np.split(pairs[1], starts[1:])))
+
+    def get_state(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """
+        Fitted state as JSON-able metadata plus flat numpy arrays (component
+        arrays are prefixed 'cbf.' / 'cf.'). Bandit state is not included.
+        """
+        cbf_meta, cbf_arrays = self.cbf.get_state()
+        cf_meta, cf_arrays = self.cf.get_state()
+        seen_users = list(self.seen)
+        seen_lists = [self.seen[u] for u in seen_users]
+        meta = {'items': self.items, 'seen_users': seen_users, 'cbf': cbf_meta, 'cf': cf_meta}
+        arrays = {
+            'cf_pos': self._cf_pos,
+            'popularity': self.popularity,
+            'seen_indptr': np.concatenate([[0], np.cumsum([len(v) for v in seen_lists], dtype=np.int64)]),
+            'seen_indices': np.concatenate(seen_lists) if seen_lists else np.zeros(0, dtype=np.int64),
+        }
+        arrays.update({f'cbf.{k}': v for k, v in cbf_arrays.items()})
+        arrays.update({f'cf.{k}': v for k, v in cf_arrays.items()})
+        return meta, arrays
+
+    def set_state(self, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        """Restore from get_state(); arrays may be read-only (memory-mapped or shared)."""
+        self.cbf.set_state(meta['cbf'], {k[4:]: v for k, v in arrays.items() if k.startswith('cbf.')})
+        if meta['cf']['mode'] != self.cf.mode and 'als' in (meta['cf']['mode'], self.cf.mode):
+            # snapshot was built with the other CF engine
+            self.cf = _make_cf(meta['cf']['mode'], meta['cf'].get('n_neighbors', 50), self.als_options)
+        self.cf.set_state(meta['cf'], {k[3:]: v for k, v in arrays.items() if k.startswith('cf.')})
+        self.items = list(meta['items'])
+        self.item_ids = [it['_id'] for it in self.items]
+        self.item_pos = {iid: i for i, iid in enumerate(self.item_ids)}
+        self._cf_pos = arrays['cf_pos']
+        self.popularity = arrays['popularity']
+        self._pop_order = None
+        indptr, indices = arrays['seen_indptr'], arrays['seen_indices']
+        self.seen = {u: indices[indptr[i]:indptr[i + 1]] for i, u in enumerate(meta['seen_users'])}
+        self._profiles.clear()
+
+    def get_items(self, item_ids: List[str]) -> List[Dict[str, Any]]:
+        # catalog payloads by id, skipping ids that are not in the fitted catalog
+        return [self.items[self.item_pos[iid]] for iid in item_ids if iid in self.item_pos]
+
+    def add_event(self, event: Dict[str, Any]):
+        # incremental path for ingest; only CF depends on events, items are unchanged
+        self.cf.add_event(event)
+        pos = self.item_pos.get(event['item_id'])
+        if pos is None:
+            return
+        if not self.popularity.flags.writeable:
+            # state restored from a read-only snapshot: copy on first write
+            self.popularity = np.array(self.popularity)
+            self._cf_pos = np.array(self._cf_pos)
+        if self._cf_pos[pos] < 0:
+            self._cf_pos[pos] = self.cf.item_index[event['item_id']]
+        self.popularity[pos] += 1.0
+        self._pop_order = None
+        seen = self.seen.get(event['user_id'])
+        if seen is None:
+            self.seen[event['user_id']] = np.array([pos], dtype=np.int64)
+        elif not np.isin(pos, seen):
+            self.seen[event['user_id']] = np.union1d(seen, [pos])
 
     def _user_profile_text(self, user: Dict[str, Any]) -> str:
         interests = ' '.join(user.get('interests', []) or [])
         goals = ' '.join(user.get('goals', []) or [])
         return f"{interests} {goals}".strip()
 
-    def recommend(self, user: Dict[str, Any], items: List[Dict[str, Any]], events: List[Dict[str, Any]], limit: int = 10) -> List[str]:
+    def _user_profile(self, user: Dict[str, Any]):
+        vec = self._profiles.get(user['_id'])
+        if vec is None:
+            vec = self.cbf.profile_vector(self._user_profile_text(user))
+            self._profiles.set(user['_id'], vec)
+        return vec
+
+    def invalidate_user(self, user_id: str):
+        # call when interests/goals change
+        self._profiles.pop(user_id)
+
+    def recommend(self, user: Dict[str, Any], limit: int = 10) -> List[str]:
+        return self.rerank(user['_id'], self.rank(user, limit), limit)
+
+    @staticmethod
+    def _bandit_window(limit: int) -> int:
+        return max(5, min(20, limit * 2))
+
+    def _candidate_cap(self, limit: int) -> int:
+        # never below the head that rank() has to return
+        return max(self.max_candidates, limit, self._bandit_window(limit))
+
+    def _popularity_order(self) -> np.ndarray:
+        if self._pop_order is None:
+            self._pop_order = np.argsort(-self.popularity, kind='stable')
+        return self._pop_order
+
+    @staticmethod
+    def _top_unseen(idx: np.ndarray, scores: np.ndarray, seen: np.ndarray, k: int) -> np.ndarray:
+        keep = (scores > 0) & ~np.isin(idx, seen)
+        idx, scores = idx[keep], scores[keep]
+        if idx.size > k:
+            idx = idx[np.argpartition(-scores, k - 1)[:k]]
+        return idx
+
+    def _content_neighbors(self, seen: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # summed "more like this" similarities over the rows of the seen items
+        table = self.cbf.neighbor_idx
+        if table is None or not seen.size or not table.shape[1]:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        pos, inv = np.unique(table[seen].ravel(), return_inverse=True)
+        return pos.astype(np.int64), np.bincount(inv, weights=self.cbf.neighbor_sims[seen].ravel())
+
+    def _retrieve(self, user_ids: List[str], profiles, cap: int) -> Tuple[List[np.ndarray], sparse.csr_matrix]:
+        """
+        Cheap candidate generation; cost follows each user's history and
+        profile terms, not the catalog size. Per user, the union of the top
+        ceil(cap/3) unseen items by item-neighbor score (CF neighbor rows of
+        the seen items, or the content neighbor table when the CF engine has
+        none) and by TF-IDF match over the postings of the profile's terms,
+        topped up to ``cap`` from the precomputed popularity order. Returns
+        the sorted candidate positions per user and the sparse CBF match
+        scores, which are exact cosines for the candidates.
+        """
+        quota = -(-cap // 3)
+        match = self.cbf.match_profiles(profiles)
+        neighbors = self.cf.neighbor_scores(user_ids)
+        if neighbors is not None:
+            # CF item column -> catalog position (-1 for items outside the catalog)
+            cf_item_pos = np.full(neighbors.shape[1], -1, dtype=np.int64)
+            known = (self._cf_pos >= 0) & (self._cf_pos < neighbors.shape[1])
+            cf_item_pos[self._cf_pos[known]] = np.flatnonzero(known)
+        pop_order = self._popularity_order()
+        empty = np.zeros(0, dtype=np.int64)
+        out = []
+        for r, uid in enumerate(user_ids):
+            seen = self.seen.get(uid, empty)
+            lo, hi = match.indptr[r], match.indptr[r + 1]
+            picks = [self._top_unseen(match.indices[lo:hi].astype(np.int64), match.data[lo:hi], seen, quota)]
+            if neighbors is not None:
+                lo, hi = neighbors.indptr[r], neighbors.indptr[r + 1]
+                pos = cf_item_pos[neighbors.indices[lo:hi]]
+                picks.append(self._top_unseen(pos, np.where(pos >= 0, neighbors.data[lo:hi], 0.0), seen, quota))
+            else:
+                picks.append(self._top_unseen(*self._content_neighbors(seen), seen, quota))
+            chosen = np.union1d(*picks)
+            need = cap - chosen.size
+            if need > 0:
+                # a prefix this long holds `need` unseen, unchosen items whenever the catalog has them
+                head = pop_order[:need + seen.size + chosen.size]
+                head = head[~np.isin(head, seen) & ~np.isin(head, chosen)][:need]
+                chosen = np.union1d(chosen, head)
+            out.append(chosen)
+        return out, match
+
+    def _cf_scores(self, user_ids: List[str], cand: np.ndarray) -> np.ndarray:
+        """CF scores (len(user_ids) x cand.size) for catalog positions ``cand`` only."""
+        cols = self._cf_pos[cand]
+        known = cols >= 0
+        out = np.zeros((len(user_ids), cand.size))
+        if known.any():
+            out[:, known] = self.cf.score_many(user_ids, cols[known])
+        return out
+
+    def rank(self, user: Dict[str, Any], limit: int = 10) -> List[str]:
+        """
+        Blended ranking before the bandit step: the head of the list that
+        ``rerank`` needs (max(limit, bandit window) ids). Deterministic for a
+        given model state, so callers may cache it.
+        """
+        timer = metrics.stages('rank')
         user_id = user['_id']
-        seen = [e['item_id'] for e in events if e['user_id'] == user_id]
-        # candidates: unseen items
-        candidates = [it for it in items if it['_id'] not in seen]
-        if not candidates:
+        n = len(self.item_ids)
+        seen = self.seen.get(user_id)
+        n_unseen = n - (len(seen) if seen is not None else 0)
+        if not n_unseen:
             return []
-        # CBF scores
-        cbf_scores = self.cbf.score_user_to_items(self._user_profile_text(user), candidates)
-        # CF scores (align to candidates)
-        cf_pairs = {iid: s for iid, s in self.cf.recommend(user_id, exclude_item_ids=seen, top_k=len(candidates))}
-        cf_scores = np.array([cf_pairs.get(it['_id'], 0.0) for it in candidates])
+        cap = self._candidate_cap(limit)
+        if self.max_candidates and n_unseen > cap:
+            # two-stage: cheap retrieval, then full scoring of the candidates only
+            (cand,), match = self._retrieve([user_id], self._user_profile(user), cap)
+            timer.mark('candidates')
+            cbf_scores = match[:, cand].toarray().ravel()
+            timer.mark('cbf')
+            cf_scores = self._cf_scores([user_id], cand)[0]
+            timer.mark('cf')
+        else:
+            # candidates: unseen catalog positions
+            cand = np.flatnonzero(~topk.exclusion_mask(n, seen))
+            # CBF scores
+            cbf_scores = self.cbf.score_profile(self._user_profile(user), cand)
+            timer.mark('cbf')
+            # CF scores (align to candidates)
+            cf_scores = np.zeros(cand.size)
+            cf_all = self.cf.score_all(user_id)
+            if cf_all is not None:
+                cols = self._cf_pos[cand]
+                known = cols >= 0
+                cf_scores[known] = cf_all[cols[known]]
+            timer.mark('cf')
         # popularity prior
-        pop = {}
-        for e in events:
-            pop[e['item_id']] = pop.get(e['item_id'], 0.0) + 1.0
-        pop_scores = np.array([pop.get(it['_id'], 0.0) for it in candidates])
+        pop_scores = self.popularity[cand]
+        timer.mark('popularity')
         # blend
         # normalize each
         def norm(v):
@@ -79,19 +304,110 @@ class HybridRecommender:
         cbf_n = norm(cbf_scores)
         cf_n = norm(cf_scores)
         pop_n = norm(pop_scores)
+        timer.mark('normalize')
         blend = 0.5 * cbf_n + 0.4 * cf_n + 0.1 * pop_n
-        order = np.argsort(-blend)
-        ranked = [candidates[i]['_id'] for i in order]
-        # RL bandit selection on top-K arms
-        top_k = ranked[: max(5, min(20, limit * 2))]
-        bandit = self.bandits.setdefault(user_id, EpsilonGreedyBandit(self.epsilon))
+        # only the head of the ranking is ever returned
+        order = topk.top_k(blend, max(limit, self._bandit_window(limit)))
+        timer.mark('select')
+        return [self.item_ids[cand[i]] for i in order]
+
+    def rerank(self, user_id: str, ranked: List[str], limit: int = 10) -> List[str]:
+        """RL bandit selection on top-K arms; re-drawn on every call."""
+        timer = metrics.stages('rerank')
+        window = self._bandit_window(limit)
+        ranked = list(ranked)
+        top_k = ranked[:window]
         # Re-rank by bandit preference: put best arm first, keep rest order
-        best = bandit.select(top_k)
+        best = self.bandits.select(user_id, top_k)
         if best and best in top_k:
             top_k.remove(best)
-            ranked = [best] + top_k + [r for r in ranked if r not in top_k and r != best]
+            ranked = [best] + top_k + ranked[window:]
+        timer.mark('bandit')
         return ranked[:limit]
 
+    def recommend_many(self, users: List[Dict[str, Any]], limit: int = 10,
+                       block_size: int = 128) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Recommendations for many users, yielded as (user_id, ids) one block
+        at a time. Each block of users is scored with one matrix product for
+        CF and one for CBF profiles; blending and top-k run row-wise in numpy.
+        """
+        for start in range(0, len(users), block_size):
+            block = users[start:start + block_size]
+            for user, ranked in zip(block, self.rank_many(block, limit)):
+                yield user['_id'], self.rerank(user['_id'], ranked, limit)
+
+    def rank_many(self, users: List[Dict[str, Any]], limit: int = 10) -> List[List[str]]:
+        """Vectorized ``rank`` for a block of users."""
+        n, b = len(self.item_ids), len(users)
+        if not n or not b:
+            return [[] for _ in users]
+        timer = metrics.stages('rank_many')
+        user_ids = [u['_id'] for u in users]
+        profiles = sparse.vstack([self._user_profile(u) for u in users])
+        cap = self._candidate_cap(limit)
+        if self.max_candidates and cap < n:
+            # score only the union of the block's candidates; each row keeps its own
+            cands, match = self._retrieve(user_ids, profiles, cap)
+            cols = np.unique(np.concatenate(cands))
+            valid = np.zeros((b, cols.size), dtype=bool)
+            for r, cand in enumerate(cands):
+                valid[r, np.searchsorted(cols, cand)] = True
+            timer.mark('candidates')
+            cbf_scores = match[:, cols].toarray()
+            timer.mark('cbf')
+            cf_scores = self._cf_scores(user_ids, cols)
+            timer.mark('cf')
+            pop_scores = np.broadcast_to(self.popularity[cols], valid.shape)
+        else:
+            cols = None
+            valid = np.ones((b, n), dtype=bool)
+            for r, uid in enumerate(user_ids):
+                seen = self.seen.get(uid)
+                if seen is not None:
+                    valid[r, seen] = False
+            cbf_scores = self.cbf.score_profiles(profiles)
+            timer.mark('cbf')
+            cf_scores = np.zeros((b, n))
+            known = self._cf_pos >= 0
+            if known.any():
+                cf_scores[:, known] = self.cf.score_many(user_ids)[:, self._cf_pos[known]]
+            timer.mark('cf')
+            pop_scores = np.broadcast_to(self.popularity, (b, n))
+        blend = (0.5 * _zscore_rows(cbf_scores, valid) + 0.4 * _zscore_rows(cf_scores, valid)
+                 + 0.1 * _zscore_rows(pop_scores, valid))
+        blend[~valid] = -np.inf
+        timer.mark('normalize')
+        width = valid.shape[1]
+        k = min(max(limit, self._bandit_window(limit)), width)
+        top = np.argpartition(-blend, k - 1, axis=1)[:, :k] if k < width else np.tile(np.arange(width), (b, 1))
+        top_scores = np.take_along_axis(blend, top, axis=1)
+        top = np.take_along_axis(top, np.argsort(-top_scores, axis=1, kind='stable'), axis=1)
+        if cols is not None:
+            top = cols[top]
+        n_valid = valid.sum(axis=1)
+        timer.mark('select')
+        return [[self.item_ids[j] for j in top[r, :min(k, n_valid[r])]] for r in range(b)]
+
     def feedback(self, user_id: str, item_id: str, reward: float):
-        bandit = self.bandits.setdefault(user_id, EpsilonGreedyBandit(self.epsilon))
-        bandit.update(item_id, reward)
+        self.bandits.update(user_id, item_id, reward)
+
+
+def from_env() -> HybridRecommender:
+    """A HybridRecommender configured from the REC_* environment (app workers and offline builds alike)."""
+    als_options = {
+        'factors': int(os.getenv('REC_ALS_FACTORS', '32')),
+        'regularization': float(os.getenv('REC_ALS_REG', '0.1')),
+        'alpha': float(os.getenv('REC_ALS_ALPHA', '20')),
+        'iterations': int(os.getenv('REC_ALS_ITERATIONS', '10')),
+        'n_threads': int(os.getenv('REC_ALS_THREADS', '0')) or None,
+    }
+    return HybridRecommender(
+        epsilon=float(os.getenv('REC_EPSILON', '0.1')),
+        cf_mode=os.getenv('REC_CF_MODE', 'user'),
+        cf_neighbors=int(os.getenv('REC_CF_NEIGHBORS', '50')),
+        similar_items=int(os.getenv('REC_SIMILAR_ITEMS', '20')),
+        max_candidates=int(os.getenv('REC_MAX_CANDIDATES', '200')),
+        als_options=als_options,
+        max_profiles=int(os.getenv('REC_PROFILE_CACHE_SIZE', '10000')),
+    )
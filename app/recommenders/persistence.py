@@ -0,0 +1,122 @@
+"""
+Versioned on-disk snapshots of a fitted HybridRecommender.
+
+Layout under a snapshot root:
+
+    <root>/CURRENT                 name of the newest snapshot
+    <root>/<name>/meta.json        format, version, metadata, array names
+    <root>/<name>/<array>.npy      one file per array, memory-mappable
+
+Loading with mmap=True maps every array read-only, so processes on one host
+share the page cache and start without refitting.
+"""
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .hybrid import HybridRecommender
+
+SNAPSHOT_FORMAT = 1
+
+
+def save_snapshot(rec: HybridRecommender, root: str, users: Optional[Dict[str, Any]] = None,
+                  version: Optional[int] = None, keep: int = 3) -> str:
+    """
+    Write rec (and the user cache) as a new snapshot and point CURRENT at it,
+    then remove all but the newest ``keep`` snapshots (0 keeps everything).
+    """
+    meta, arrays = rec.get_state()
+    version = version if version is not None else int(time.time())
+    name = f"v{version}-{time.strftime('%Y%m%dT%H%M%S')}"
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, f".{name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for key, arr in arrays.items():
+        np.save(os.path.join(tmp, f"{key}.npy"), np.ascontiguousarray(arr), allow_pickle=False)
+    doc = {
+        'format': SNAPSHOT_FORMAT,
+        'version': version,
+        'created_at': time.time(),
+        'arrays': sorted(arrays),
+        'meta': meta,
+        'users': list((users or {}).values()),
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(doc, f, default=str)
+    final = os.path.join(root, name)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(tmp, final)
+    # publish atomically so readers never see a half-written pointer
+    pointer = os.path.join(root, '.CURRENT.tmp')
+    with open(pointer, 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(root, 'CURRENT'))
+    if keep > 0:
+        prune_snapshots(root, keep)
+    return final
+
+
+def prune_snapshots(root: str, keep: int) -> int:
+    """Delete snapshots older than the newest ``keep`` (never CURRENT); returns how many went."""
+    current = latest_snapshot(root)
+    found = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                created = json.load(f).get('created_at', 0.0)
+        except (OSError, ValueError):
+            continue  # not a snapshot (or one still being written)
+        found.append((created, path))
+    found.sort(reverse=True)
+    removed = 0
+    for _, path in found[max(keep, 1):]:
+        if current is not None and os.path.samefile(path, current):
+            continue
+        # processes still mapping its arrays keep their pages until they unmap them
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+def latest_snapshot(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, 'CURRENT'), encoding='utf-8') as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(root, name)
+    return path if name and os.path.isdir(path) else None
+
+
+def load_arrays(path: str, names, mmap: bool = True) -> Dict[str, np.ndarray]:
+    arrays = {}
+    for key in names:
+        fname = os.path.join(path, f"{key}.npy")
+        try:
+            arrays[key] = np.load(fname, mmap_mode='r' if mmap else None, allow_pickle=False)
+        except ValueError:
+            # empty arrays cannot be memory-mapped
+            arrays[key] = np.load(fname, allow_pickle=False)
+    return arrays
+
+
+def load_snapshot(path: str, rec: Optional[HybridRecommender] = None,
+                  mmap: bool = True) -> Tuple[HybridRecommender, Dict[str, Any], Dict[str, Any]]:
+    """
+    Load a snapshot directory into rec (a fresh HybridRecommender by default).
+    Returns (rec, users, info) where info holds version/created_at.
+    """
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        doc = json.load(f)
+    if doc.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"unsupported snapshot format {doc.get('format')!r} in {path}")
+    rec = rec or HybridRecommender()
+    rec.set_state(doc['meta'], load_arrays(path, doc['arrays'], mmap=mmap))
+    users = {u['_id']: u for u in doc['users']}
+    return rec, users, {'version': doc['version'], 'created_at': doc['created_at'], 'path': path}
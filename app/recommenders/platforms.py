@@ -0,0 +1,91 @@
+"""
+Catalog of external learning platforms behind POST /recommend.
+
+Loaded once from a JSON data file into an inverted index: per level, the
+platforms each category/interest contributes, in the catalog's fixed order.
+Each platform is also serialized once, so responses are assembled from
+precomputed JSON fragments.
+"""
+import json
+import os
+from typing import Any, Dict, List, Sequence
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'platforms.json')
+
+# platform levels shown for each selected skill level (unknown levels show none)
+LEVEL_FILTERS = {
+    'Beginner': ('Beginner', 'Intermediate', 'Advanced'),
+    'Intermediate': ('Beginner', 'Intermediate', 'Advanced'),
+    'Advanced': ('Intermediate', 'Advanced'),
+}
+MAX_RESULTS = 12
+
+
+def _fragment(obj: Any) -> str:
+    # same output as Flask's default JSON provider in compact mode
+    return json.dumps(obj, sort_keys=True, ensure_ascii=True, separators=(',', ':'))
+
+
+class PlatformCatalog:
+    def __init__(self, data: Dict[str, Any]):
+        categories: Dict[str, List[Dict[str, Any]]] = data['categories']
+        self.platforms: List[Dict[str, Any]] = []  # read-only; shared across requests
+        positions: Dict[str, List[int]] = {}
+        for category, platforms in categories.items():
+            positions[category] = []
+            for p in platforms:
+                positions[category].append(len(self.platforms))
+                self.platforms.append(p)
+        # interest == category key: the category's platforms in catalog order
+        self._by_category = {
+            level: {c: tuple(i for i in pos if self.platforms[i]['level'] in allowed) for c, pos in positions.items()}
+            for level, allowed in LEVEL_FILTERS.items()
+        }
+        # local platforms matched on their own 'interests', kept in this order
+        self._local = [i for c in data['nepali_categories'] for i in positions.get(c, [])]
+        self._local_by_interest: Dict[str, Dict[str, frozenset]] = {}
+        for level, allowed in LEVEL_FILTERS.items():
+            index: Dict[str, set] = {}
+            for rank, i in enumerate(self._local):
+                if self.platforms[i]['level'] in allowed:
+                    for interest in self.platforms[i].get('interests', []):
+                        index.setdefault(interest, set()).add(rank)
+            self._local_by_interest[level] = {k: frozenset(v) for k, v in index.items()}
+        self._popular = tuple(positions[c][n] for c, n in data['popular'])
+        self._placeholder = len(self.platforms)
+        self.platforms.append(data['placeholder'])
+        self.fragments = [_fragment(p) for p in self.platforms]
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_PATH) -> 'PlatformCatalog':
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def select(self, interests: Sequence[str], level: str) -> List[int]:
+        """
+        Positions of the platforms to show, in display order: category matches
+        per interest (repeats included), then local platforms matching any
+        interest, then popular local platforms if fewer than 3, capped at 12.
+        """
+        selected: List[int] = []
+        by_category = self._by_category.get(level, {})
+        for interest in interests:
+            selected.extend(by_category.get(interest, ()))
+        local = self._local_by_interest.get(level)
+        if local:
+            ranks = set()
+            for interest in interests:
+                ranks |= local.get(interest, frozenset())
+            selected.extend(self._local[r] for r in sorted(ranks))
+        if not interests or len(selected) < 3:
+            for i in self._popular:
+                if i not in selected:
+                    selected.append(i)
+        if not selected:
+            selected = [self._placeholder]
+        return selected[:MAX_RESULTS]
+
+    def recommend_json(self, interests: Any, level: Any, selected: List[int]) -> str:
+        """POST /recommend response body, byte-identical to jsonify() in compact mode."""
+        return (f'{{"interests":{_fragment(interests)},"level":{_fragment(level)},'
+                f'"platforms":[{",".join(self.fragments[i] for i in selected)}],"total":{len(selected)}}}\n')
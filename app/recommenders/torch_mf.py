@@ -0,0 +1,284 @@
+from typing import List, Dict, Any, Tuple, Optional, Iterable
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import numpy as np
+from scipy import sparse
+from .collaborative import CollaborativeRecommender
+from ..utils import topk
+
+
+def _with_row(buf: np.ndarray, n: int) -> np.ndarray:
+    """``buf`` with room for a zero row at index ``n``; capacity doubles, as in EventLog._append."""
+    if n < buf.shape[0]:
+        return buf
+    grown = np.zeros((max(2 * buf.shape[0], n + 1, 64), buf.shape[1]), dtype=buf.dtype)
+    grown[:n] = buf[:n]
+    return grown
+
+
+def _cg_block(C: sparse.csr_matrix, Y: np.ndarray, YtY: np.ndarray, X: np.ndarray, reg: float, steps: int):
+    """
+    A few conjugate-gradient steps on the implicit ALS normal equations for a
+    block of rows at once, updating X (block x factors) in place:
+
+        (YtY + Y^T (C_u - I) Y + reg * I) x_u = Y^T C_u p_u
+
+    C holds the confidence minus one (alpha * weight) for each observed pair.
+    """
+    rows = np.repeat(np.arange(C.shape[0]), np.diff(C.indptr))
+    Yi = Y[C.indices]
+
+    def apply(P):
+        # A @ p for every row of the block
+        t = np.einsum('nk,nk->n', Yi, P[rows]) * C.data
+        return P @ YtY + reg * P + sparse.csr_matrix((t, C.indices, C.indptr), shape=C.shape) @ Y
+
+    B = sparse.csr_matrix((C.data + 1.0, C.indices, C.indptr), shape=C.shape) @ Y
+    R = B - apply(X)
+    P = R.copy()
+    rs = np.einsum('bk,bk->b', R, R)
+    for _ in range(steps):
+        AP = apply(P)
+        a = rs / np.maximum(np.einsum('bk,bk->b', P, AP), 1e-20)
+        X += a[:, None] * P
+        R -= a[:, None] * AP
+        rs_new = np.einsum('bk,bk->b', R, R)
+        P = R + (rs_new / np.maximum(rs, 1e-20))[:, None] * P
+        rs = rs_new
+
+
+class ALSRecommender:
+    """
+    Implicit-feedback matrix factorization (ALS with conjugate-gradient
+    solves) over the same aggregated event weights as CollaborativeRecommender.
+    Confidence is 1 + alpha * weight. Rows are solved in blocks on a thread
+    pool; serving is one dot product against the item factors.
+
+    Drop-in for CollaborativeRecommender (fit/recommend/score_all/score_many,
+    get_state/set_state, add_event), selected with HybridRecommender(cf_mode='als').
+    """
+
+    mode = 'als'
+    # merge buffered new (user,item) pairs into the CSR once this many pile up
+    max_pending = 1024
+
+    def __init__(self, factors: int = 32, regularization: float = 0.1, alpha: float = 20.0,
+                 iterations: int = 10, cg_steps: int = 3, block_size: int = 1024,
+                 n_threads: Optional[int] = None, random_state: int = 0):
+        self.factors = factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.iterations = iterations
+        self.cg_steps = cg_steps
+        self.block_size = block_size  # rows per CG block / thread-pool task
+        self.n_threads = n_threads or os.cpu_count() or 1
+        self.random_state = random_state
+        self.user_index = {}
+        self.item_index = {}
+        self.counts = None  # sparse.csr_matrix of raw aggregated weights, kept for fold-in
+        # factor rows with spare capacity for users/items added online; the first
+        # len(self.users) / len(self.items) rows are live (see user_factors/item_factors)
+        self._user_buf: Optional[np.ndarray] = None
+        self._item_buf: Optional[np.ndarray] = None
+        self.users: List[str] = []
+        self.items: List[str] = []
+        self._YtY = None
+        self._pending: List[Tuple[int, int, float]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def user_factors(self) -> Optional[np.ndarray]:
+        """(users x factors)"""
+        return None if self._user_buf is None else self._user_buf[:len(self.users)]
+
+    @property
+    def item_factors(self) -> Optional[np.ndarray]:
+        """(items x factors)"""
+        return None if self._item_buf is None else self._item_buf[:len(self.items)]
+
+    _event_weight = staticmethod(CollaborativeRecommender._event_weight)
+    events_to_arrays = CollaborativeRecommender.events_to_arrays
+
+    def fit(self, events: List[Dict[str, Any]]):
+        self.fit_arrays(*self.events_to_arrays(events))
+
+    def fit_arrays(self, users: List[str], items: List[str], rows: np.ndarray, cols: np.ndarray, weights: np.ndarray):
+        """Fit from columnar interactions: rows/cols index into users/items."""
+        self.users = list(users)
+        self.items = list(items)
+        self.user_index = {u: i for i, u in enumerate(self.users)}
+        self.item_index = {it: i for i, it in enumerate(self.items)}
+        self._pending = []
+        counts = sparse.coo_matrix((weights, (rows, cols)), shape=(len(self.users), len(self.items))).tocsr()
+        counts.sum_duplicates()
+        self.counts = counts.astype(np.float32)
+        rng = np.random.default_rng(self.random_state)
+        X = (rng.standard_normal((len(self.users), self.factors)) * 0.01).astype(np.float32)
+        Y = (rng.standard_normal((len(self.items), self.factors)) * 0.01).astype(np.float32)
+        Cu = sparse.csr_matrix((self.alpha * self.counts.data, self.counts.indices, self.counts.indptr),
+                               shape=self.counts.shape)
+        Ci = Cu.T.tocsr()
+        if Cu.nnz:
+            with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+                for _ in range(self.iterations):
+                    self._solve(pool, Cu, Y, X)
+                    self._solve(pool, Ci, X, Y)
+        self._user_buf, self._item_buf = X, Y
+        self._YtY = None
+
+    def _solve(self, pool: ThreadPoolExecutor, C: sparse.csr_matrix, Y: np.ndarray, X: np.ndarray):
+        # rows of X given fixed Y; blocks write disjoint slices of X
+        YtY = Y.T @ Y
+        jobs = []
+        for start in range(0, C.shape[0], self.block_size):
+            stop = min(start + self.block_size, C.shape[0])
+            jobs.append(pool.submit(self._solve_block, C[start:stop], Y, YtY, X, start, stop))
+        for job in jobs:
+            job.result()
+
+    def _solve_block(self, C, Y, YtY, X, start, stop):
+        block = X[start:stop].copy()
+        _cg_block(C, Y, YtY, block, self.regularization, self.cg_steps)
+        X[start:stop] = block
+
+    def get_state(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """JSON-able metadata plus flat numpy arrays describing the fitted model."""
+        with self._lock:
+            if self.counts is None:
+                self._reset_empty()
+            if self._pending or self.counts.shape != (len(self.users), len(self.items)):
+                self._merge_pending()
+            meta = {'mode': self.mode, 'factors': self.factors, 'regularization': self.regularization,
+                    'alpha': self.alpha, 'users': list(self.users), 'items': list(self.items),
+                    'shape': list(self.counts.shape)}
+            arrays = {'counts_data': self.counts.data, 'indices': self.counts.indices, 'indptr': self.counts.indptr,
+                      'user_factors': self.user_factors, 'item_factors': self.item_factors}
+        return meta, arrays
+
+    def set_state(self, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        """Restore from get_state(); arrays may be read-only (memory-mapped or shared)."""
+        self.factors = meta['factors']
+        self.regularization = meta['regularization']
+        self.alpha = meta['alpha']
+        self.users = list(meta['users'])
+        self.items = list(meta['items'])
+        self.user_index = {u: i for i, u in enumerate(self.users)}
+        self.item_index = {it: i for i, it in enumerate(self.items)}
+        self._pending = []
+        self.counts = sparse.csr_matrix((arrays['counts_data'], arrays['indices'], arrays['indptr']),
+                                        shape=tuple(meta['shape']), copy=False)
+        self._user_buf = arrays['user_factors']
+        self._item_buf = arrays['item_factors']
+        self._YtY = None
+
+    def _reset_empty(self):
+        self.counts = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self._user_buf = np.zeros((0, self.factors), dtype=np.float32)
+        self._item_buf = np.zeros((0, self.factors), dtype=np.float32)
+
+    def add_event(self, evt: Dict[str, Any]):
+        """Fold a single event into the model without refitting."""
+        self.add_interaction(evt['user_id'], evt['item_id'], self._event_weight(evt))
+
+    def add_interaction(self, user_id: str, item_id: str, weight: float):
+        with self._lock:
+            if self.counts is None:
+                self._reset_empty()
+            if not self._user_buf.flags.writeable:
+                # state restored from a read-only snapshot: copy on first write
+                self._user_buf = np.array(self._user_buf)
+                self._item_buf = np.array(self._item_buf)
+                self.counts = self.counts.copy()
+            # grow into spare rows: readers hold views of the live rows, which stay valid
+            if user_id not in self.user_index:
+                self._user_buf = _with_row(self._user_buf, len(self.users))
+                self.user_index[user_id] = len(self.users)
+                self.users.append(user_id)
+            if item_id not in self.item_index:
+                # new items get a zero factor (score 0) until the next full fit
+                self._item_buf = _with_row(self._item_buf, len(self.items))
+                self.item_index[item_id] = len(self.items)
+                self.items.append(item_id)
+                # a zero row adds nothing to Y^T Y, so the cached product stays valid
+            ui = self.user_index[user_id]
+            ii = self.item_index[item_id]
+            start, end = self.counts.indptr[ui:ui + 2] if ui < self.counts.shape[0] else (0, 0)
+            hit = np.flatnonzero(self.counts.indices[start:end] == ii)
+            if hit.size:
+                self.counts.data[start + hit[0]] += weight
+            else:
+                self._pending.append((ui, ii, weight))
+            self._fold_in(ui)
+            if len(self._pending) >= self.max_pending:
+                self._merge_pending()
+
+    def _fold_in(self, ui: int):
+        # exact least-squares solve for one user's factor against the fixed item factors
+        Y = self.item_factors
+        if self._YtY is None:
+            self._YtY = Y.T.astype(np.float64) @ Y
+        weights: Dict[int, float] = {}
+        if ui < self.counts.shape[0]:
+            start, end = self.counts.indptr[ui:ui + 2]
+            weights.update(zip(self.counts.indices[start:end].tolist(), self.counts.data[start:end].tolist()))
+        for u, i, w in self._pending:
+            if u == ui:
+                weights[i] = weights.get(i, 0.0) + w
+        idx = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+        conf = self.alpha * np.fromiter(weights.values(), dtype=np.float64, count=len(weights))
+        Yu = Y[idx].astype(np.float64)
+        A = self._YtY + (Yu.T * conf) @ Yu + self.regularization * np.eye(self.factors)
+        b = Yu.T @ (conf + 1.0)
+        self.user_factors[ui] = np.linalg.solve(A, b)
+
+    def _merge_pending(self):
+        n_u, n_i = len(self.users), len(self.items)
+        counts = self.counts.copy()
+        counts.resize((n_u, n_i))
+        if self._pending:
+            r, c, w = zip(*self._pending)
+            counts = counts + sparse.csr_matrix((np.array(w, dtype=np.float32), (r, c)), shape=(n_u, n_i))
+        self._pending = []
+        counts = counts.tocsr()
+        counts.sum_duplicates()
+        self.counts = counts
+
+    def item_indices(self, item_ids: Iterable[str]) -> np.ndarray:
+        """Integer column indices of the given item ids; unknown ids are skipped."""
+        return np.fromiter((self.item_index[i] for i in item_ids if i in self.item_index), dtype=np.int64)
+
+    def score_all(self, user_id: str) -> Optional[np.ndarray]:
+        """Dense scores for every item in ``self.items``; None for unknown users."""
+        if self._user_buf is None or user_id not in self.user_index:
+            return None
+        with self._lock:
+            u_vec, Y = self.user_factors[self.user_index[user_id]], self.item_factors
+        return Y @ u_vec
+
+    def score_many(self, user_ids: List[str], cols: Optional[np.ndarray] = None) -> np.ndarray:
+        """Dense (len(user_ids) x len(self.items)) scores; zero rows for unknown users. ``cols`` restricts the items."""
+        width = len(cols) if cols is not None else None
+        if self._user_buf is None:
+            return np.zeros((len(user_ids), width or 0), dtype=np.float32)
+        with self._lock:
+            U, Y = self.user_factors, self.item_factors
+            rows = np.fromiter((self.user_index.get(u, -1) for u in user_ids), dtype=np.int64, count=len(user_ids))
+        if cols is not None:
+            Y = Y[cols]
+        known = rows >= 0
+        out = np.zeros((len(user_ids), Y.shape[0]), dtype=np.float32)
+        if known.any():
+            out[known] = U[rows[known]] @ Y.T
+        return out
+
+    def neighbor_scores(self, user_ids: List[str]) -> None:
+        # no item-neighbor table: candidate retrieval falls back to content neighbors
+        return None
+
+    def recommend(self, user_id: str, exclude_item_ids: List[str], top_k: int = 10) -> List[Tuple[str, float]]:
+        scores = self.score_all(user_id)
+        if scores is None:
+            return []
+        order = topk.top_k(scores, top_k, self.item_indices(exclude_item_ids))
+        return [(self.items[j], float(scores[j])) for j in order]
@@ -0,0 +1,124 @@
+"""
+Multi-process serving: one supervisor, N waitress workers on a shared socket.
+
+The supervisor binds the listening socket, fits (or loads) the model once on
+its own trainer and publishes every new snapshot to shared memory (see
+shared_model.py). Workers are spawned with REC_SHARED_MODEL set, so their
+_get_trainer() follows the published generations instead of fitting; memory
+for the model arrays therefore does not grow with the worker count.
+
+Writes (events, profiles, bandit feedback) and /train requests go into the
+shared delta log. Every worker folds the log into its live model, so a write
+served by one worker reaches the others within ``poll_interval`` without a
+refit; the supervisor folds it into its own trainer as well, so the next
+generation includes it. Full refits stay on the trainer's schedule
+(REC_RETRAIN_INTERVAL) and /train, and only those make workers swap
+generations and drop their ranking cache. Dead workers are respawned. Only
+the /metrics counters stay per worker.
+
+    python -m app.serving --workers 4 --port 5000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import socket
+import sys
+import threading
+
+
+def _serve_worker(sock: socket.socket, threads: int, lock):
+    from waitress import serve
+    from . import create_app
+    from . import main as app_main
+
+    app_main._DELTA_LOCK = lock
+
+    # exit through SystemExit so atexit hooks (write-behind flush) run
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    serve(create_app(), sockets=[sock], threads=threads)
+
+
+def _fold_delta(trainer, delta):
+    # a worker's write, folded into the supervisor's model for the next generation
+    if delta['kind'] == 'refit':
+        trainer.request_refit()
+    else:
+        # marks the trainer dirty, so the scheduled refit picks the write up from Mongo
+        trainer.apply_delta(delta)
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    return sock
+
+
+def run(workers: int, host: str = '0.0.0.0', port: int = 5000, threads: int = 4, poll_interval: float = 1.0,
+        delta_slots: int = 32768):
+    from . import main as app_main
+    from .shared_model import ModelPublisher
+
+    sock = _listen(host, port)
+    prefix = f'rec{os.getpid()}'
+    publisher = ModelPublisher(prefix, delta_slots)
+    app_main._PUBLISHER = publisher
+    stop = threading.Event()
+    procs = []
+    try:
+        trainer = app_main._get_trainer()
+        if publisher.generation == 0:
+            # loaded from a disk snapshot (or the first fit failed): nothing published yet
+            publisher.publish(trainer.current)
+        # spawned workers inherit the environment at start
+        os.environ['REC_SHARED_MODEL'] = prefix
+        ctx = mp.get_context('spawn')
+        lock = ctx.Lock()
+
+        def spawn(i):
+            p = ctx.Process(target=_serve_worker, args=(sock, threads, lock), name=f'web-{i}', daemon=True)
+            p.start()
+            return p
+
+        procs = [spawn(i) for i in range(workers)]
+        print(f"Serving on http://{host}:{port} with {workers} workers (model generation {publisher.generation})")
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+        while not stop.wait(poll_interval):
+            _, overrun = publisher.consume(lambda delta: _fold_delta(trainer, delta))
+            if overrun:
+                # the refit reloads events from Mongo; missed feedback only lacks from what new workers start with
+                print(f"Delta log overran the supervisor ({delta_slots} slots); refitting")
+                trainer.request_refit()
+            for i, p in enumerate(procs):
+                if not p.is_alive():
+                    print(f"Worker {p.name} exited with {p.exitcode}; restarting")
+                    procs[i] = spawn(i)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join(timeout=10)
+        app_main._PUBLISHER = None
+        publisher.close()
+        sock.close()
+        if app_main._WRITES is not None:
+            app_main._WRITES.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', '2')))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', '4')), help='waitress threads per worker')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '5000')))
+    args = parser.parse_args()
+    run(args.workers, args.host, args.port, args.threads,
+        float(os.getenv('REC_SHARED_POLL_S', '1')), int(os.getenv('REC_SHARED_DELTA_SLOTS', '32768')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,450 @@
+"""
+Publishing fitted models through POSIX shared memory for multi-process serving.
+
+The supervisor (app.serving) owns the model: each published snapshot becomes
+one shared memory segment ``<prefix>-<generation>`` laid out as
+
+    [8-byte header length][header JSON][64-byte aligned arrays from get_state()]
+
+and a small control segment ``<prefix>-ctl`` holds int64 counters (current
+generation, delta log head and size). Workers attach each generation
+read-only and rebuild a HybridRecommender over views into the segment, so the
+large arrays (TF-IDF and CF matrices, seen lists) exist once per host however
+many workers run.
+
+Writes travel as deltas (see trainer.apply_delta) through a third segment,
+``<prefix>-deltas`` (DeltaLog): every process folds them in log order, so a
+write served by one worker reaches the others without a refit. A generation
+records the last delta it covers; workers swapping to it replay the rest.
+"""
+import json
+import logging
+import struct
+import threading
+import time
+from datetime import timedelta
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId, json_util
+
+from .recommenders.hybrid import HybridRecommender
+from .trainer import ModelSnapshot, apply_delta
+
+log = logging.getLogger(__name__)
+
+# control block slots
+GENERATION, DELTA_HEAD, DELTA_SLOTS = 0, 1, 2
+_CONTROL_SLOTS = 8
+_ALIGN = 64
+# generations kept attachable; older segments are unlinked (mapped views stay valid)
+KEEP_GENERATIONS = 2
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _segment_name(prefix: str, generation: int) -> str:
+    return f'{prefix}-{generation}'
+
+
+def _control(shm: shared_memory.SharedMemory) -> np.ndarray:
+    return np.ndarray((_CONTROL_SLOTS,), dtype=np.int64, buffer=shm.buf)
+
+
+class _Segment(shared_memory.SharedMemory):
+    def __del__(self):
+        try:
+            self.close()
+        except BufferError:
+            # arrays over it are still alive (interpreter exit); the OS unmaps it
+            pass
+
+
+class DeltaLog:
+    """
+    Ring of serialized writes shared by the supervisor and its workers.
+
+    Each 256-byte slot holds [int64 seq][int32 parts][int32 length][payload];
+    a record longer than one slot takes consecutive sequence numbers and is
+    identified by the last one. ``control[DELTA_HEAD]`` is the newest sequence
+    number. Appends are serialized by ``lock`` (a multiprocessing.Lock shared
+    by all writers). Readers take no lock: they check a slot's sequence number
+    before and after copying it, and report an overrun once writers have
+    wrapped around past them (the caller then needs a fresh generation).
+    """
+
+    SLOT = 256
+    _PAYLOAD = SLOT - 16
+
+    def __init__(self, prefix: str, control: np.ndarray, slots: int = 0, lock=None):
+        create = slots > 0
+        if create:
+            control[DELTA_SLOTS] = slots
+        self.slots = int(control[DELTA_SLOTS])
+        self.control = control
+        self._shm = shared_memory.SharedMemory(name=f'{prefix}-deltas', create=create, size=self.slots * self.SLOT)
+        self._buf = self._shm.buf
+        # slot sequence numbers as aligned int64 stores
+        self._seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=self._buf, strides=(self.SLOT,))
+        if create:
+            self._seqs[:] = -1
+        # only safe across processes with a multiprocessing lock (app.serving passes one)
+        self._lock = lock if lock is not None else threading.Lock()
+
+    @property
+    def head(self) -> int:
+        return int(self.control[DELTA_HEAD])
+
+    def append(self, delta: Dict[str, Any]) -> int:
+        """Log one delta; returns its sequence number."""
+        data = json_util.dumps(delta).encode('utf-8')
+        parts = max(1, -(-len(data) // self._PAYLOAD))
+        if parts > self.slots // 4:
+            raise ValueError(f'delta of {len(data)} bytes does not fit the log')
+        with self._lock:
+            head = self.head
+            for k in range(parts):
+                seq = head + 1 + k
+                i = seq % self.slots
+                off = i * self.SLOT
+                chunk = data[k * self._PAYLOAD:(k + 1) * self._PAYLOAD]
+                # invalidate first: a reader copying this slot sees the change
+                self._seqs[i] = -1
+                struct.pack_into('<ii', self._buf, off + 8, parts if k == 0 else 0, len(chunk))
+                self._buf[off + 16:off + 16 + len(chunk)] = chunk
+                self._seqs[i] = seq
+            self.control[DELTA_HEAD] = head + parts
+        return head + parts
+
+    def _slot(self, seq: int) -> Optional[Tuple[int, bytes]]:
+        i = seq % self.slots
+        if self._seqs[i] != seq:
+            return None
+        off = i * self.SLOT
+        parts, length = struct.unpack_from('<ii', self._buf, off + 8)
+        data = bytes(self._buf[off + 16:off + 16 + length])
+        if self._seqs[i] != seq:
+            return None
+        return parts, data
+
+    def read(self, after: int) -> Tuple[List[Tuple[int, Dict[str, Any]]], int, bool]:
+        """Deltas logged after sequence number ``after``: ([(seq, delta)], new position, overrun)."""
+        head = self.head
+        if head - after > self.slots:
+            return [], head, True
+        records = []
+        pos = after
+        while pos < head:
+            first = self._slot(pos + 1)
+            if first is None:
+                return records, head, True
+            parts, data = first
+            chunks = [data]
+            for k in range(1, parts):
+                part = self._slot(pos + 1 + k)
+                if part is None:
+                    return records, head, True
+                chunks.append(part[1])
+            pos += parts
+            records.append((pos, json_util.loads(b''.join(chunks).decode('utf-8'))))
+        return records, pos, False
+
+    def close(self, unlink: bool = False):
+        del self._seqs, self._buf
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+class _LoadedEvents:
+    """``EventLog.contains`` for the events a published snapshot was fit on."""
+
+    def __init__(self, watermark: Optional[str], recent: List[str], overlap_seconds: float):
+        self.watermark = ObjectId(watermark) if watermark else None
+        self.recent = {ObjectId(i) for i in recent}
+        self.overlap = timedelta(seconds=overlap_seconds)
+
+    def contains(self, event_id: Any) -> bool:
+        if not isinstance(event_id, ObjectId) or self.watermark is None:
+            return False
+        if event_id in self.recent:
+            return True
+        return event_id.generation_time < self.watermark.generation_time - self.overlap
+
+
+class ModelPublisher:
+    """
+    Supervisor side: writes snapshots into new segments and bumps the
+    generation, and reads the workers' deltas (``consume``) into its own
+    trainer so later builds and publishes include them.
+    """
+
+    def __init__(self, prefix: str, delta_slots: int = 32768):
+        self.prefix = prefix
+        self._control_shm = shared_memory.SharedMemory(name=f'{prefix}-ctl', create=True,
+                                                       size=_CONTROL_SLOTS * 8)
+        self.control = _control(self._control_shm)
+        self.control[:] = 0
+        self.deltas = DeltaLog(prefix, self.control, slots=delta_slots)
+        # last delta folded into the trainer; published with each generation
+        self.applied = 0
+        self._segments: List[shared_memory.SharedMemory] = []
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return int(self.control[GENERATION])
+
+    def consume(self, apply: Callable[[Dict[str, Any]], None]) -> Tuple[int, bool]:
+        """Pass deltas logged since the last call to ``apply``, in order; returns (count, overrun)."""
+        with self._lock:
+            records, self.applied, overrun = self.deltas.read(self.applied)
+            for _, delta in records:
+                try:
+                    apply(delta)
+                except Exception:
+                    log.exception("Failed to apply %s delta", delta.get('kind'))
+        return len(records), overrun
+
+    def publish(self, snap: ModelSnapshot) -> int:
+        # under the lock: the state copied and the delta position it covers must agree
+        with self._lock:
+            meta, arrays = snap.rec.get_state()
+            layout: Dict[str, list] = {}
+            pos = 0
+            for key, arr in arrays.items():
+                arr = np.ascontiguousarray(arr)
+                pos = _align(pos)
+                layout[key] = [arr.dtype.str, list(arr.shape), pos]
+                pos += arr.nbytes
+            watermark, recent = snap.log.loaded_ids() if snap.log is not None else (None, [])
+            header = json.dumps({
+                'version': snap.version,
+                'built_at': snap.built_at,
+                'meta': meta,
+                'users': list(snap.users.values()),
+                'arrays': layout,
+                'events': {'watermark': watermark, 'recent': recent,
+                           'overlap': snap.log.overlap.total_seconds() if snap.log is not None else 0.0},
+                'deltas': self.applied,
+                # for workers starting up; running ones keep their own store
+                'bandits': [[r['user_id'], r['arm'], r['count'], r['total_reward']] for r in snap.rec.bandits.rows()],
+            }, default=str).encode('utf-8')
+            start = _align(8 + len(header))
+
+            generation = self.generation + 1
+            shm = shared_memory.SharedMemory(name=_segment_name(self.prefix, generation), create=True,
+                                             size=start + _align(pos) + _ALIGN)
+            shm.buf[:8] = struct.pack('<Q', len(header))
+            shm.buf[8:8 + len(header)] = header
+            for key, (dtype, shape, offset) in layout.items():
+                view = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf, offset=start + offset)
+                view[...] = arrays[key]
+                del view
+            # the segment outlives this mapping until unlinked
+            shm.close()
+            self._segments.append(shm)
+            # a single aligned store: workers see either generation, never a torn one
+            self.control[GENERATION] = generation
+            while len(self._segments) > KEEP_GENERATIONS:
+                self._segments.pop(0).unlink()
+        return generation
+
+    def close(self):
+        with self._lock:
+            for shm in self._segments:
+                shm.unlink()
+            self._segments = []
+            self.deltas.close(unlink=True)
+            del self.control
+            self._control_shm.close()
+            self._control_shm.unlink()
+
+
+def read_segment(shm: shared_memory.SharedMemory,
+                 rec: HybridRecommender) -> Tuple[ModelSnapshot, _LoadedEvents, int, List[Dict[str, Any]]]:
+    """
+    Restore ``rec`` from a published segment; its arrays are read-only views
+    into shared memory. Also returns the last delta the generation covers and
+    its bandit state as rl_state-shaped rows.
+    """
+    (length,) = struct.unpack('<Q', bytes(shm.buf[:8]))
+    doc = json.loads(bytes(shm.buf[8:8 + length]).decode('utf-8'))
+    start = _align(8 + length)
+    arrays = {}
+    for key, (dtype, shape, offset) in doc['arrays'].items():
+        count = int(np.prod(shape))
+        if count == 0:
+            arrays[key] = np.zeros(tuple(shape), dtype=np.dtype(dtype))
+            continue
+        # frombuffer holds a buffer export, so the mapping cannot be closed under a live array
+        arr = np.frombuffer(shm.buf, dtype=np.dtype(dtype), count=count, offset=start + offset).reshape(shape)
+        # incremental updates copy on first write instead of touching the shared pages
+        arr.flags.writeable = False
+        arrays[key] = arr
+    rec.set_state(doc['meta'], arrays)
+    users = {u['_id']: u for u in doc['users']}
+    events = doc['events']
+    loaded = _LoadedEvents(events['watermark'], events['recent'], events['overlap'])
+    bandits = [{'user_id': u, 'arm': a, 'count': c, 'total_reward': r} for u, a, c, r in doc['bandits']]
+    snap = ModelSnapshot(rec, rec.items, None, users, doc['version'], doc['built_at'])
+    return snap, loaded, doc['deltas'], bandits
+
+
+class SharedModelReader:
+    """
+    Worker side. Stands in for BackgroundTrainer in a worker process: serves
+    the newest published generation and swaps to a new one when the control
+    block's generation moves (checked every ``poll_interval`` seconds).
+
+    Writes go through the delta log rather than straight into the model:
+    ``apply_delta`` appends the write, then folds everything logged since the
+    last fold (other workers' writes included) into the live snapshot, so
+    this worker sees its own write at once and every worker applies the same
+    writes in the same order. The poll folds in other workers' writes between
+    requests. ``on_delta`` gets the user id of each event or profile folded.
+
+    On a swap, deltas after the generation's position are replayed onto it
+    (skipping events it was already fit on). Bandit state is not replaced:
+    the live BanditStore already holds every feedback delta folded so far
+    and carries over; only the first generation seeds it from the published
+    state.
+    """
+
+    def __init__(self, prefix: str, make_rec: Callable[[], HybridRecommender],
+                 on_publish: Optional[Callable[[ModelSnapshot], None]] = None, poll_interval: float = 1.0,
+                 lock=None, on_delta: Optional[Callable[[str], None]] = None):
+        self.prefix = prefix
+        self._make_rec = make_rec
+        self._on_publish = on_publish
+        self._on_delta = on_delta
+        self.poll_interval = poll_interval
+        self._control_shm = shared_memory.SharedMemory(name=f'{prefix}-ctl')
+        self.control = _control(self._control_shm)
+        self.deltas = DeltaLog(prefix, self.control, lock=lock)
+        self.generation = 0
+        self._current = ModelSnapshot(make_rec(), [], None, {}, 0, time.time())
+        self._loaded: Optional[_LoadedEvents] = None
+        # last delta folded into the current snapshot
+        self.position = 0
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._retired: List[shared_memory.SharedMemory] = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> ModelSnapshot:
+        return self._current
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='rec-shared-model', daemon=True)
+            self._thread.start()
+
+    def request_refit(self):
+        # the supervisor refits on its trainer thread when it reads this
+        self.deltas.append({'kind': 'refit'})
+
+    def apply_delta(self, delta: Dict[str, Any]):
+        self.deltas.append(delta)
+        self.catch_up()
+
+    def catch_up(self) -> int:
+        """Fold deltas logged since the last fold into the live snapshot; returns how many."""
+        with self._lock:
+            records, overrun, users = self._fold(self._current, self._loaded, self.position, self.position)
+        self._after_fold(overrun, users)
+        return records
+
+    def _fold(self, snap: ModelSnapshot, loaded: Optional[_LoadedEvents], model_after: int,
+              bandits_after: int) -> Tuple[int, bool, set]:
+        # caller holds self._lock; model and bandit state may cover different positions
+        records, self.position, overrun = self.deltas.read(min(model_after, bandits_after))
+        users = set()
+        for seq, delta in records:
+            kind = delta['kind']
+            if kind == 'refit' or seq <= (bandits_after if kind == 'feedback' else model_after):
+                continue
+            if kind == 'event' and loaded is not None and loaded.contains(delta['event'].get('_id')):
+                continue
+            try:
+                apply_delta(snap, delta)
+            except Exception:
+                log.exception("Failed to apply %s delta", kind)
+                continue
+            if kind == 'event':
+                users.add(delta['event']['user_id'])
+            elif kind == 'user':
+                users.add(delta['user']['_id'])
+        return len(records), overrun, users
+
+    def _after_fold(self, overrun: bool, users: set):
+        if overrun:
+            # writes were lost to this worker; a fresh generation brings them back
+            log.warning("Delta log overran this worker (%d slots); requesting a refit", self.deltas.slots)
+            self.request_refit()
+        if self._on_delta is not None:
+            for user_id in users:
+                self._on_delta(user_id)
+
+    def refresh(self) -> bool:
+        """Swap to the newest generation if it changed; returns whether it did."""
+        with self._refresh_lock:
+            generation = int(self.control[GENERATION])
+            if generation == self.generation:
+                return False
+            try:
+                shm = _Segment(name=_segment_name(self.prefix, generation))
+            except FileNotFoundError:
+                # superseded while we looked; the next poll picks up the newer one
+                return False
+            try:
+                snap, loaded, position, bandits = read_segment(shm, self._make_rec())
+            except Exception as e:
+                self.last_error = str(e)
+                shm.close()
+                return False
+            self.last_error = None
+            first = self.generation == 0
+            if first:
+                snap.rec.bandits.load(bandits)
+            with self._lock:
+                if not first:
+                    snap.rec.bandits = self._current.rec.bandits
+                # writes logged after the build: the new generation has not seen them
+                _, overrun, users = self._fold(snap, loaded, position, position if first else self.position)
+                self._current = snap
+                self._loaded = loaded
+                self.generation = generation
+                if self._shm is not None:
+                    self._retired.append(self._shm)
+                self._shm = shm
+            self._close_retired()
+        self._after_fold(overrun, users)
+        if self._on_publish is not None:
+            self._on_publish(snap)
+        return True
+
+    def _close_retired(self):
+        # a previous generation's mapping can only be closed once no request holds its arrays
+        still_used = []
+        for shm in self._retired:
+            try:
+                shm.close()
+            except BufferError:
+                still_used.append(shm)
+        self._retired = still_used
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.refresh()
+                self.catch_up()
+            except Exception as e:
+                self.last_error = str(e)
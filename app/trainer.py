@@ -0,0 +1,192 @@
+"""
+Background retraining with an atomically swapped model snapshot.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .recommenders.hybrid import HybridRecommender
+from .utils.event_log import EventLog
+
+log = logging.getLogger(__name__)
+
+
+class ModelSnapshot(NamedTuple):
+    rec: HybridRecommender
+    items: List[Dict[str, Any]]
+    log: Optional[EventLog]  # events the model was fit on; None for a snapshot loaded from disk
+    users: Dict[str, Dict[str, Any]]
+    version: int
+    built_at: float
+
+
+# (event _id or None, fn applying the write to a snapshot)
+Update = Tuple[Any, Callable[[ModelSnapshot], None]]
+
+
+def apply_delta(snap: ModelSnapshot, delta: Dict[str, Any]):
+    """
+    Fold one incremental write into a snapshot. Writes are plain documents so
+    that app.serving workers can pass them to each other (shared_model.DeltaLog):
+    ``{'kind': 'event', 'event': {...}}``, ``{'kind': 'user', 'user': {...}}``
+    or ``{'kind': 'feedback', 'user_id', 'item_id', 'reward'}``.
+    """
+    kind = delta['kind']
+    if kind == 'event':
+        snap.rec.add_event(delta['event'])
+    elif kind == 'user':
+        user_id = delta['user']['_id']
+        user = dict(snap.users.get(user_id, {}))
+        user.update(delta['user'])
+        snap.users[user_id] = user
+        snap.rec.invalidate_user(user_id)
+    elif kind == 'feedback':
+        snap.rec.feedback(delta['user_id'], delta['item_id'], delta['reward'])
+    else:
+        raise ValueError(f'unknown delta kind: {kind}')
+
+
+class BackgroundTrainer:
+    """
+    Builds new snapshots off the request path and publishes each with a single
+    reference swap, so readers always see one complete model.
+
+    Writes that land while a build is running are recorded and replayed onto
+    the new snapshot before it is published (skipping events the build already
+    loaded). Event writes are also kept until a published build has loaded
+    them: one still waiting in the write-behind queue (or its retries) when a
+    build reads Mongo is replayed onto that build instead of being lost.
+    ``interval`` > 0 refits on a schedule whenever writes arrived since the
+    last build; ``request_refit`` queues an immediate one.
+
+    At most ``max_unloaded`` such writes are kept (builds failing while Mongo
+    is down would otherwise grow the list forever); the oldest are dropped
+    beyond that, with a warning. A dropped event stays in the live model and
+    is loaded by the next build that finds it in Mongo.
+    """
+
+    def __init__(self, build: Callable[[int], ModelSnapshot], initial: ModelSnapshot, interval: float = 0.0,
+                 on_publish: Optional[Callable[[ModelSnapshot], None]] = None, max_unloaded: int = 100000):
+        self._build = build
+        self._on_publish = on_publish
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._current = initial
+        self._version = initial.version
+        self._dirty = False
+        self._building = False
+        self._inflight: List[Update] = []
+        # keyed (event) writes no published build has loaded yet
+        self._unloaded: List[Update] = []
+        self.max_unloaded = max_unloaded
+        self.dropped_unloaded = 0
+        self._thread = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> ModelSnapshot:
+        return self._current
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='rec-trainer', daemon=True)
+            self._thread.start()
+
+    def mark_dirty(self):
+        self._dirty = True
+
+    def request_refit(self):
+        self._wake.set()
+
+    def apply(self, key: Any, fn: Callable[[ModelSnapshot], None]):
+        """Apply an incremental write to the live snapshot and remember it for an in-progress build."""
+        with self._lock:
+            fn(self._current)
+            if self._building:
+                self._inflight.append((key, fn))
+            elif key is not None:
+                self._unloaded.append((key, fn))
+                self._trim_unloaded()
+            self._dirty = True
+
+    def apply_delta(self, delta: Dict[str, Any]):
+        """``apply`` for a write described as a document (see ``apply_delta``)."""
+        if delta['kind'] == 'feedback':
+            # bandit state carries over to every new build: applied once, never replayed
+            apply_delta(self._current, delta)
+            return
+        key = delta['event'].get('_id') if delta['kind'] == 'event' else None
+        events = self._current.log
+        if key is not None and events is not None and events.contains(key):
+            # a build already read it from Mongo (the supervisor sees worker writes late)
+            return
+        self.apply(key, lambda snap: apply_delta(snap, delta))
+
+    def _trim_unloaded(self):
+        # caller holds the lock
+        extra = len(self._unloaded) - self.max_unloaded
+        if extra <= 0:
+            return
+        if not self.dropped_unloaded:
+            log.warning("More than %d writes waiting for a build to load them (last build error: %s); "
+                        "dropping the oldest", self.max_unloaded, self.last_error)
+        del self._unloaded[:extra]
+        self.dropped_unloaded += extra
+
+    def refit_now(self) -> bool:
+        with self._lock:
+            self._building = True
+            self._inflight = []
+            self._dirty = False
+            version = self._version + 1
+        try:
+            snap = self._build(version)
+        except Exception as e:
+            # keep serving the previous snapshot if the DB isn't available
+            self.last_error = str(e)
+            with self._lock:
+                self._unloaded += [u for u in self._inflight if u[0] is not None]
+                self._trim_unloaded()
+                self._inflight = []
+                self._building = False
+                self._dirty = True
+            return False
+        self.last_error = None
+        with self._lock:
+            unloaded = []
+            for key, fn in self._unloaded + self._inflight:
+                if key is None or snap.log is None or not snap.log.contains(key):
+                    fn(snap)
+                    if key is not None:
+                        unloaded.append((key, fn))
+            self._unloaded = unloaded
+            self._trim_unloaded()
+            if self.dropped_unloaded:
+                log.warning("Dropped %d writes waiting for a build to load them", self.dropped_unloaded)
+                self.dropped_unloaded = 0
+            # bandit state is learned online, not from the refit data
+            snap.rec.bandits = self._current.rec.bandits
+            self._inflight = []
+            self._building = False
+            self._version = version
+            self._current = snap
+        if self._on_publish is not None:
+            self._on_publish(snap)
+        return True
+
+    def _run(self):
+        last = time.monotonic()
+        while True:
+            timeout = self.interval if self.interval > 0 else None
+            requested = self._wake.wait(timeout)
+            self._wake.clear()
+            due = self.interval > 0 and self._dirty and time.monotonic() - last >= self.interval
+            if requested or due:
+                self.refit_now()
+                last = time.monotonic()
@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DiskCache:
+    """
+    JSON values in a SQLite file, keyed by (namespace, key) with a wall-clock
+    expiry. One connection per thread; WAL mode so readers don't block the writer.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._conn().execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL, '
+            'PRIMARY KEY (ns, key))'
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, ns: str, key: str) -> Optional[tuple]:
+        """(value, seconds left) or None if missing/expired."""
+        row = self._conn().execute('SELECT value, expires FROM cache WHERE ns = ? AND key = ?', (ns, key)).fetchone()
+        if row is None:
+            return None
+        left = row[1] - time.time()
+        if left <= 0:
+            self._conn().execute('DELETE FROM cache WHERE ns = ? AND key = ?', (ns, key))
+            return None
+        return json.loads(row[0]), left
+
+    def set(self, ns: str, key: str, value: Any, ttl: float):
+        self._conn().execute('INSERT OR REPLACE INTO cache (ns, key, value, expires) VALUES (?, ?, ?, ?)',
+                             (ns, key, json.dumps(value), time.time() + ttl))
+
+    def purge_expired(self) -> int:
+        return self._conn().execute('DELETE FROM cache WHERE expires <= ?', (time.time(),)).rowcount
+
+
+class TieredCache:
+    """In-memory TTLCache in front of an optional DiskCache namespace; disk hits are promoted to memory."""
+
+    def __init__(self, namespace: str, ttl: float, maxsize: int = 1000, disk: Optional[DiskCache] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk = disk
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'disk_errors': 0}
+        # counters are bumped from concurrent request threads
+        self._lock = threading.Lock()
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+        if self.disk is not None:
+            try:
+                found = self.disk.get(self.namespace, key)
+            except sqlite3.Error:
+                self._count('disk_errors')
+                found = None
+            if found is not None:
+                value, left = found
+                self.memory.set(key, value, ttl=min(left, self.ttl))
+                self._count('disk_hits')
+                return value
+        self._count('misses')
+        return None
+
+    def set(self, key: str, value: Any):
+        if self.ttl <= 0:
+            return
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(self.namespace, key, value, self.ttl)
+            except sqlite3.Error:
+                self._count('disk_errors')
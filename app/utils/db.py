@@ -1,6 +1,7 @@
 import os
 from typing import Tuple
 from pymongo import MongoClient
+from . import metrics
 
 _client = None
 _db = None
@@ -11,6 +12,6 @@ def get_client_and_db() -> Tuple[MongoClient, str]:
     if _client is None:
         uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
         db_name = os.getenv('MONGO_DB', 'learning_rec')
-        _client = MongoClient(uri)
+        _client = MongoClient(uri, event_listeners=metrics.mongo_listeners())
         _db = _client[db_name]
     return _client, _db
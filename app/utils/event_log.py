@@ -0,0 +1,145 @@
+"""
+Columnar, incrementally synced copy of the events collection.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+
+def _to_epoch(ts: Any) -> float:
+    if isinstance(ts, datetime):
+        dt = ts
+    elif isinstance(ts, str):
+        try:
+            dt = datetime.fromisoformat(ts)
+        except ValueError:
+            return float('nan')
+    elif isinstance(ts, (int, float)):
+        return float(ts)
+    else:
+        return float('nan')
+    if dt.tzinfo is None:
+        # the app writes naive UTC timestamps (datetime.utcnow())
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class EventLog:
+    """
+    Events as compact parallel arrays (user idx, item idx, weight, ts) plus
+    user/item vocabularies, loaded by streaming a cursor in batches.
+
+    ``sync`` remembers a high-water mark on ``_id`` and later fetches only
+    newer events. ObjectIds from concurrent writers are only roughly ordered,
+    so each sync re-reads an ``overlap`` window behind the mark and drops ids
+    it already holds. Events are expected to carry ObjectId ``_id``s (the
+    default for inserts).
+    """
+
+    def __init__(self, weight_fn: Callable[[Dict[str, Any]], float], overlap_seconds: float = 300.0):
+        self.weight_fn = weight_fn
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.users: List[str] = []
+        self.items: List[str] = []
+        self.user_index: Dict[str, int] = {}
+        self.item_index: Dict[str, int] = {}
+        self.watermark: Optional[ObjectId] = None
+        self._recent: Dict[ObjectId, None] = {}  # ids inside the overlap window
+        self._n = 0
+        self._user_idx = np.zeros(0, dtype=np.int32)
+        self._item_idx = np.zeros(0, dtype=np.int32)
+        self._weight = np.zeros(0, dtype=np.float32)
+        self._ts = np.zeros(0, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def user_idx(self) -> np.ndarray:
+        return self._user_idx[:self._n]
+
+    @property
+    def item_idx(self) -> np.ndarray:
+        return self._item_idx[:self._n]
+
+    @property
+    def weight(self) -> np.ndarray:
+        return self._weight[:self._n]
+
+    @property
+    def ts(self) -> np.ndarray:
+        return self._ts[:self._n]
+
+    def contains(self, event_id: Any) -> bool:
+        """Whether an event with this _id has already been loaded."""
+        if not isinstance(event_id, ObjectId) or self.watermark is None:
+            return False
+        if event_id in self._recent:
+            return True
+        # older than the overlap window: every sync since has covered it
+        return event_id.generation_time < self.watermark.generation_time - self.overlap
+
+    def loaded_ids(self) -> Tuple[Optional[ObjectId], List[ObjectId]]:
+        """(watermark, ids inside the overlap window): enough to answer ``contains`` elsewhere."""
+        return self.watermark, list(self._recent)
+
+    def sync(self, collection, batch_size: int = 5000) -> int:
+        """Fetch events newer than the watermark; returns how many were added."""
+        query = {}
+        if self.watermark is not None:
+            since = self.watermark.generation_time - self.overlap
+            query = {'_id': {'$gte': ObjectId.from_datetime(since)}}
+        projection = {'user_id': 1, 'item_id': 1, 'type': 1, 'score': 1, 'ts': 1}
+        cursor = collection.find(query, projection).sort('_id', 1).batch_size(batch_size)
+        added = 0
+        chunk = []
+        for doc in cursor:
+            if doc['_id'] in self._recent:
+                continue
+            chunk.append(doc)
+            if len(chunk) >= batch_size:
+                added += self._append(chunk)
+                chunk = []
+        added += self._append(chunk)
+        self._trim_recent()
+        return added
+
+    def _code(self, index: Dict[str, int], vocab: List[str], key: str) -> int:
+        code = index.get(key)
+        if code is None:
+            code = index[key] = len(vocab)
+            vocab.append(key)
+        return code
+
+    def _append(self, docs: List[Dict[str, Any]]) -> int:
+        n = len(docs)
+        if not n:
+            return 0
+        end = self._n + n
+        if end > self._user_idx.size:
+            cap = max(end, 2 * self._user_idx.size, 1024)
+            self._user_idx = np.resize(self._user_idx, cap)
+            self._item_idx = np.resize(self._item_idx, cap)
+            self._weight = np.resize(self._weight, cap)
+            self._ts = np.resize(self._ts, cap)
+        sl = slice(self._n, end)
+        self._user_idx[sl] = [self._code(self.user_index, self.users, d['user_id']) for d in docs]
+        self._item_idx[sl] = [self._code(self.item_index, self.items, d['item_id']) for d in docs]
+        self._weight[sl] = [self.weight_fn(d) for d in docs]
+        self._ts[sl] = [_to_epoch(d.get('ts')) for d in docs]
+        self._n = end
+        for d in docs:
+            oid = d['_id']
+            if isinstance(oid, ObjectId):
+                self._recent[oid] = None
+                if self.watermark is None or oid > self.watermark:
+                    self.watermark = oid
+        return n
+
+    def _trim_recent(self):
+        if self.watermark is None:
+            return
+        cutoff = self.watermark.generation_time - self.overlap
+        self._recent = {oid: None for oid in self._recent if oid.generation_time >= cutoff}
@@ -0,0 +1,175 @@
+"""
+In-process counters and histograms, rendered in the Prometheus text format
+by GET /metrics.
+
+METRICS_ENABLED=0 (read once at import) disables everything: request hooks
+and the Mongo listener are never installed, and ``stages()`` hands back a
+shared no-op object, so instrumented code paths do no timing work at all.
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from pymongo import monitoring
+
+ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+
+# seconds; covers sub-millisecond stages up to full refits
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, v in sorted(self._values.items()):
+                lines.append(f'{self.name}{_fmt_labels(self.labelnames, labels)} {v}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in sorted(self._values.items())]
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                cumulative += c
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_fmt_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_fmt_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{_fmt_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+        # callables returning (name, type, help, [(labels dict, value)]) for values owned elsewhere
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, list]]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        m = Counter(name, help, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        m = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(m)
+        return m
+
+    def register_collector(self, fn: Callable[[], Iterable[Tuple[str, str, str, list]]]):
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for fn in self._collectors:
+            for name, kind, help, samples in fn():
+                lines.extend([f'# HELP {name} {help}', f'# TYPE {name} {kind}'])
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f'{name}{_fmt_labels(names, tuple(labels[n] for n in names))} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram('rec_stage_seconds', 'Time spent per recommender stage.', ('op', 'stage'))
+HTTP_SECONDS = REGISTRY.histogram('http_request_duration_seconds', 'Request latency by endpoint.',
+                                  ('endpoint', 'method'))
+HTTP_REQUESTS = REGISTRY.counter('http_requests_total', 'Requests by endpoint and status.',
+                                 ('endpoint', 'method', 'status'))
+MONGO_SECONDS = REGISTRY.histogram('mongo_command_duration_seconds', 'Mongo command latency.', ('command',))
+MONGO_COMMANDS = REGISTRY.counter('mongo_commands_total', 'Mongo commands by result.', ('command', 'result'))
+
+
+class Stages:
+    """Times consecutive stages of one operation: each ``mark`` records the time since the previous one."""
+
+    __slots__ = ('op', '_t')
+
+    def __init__(self, op: str):
+        self.op = op
+        self._t = time.perf_counter()
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        STAGE_SECONDS.observe(now - self._t, self.op, stage)
+        self._t = now
+
+
+class _NoopStages:
+    __slots__ = ()
+
+    def mark(self, stage: str):
+        pass
+
+
+_NOOP_STAGES = _NoopStages()
+
+
+def stages(op: str):
+    return Stages(op) if ENABLED else _NOOP_STAGES
+
+
+class _MongoListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+        MONGO_COMMANDS.inc(event.command_name, 'ok')
+
+    def failed(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+        MONGO_COMMANDS.inc(event.command_name, 'error')
+
+
+def mongo_listeners() -> list:
+    """event_listeners for MongoClient; empty when metrics are disabled."""
+    return [_MongoListener()] if ENABLED else []
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,27 @@
+from typing import Optional
+import numpy as np
+
+
+def exclusion_mask(n: int, exclude_idx: Optional[np.ndarray]) -> np.ndarray:
+    """Boolean mask of length n that is True at the excluded integer positions."""
+    mask = np.zeros(n, dtype=bool)
+    if exclude_idx is not None and len(exclude_idx):
+        mask[np.asarray(exclude_idx, dtype=np.int64)] = True
+    return mask
+
+
+def top_k(scores: np.ndarray, k: int, exclude_idx: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first, skipping excluded positions.
+    argpartition + a sort of the k winners keeps this O(n + k log k).
+    """
+    scores = np.asarray(scores)
+    if exclude_idx is not None and len(exclude_idx):
+        candidates = np.flatnonzero(~exclusion_mask(scores.size, exclude_idx))
+    else:
+        candidates = np.arange(scores.size)
+    if k <= 0 or candidates.size == 0:
+        return candidates[:0]
+    if k < candidates.size:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
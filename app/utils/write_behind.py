@@ -0,0 +1,335 @@
+"""
+In-process write-behind buffer for Mongo writes on the request path.
+"""
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bson import json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+log = logging.getLogger(__name__)
+
+# duplicate key: the document was inserted by an earlier attempt
+_DUPLICATE_KEY = 11000
+
+
+def _key(collection: str, filt: Dict[str, Any]) -> Tuple:
+    return (collection,) + tuple(sorted(filt.items()))
+
+
+class WriteBehindQueue:
+    """
+    Coalesces inserts and upserts and flushes them with insert_many/bulk_write
+    from a background thread, once ``max_batch`` ops are buffered or every
+    ``flush_interval`` seconds.
+
+    Upserts on the same (collection, filter) merge into one op: ``$inc``
+    amounts add up and ``$set`` fields are last-writer-wins. At most
+    ``max_pending`` ops are buffered; writers then wait up to ``put_timeout``
+    for a flush and, failing that, write synchronously. ``pending`` exposes
+    not-yet-flushed ``$set`` fields so handlers can read their own writes.
+    With ``enabled=False`` every op is written immediately.
+
+    Ops that fail to flush are retried up to ``max_retries`` times with
+    exponential backoff from ``retry_backoff`` seconds; they count towards
+    ``max_pending`` meanwhile. Inserts keep their ``_id`` so a retry cannot
+    duplicate them; a retried upsert whose first attempt did reach Mongo
+    applies its ``$inc`` twice. Ops that run out of retries are logged at
+    error level and appended to ``spill_path`` (JSON lines) when set.
+    Spilled ops are not replayed automatically: once Mongo is healthy, run
+    scripts/replay_spill.py (``replay_spill``) to write them back.
+    """
+
+    def __init__(self, get_db: Callable[[], Any], max_batch: int = 500, flush_interval: float = 0.05,
+                 max_pending: int = 10000, put_timeout: float = 1.0, enabled: bool = True,
+                 max_retries: int = 5, retry_backoff: float = 0.5, spill_path: str = ''):
+        self._get_db = get_db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.enabled = enabled
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.spill_path = spill_path
+        self._cond = threading.Condition()
+        self._inserts: Dict[str, List[Dict[str, Any]]] = {}
+        self._upserts: 'OrderedDict[Tuple, Dict[str, Any]]' = OrderedDict()
+        self._inflight: Dict[Tuple, Dict[str, Any]] = {}
+        # failed batches: {'kind': 'insert'|'upsert', 'collection', 'ops', 'attempts', 'due'}
+        self._retries: List[Dict[str, Any]] = []
+        self._retry_ops = 0
+        self._depth = 0
+        self._closed = False
+        self._flushing = False
+        self._thread = None
+        self.stats = {'queue_depth': 0, 'enqueued': 0, 'flushes': 0, 'flushed_ops': 0, 'failed_ops': 0,
+                      'retry_depth': 0, 'retried_ops': 0, 'spilled_ops': 0,
+                      'sync_writes': 0, 'last_flush_ms': 0.0, 'max_flush_ms': 0.0}
+
+    # -- producers -----------------------------------------------------------------
+
+    def insert(self, collection: str, doc: Dict[str, Any]):
+        if not self._reserve():
+            self._get_db()[collection].insert_one(doc)
+            return
+        with self._cond:
+            self._inserts.setdefault(collection, []).append(doc)
+            self._added()
+
+    def upsert(self, collection: str, filt: Dict[str, Any], inc: Optional[Dict[str, float]] = None,
+               set_fields: Optional[Dict[str, Any]] = None):
+        if not self._reserve():
+            update = {}
+            if inc:
+                update['$inc'] = inc
+            if set_fields:
+                update['$set'] = set_fields
+            self._get_db()[collection].update_one(filt, update, upsert=True)
+            return
+        key = _key(collection, filt)
+        with self._cond:
+            op = self._upserts.get(key)
+            if op is None:
+                op = self._upserts[key] = {'collection': collection, 'filter': filt, 'inc': {}, 'set': {}}
+                self._added()
+            for k, v in (inc or {}).items():
+                op['inc'][k] = op['inc'].get(k, 0) + v
+            op['set'].update(set_fields or {})
+            self._cond.notify_all()
+
+    def pending(self, collection: str, filt: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """``$set`` fields queued or being flushed for this filter, if any."""
+        key = _key(collection, filt)
+        with self._cond:
+            merged = {}
+            # oldest first, so later writes win
+            for batch in self._retries:
+                if batch['kind'] == 'upsert':
+                    for op in batch['ops']:
+                        if _key(op['collection'], op['filter']) == key:
+                            merged.update(op['set'])
+            for source in (self._inflight, self._upserts):
+                op = source.get(key)
+                if op is not None:
+                    merged.update(op['set'])
+            # callers may mutate the result; don't alias queued documents
+            return copy.deepcopy(merged) or None
+
+    def _reserve(self) -> bool:
+        """Wait for buffer space; False means write synchronously instead."""
+        if not self.enabled or self._closed:
+            with self._cond:
+                self.stats['sync_writes'] += 1
+            return False
+        self._ensure_thread()
+        deadline = time.monotonic() + self.put_timeout
+        with self._cond:
+            while self._depth + self._retry_ops >= self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['sync_writes'] += 1
+                    return False
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+        return True
+
+    def _added(self):
+        self._depth += 1
+        self.stats['enqueued'] += 1
+        self.stats['queue_depth'] = self._depth
+        if self._depth >= self.max_batch:
+            self._cond.notify_all()
+
+    # -- flushing ------------------------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._depth < self.max_batch and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                if self._closed and not self._depth:
+                    return
+            self._flush_once()
+
+    def _due_retries(self, now: float, force: bool) -> List[Dict[str, Any]]:
+        # caller holds the lock
+        due = [b for b in self._retries if force or b['due'] <= now]
+        if due:
+            self._retries = [b for b in self._retries if not (force or b['due'] <= now)]
+        return due
+
+    def _flush_once(self, force_retries: bool = False):
+        with self._cond:
+            if self._flushing:
+                return
+            retries = self._due_retries(time.monotonic(), force_retries)
+            if not self._depth and not retries:
+                return
+            self._flushing = True
+            inserts, self._inserts = self._inserts, {}
+            upserts, self._upserts = self._upserts, OrderedDict()
+            self._inflight = dict(upserts)
+            n_ops, self._depth = self._depth, 0
+            self.stats['queue_depth'] = 0
+            self._cond.notify_all()
+        # (kind, collection, ops, attempts so far)
+        batches: List[Tuple[str, str, list, int]] = [(b['kind'], b['collection'], b['ops'], b['attempts'])
+                                                     for b in retries]
+        batches += [('insert', collection, docs, 0) for collection, docs in inserts.items()]
+        by_collection: Dict[str, List[Dict[str, Any]]] = {}
+        for op in upserts.values():
+            by_collection.setdefault(op['collection'], []).append(op)
+        batches += [('upsert', collection, ops, 0) for collection, ops in by_collection.items()]
+        retried = sum(len(b['ops']) for b in retries)
+        t0 = time.perf_counter()
+        failed: List[Tuple[str, str, list, int]] = []
+        done = 0
+        try:
+            db = self._get_db()
+            for kind, collection, ops, attempts in batches:
+                bad = self._write(db, kind, collection, ops)
+                if bad:
+                    failed.append((kind, collection, bad, attempts))
+                done += 1
+        except Exception as e:
+            log.warning("Write-behind connection error: %s", e)
+        finally:
+            # batches not attempted (no connection) are retried as a whole
+            failed += batches[done:]
+            self._finish_flush(failed, n_ops, retried, (time.perf_counter() - t0) * 1000.0)
+
+    def _finish_flush(self, failed: List[Tuple[str, str, list, int]], n_ops: int, retried: int, elapsed_ms: float):
+        n_failed = sum(len(f[2]) for f in failed)
+        spill = []
+        with self._cond:
+            now = time.monotonic()
+            for kind, collection, ops, attempts in failed:
+                attempts += 1
+                if attempts > self.max_retries:
+                    spill.append((kind, collection, ops))
+                    continue
+                self._retries.append({'kind': kind, 'collection': collection, 'ops': ops, 'attempts': attempts,
+                                      'due': now + self.retry_backoff * 2 ** (attempts - 1)})
+            self._retry_ops = sum(len(b['ops']) for b in self._retries)
+            self._inflight = {}
+            self._flushing = False
+            self.stats['flushes'] += 1
+            self.stats['flushed_ops'] += n_ops + retried - n_failed
+            self.stats['failed_ops'] += n_failed
+            self.stats['retried_ops'] += retried
+            self.stats['retry_depth'] = self._retry_ops
+            self.stats['last_flush_ms'] = round(elapsed_ms, 3)
+            self.stats['max_flush_ms'] = round(max(self.stats['max_flush_ms'], elapsed_ms), 3)
+            self._cond.notify_all()
+        for kind, collection, ops in spill:
+            self._spill(kind, collection, ops)
+
+    @staticmethod
+    def _write(db, kind: str, collection: str, ops: list) -> list:
+        """Write one batch; returns the ops that still need writing."""
+        try:
+            if kind == 'insert':
+                db[collection].insert_many(ops, ordered=False)
+            else:
+                updates = [UpdateOne(op['filter'], WriteBehindQueue._update_doc(op), upsert=True) for op in ops]
+                db[collection].bulk_write(updates, ordered=False)
+            return []
+        except BulkWriteError as e:
+            # unordered: everything except the reported ops was written
+            errors = e.details.get('writeErrors', [])
+            log.warning("Write-behind %s error (%s): %d of %d ops failed", kind, collection, len(errors), len(ops))
+            return [ops[w['index']] for w in errors if w.get('code') != _DUPLICATE_KEY]
+        except Exception as e:
+            log.warning("Write-behind %s error (%s): %s", kind, collection, e)
+            return ops
+
+    @staticmethod
+    def _update_doc(op: Dict[str, Any]) -> Dict[str, Any]:
+        update = {}
+        if op['inc']:
+            update['$inc'] = op['inc']
+        if op['set']:
+            update['$set'] = op['set']
+        return update
+
+    def _spill(self, kind: str, collection: str, ops: list):
+        log.error("Write-behind gave up on %d %s ops for %s after %d retries%s", len(ops), kind, collection,
+                  self.max_retries, f"; spilled to {self.spill_path}" if self.spill_path else "")
+        if self.spill_path:
+            try:
+                os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+                with open(self.spill_path, 'a', encoding='utf-8') as f:
+                    for op in ops:
+                        f.write(json_util.dumps({'kind': kind, 'collection': collection, 'op': op}) + '\n')
+            except OSError as e:
+                log.error("Write-behind spill failed (%s): %s", self.spill_path, e)
+        if not self.spill_path:
+            for op in ops:
+                log.error("Write-behind dropped %s op for %s: %s", kind, collection, json_util.dumps(op))
+        with self._cond:
+            self.stats['spilled_ops'] += len(ops)
+
+    def flush(self):
+        """
+        Write everything buffered so far before returning. Ops that fail stay
+        queued for retry; they are not waited for.
+        """
+        while True:
+            with self._cond:
+                while self._flushing:
+                    self._cond.wait()
+                if not self._depth:
+                    return
+            self._flush_once()
+
+    def close(self):
+        """Flush and stop; later writes go straight to Mongo. Retries left are tried once more, then spilled."""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.flush()
+        with self._cond:
+            pending = bool(self._retries)
+        if pending:
+            self._flush_once(force_retries=True)
+        with self._cond:
+            leftover, self._retries, self._retry_ops = self._retries, [], 0
+            self.stats['retry_depth'] = 0
+        for batch in leftover:
+            self._spill(batch['kind'], batch['collection'], batch['ops'])
+
+
+def replay_spill(db, path: str) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Write the ops in a spill file back to Mongo; returns (ops written, spill
+    records that failed again). Inserts keep their ``_id``, so replaying one
+    that did reach Mongo is a no-op; upserts re-apply their ``$inc``.
+    """
+    batches: 'OrderedDict[Tuple[str, str], List[Dict[str, Any]]]' = OrderedDict()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json_util.loads(line)
+                batches.setdefault((record['kind'], record['collection']), []).append(record['op'])
+    written = 0
+    failed: List[Dict[str, Any]] = []
+    for (kind, collection), ops in batches.items():
+        bad = WriteBehindQueue._write(db, kind, collection, ops)
+        written += len(ops) - len(bad)
+        failed += [{'kind': kind, 'collection': collection, 'op': op} for op in bad]
+    return written, failed
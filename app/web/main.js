@@ -615,22 +615,7 @@ function setupChatbot() {
     
     try {
       const userId = document.getElementById('userId').value || 'u1';
-      const response = await fetch('/chat', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          message: message,
-          user_id: userId
-        })
-      });
-      
-      const data = await response.json();
-      
-      if (data.error) {
-        addChatMessage('Sorry, I encountered an error: ' + data.error, 'bot');
-      } else {
-        addChatMessage(data.response, 'bot', data.web_results, data.learning_platforms);
-      }
+      await streamChatReply(message, userId);
     } catch (error) {
       addChatMessage('Sorry, I\'m having trouble connecting right now. Please try again.', 'bot');
     }
@@ -642,6 +627,74 @@ function setupChatbot() {
     chatInput.focus();
   }
   
+  // POST /chat/stream and render tokens as they arrive (Server-Sent Events over fetch)
+  async function streamChatReply(message, userId) {
+    const response = await fetch('/chat/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        message: message,
+        user_id: userId
+      })
+    });
+    
+    if (!response.ok || !response.body) {
+      const data = await response.json().catch(() => ({}));
+      addChatMessage('Sorry, I encountered an error: ' + (data.error || response.statusText), 'bot');
+      return;
+    }
+    
+    let meta = {};
+    let text = '';
+    let bubble = null;
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    const render = () => {
+      if (bubble) bubble.remove();
+      bubble = addChatMessage(text, 'bot', meta.web_results, meta.learning_platforms);
+    };
+    
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      // events are separated by a blank line
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) !== -1) {
+        const raw = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        let event = 'message';
+        let data = '';
+        raw.split('\n').forEach(line => {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        const payload = data ? JSON.parse(data) : {};
+        if (event === 'meta') {
+          meta = payload;
+        } else if (event === 'token') {
+          text += payload.text;
+          if (bubble) {
+            bubble.querySelector('.message-text').innerHTML = text.replace(/\n/g, '<br>');
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+          } else {
+            render();
+          }
+        } else if (event === 'done') {
+          text = payload.response;
+          render();
+        } else if (event === 'error') {
+          text = payload.response;
+          meta = {};
+          render();
+        }
+      }
+    }
+    if (!bubble) render();
+  }
+  
   function addChatMessage(text, sender, webResults = null, learningPlatforms = null) {
     const messageDiv = document.createElement('div');
     messageDiv.className = `chat-message ${sender}`;
@@ -652,7 +705,10 @@ function setupChatbot() {
     
     const content = document.createElement('div');
     content.className = `message-content ${sender}`;
-    content.innerHTML = text.replace(/\n/g, '<br>');
+    const textSpan = document.createElement('span');
+    textSpan.className = 'message-text';
+    textSpan.innerHTML = text.replace(/\n/g, '<br>');
+    content.appendChild(textSpan);
     
     // Add web results if available
     if (webResults && webResults.length > 0) {
@@ -691,6 +747,7 @@ function setupChatbot() {
     
     chatMessages.appendChild(messageDiv);
     chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageDiv;
   }
 }
 
@@ -0,0 +1,150 @@
+"""
+Single-threaded throughput and memory of BanditStore against the per-user
+dict-of-dicts bandits HybridRecommender used before BanditStore, both as
+they were (unsynchronised: scripts/stress_bandits.py shows concurrent
+/feedback losing updates there) and guarded by one lock, the cheapest way
+to make them thread-safe. All see the same feedback stream and the same
+candidate windows (what rerank() passes: the top 5-20 ranked items).
+
+    python scripts/bench_bandits.py --users 2000 --arms 500 --updates 200000
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.recommenders.bandit import BanditStore  # noqa: E402
+
+
+class DictBandits:
+    # reference: EpsilonGreedyBandit per user, as in HybridRecommender before BanditStore
+    def __init__(self, epsilon):
+        self.epsilon = epsilon
+        self.bandits = {}
+
+    def update(self, user_id, arm_id, reward):
+        state = self.bandits.setdefault(user_id, {})
+        st = state.setdefault(arm_id, {"count": 0.0, "total_reward": 0.0})
+        st["count"] += 1.0
+        st["total_reward"] += float(reward)
+
+    def select(self, user_id, candidates):
+        if not candidates:
+            return None
+        if random.random() < self.epsilon:
+            return random.choice(candidates)
+        state = self.bandits.setdefault(user_id, {})
+        best_arm = None
+        best_val = -1e9
+        for arm in candidates:
+            st = state.get(arm)
+            avg = (st["total_reward"] / st["count"]) if st and st["count"] > 0 else 0.0
+            if avg > best_val:
+                best_val = avg
+                best_arm = arm
+        return best_arm or candidates[0]
+
+
+class LockedDictBandits(DictBandits):
+    # the same, made safe for concurrent requests the way BanditStore is
+    def __init__(self, epsilon):
+        super().__init__(epsilon)
+        self.lock = threading.Lock()
+
+    def update(self, user_id, arm_id, reward):
+        with self.lock:
+            state = self.bandits.setdefault(user_id, {})
+            st = state.setdefault(arm_id, {"count": 0.0, "total_reward": 0.0})
+            st["count"] += 1.0
+            st["total_reward"] += float(reward)
+
+    def select(self, user_id, candidates):
+        if not candidates:
+            return None
+        if random.random() < self.epsilon:
+            return random.choice(candidates)
+        with self.lock:
+            state = self.bandits.setdefault(user_id, {})
+            best_arm = None
+            best_val = -1e9
+            for arm in candidates:
+                st = state.get(arm)
+                avg = (st["total_reward"] / st["count"]) if st and st["count"] > 0 else 0.0
+                if avg > best_val:
+                    best_val = avg
+                    best_arm = arm
+            return best_arm or candidates[0]
+
+
+def _workload(args):
+    rng = np.random.default_rng(args.seed)
+    # zipf-ish arms: a few items collect most feedback, like real traffic
+    users = [f'u{u}' for u in rng.integers(0, args.users, args.updates)]
+    arms = [f'i{a % args.arms}' for a in rng.zipf(1.3, args.updates)]
+    rewards = rng.random(args.updates).tolist()
+    # windows come from the same skewed catalog, so they overlap what users gave feedback on
+    windows = []
+    for u in rng.integers(0, args.users, args.selects):
+        picks = dict.fromkeys(rng.zipf(1.3, 4 * args.window) % args.arms)
+        windows.append((f'u{u}', [f'i{a}' for a in list(picks)[:args.window]]))
+    return list(zip(users, arms, rewards)), windows
+
+
+def _held_mib(make, updates):
+    tracemalloc.start()
+    store = make()
+    for user_id, arm_id, reward in updates:
+        store.update(user_id, arm_id, reward)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    return held / 2 ** 20
+
+
+def bench(make, updates, windows, repeat):
+    """Best of ``repeat`` runs: (updates/s, selects/s, MiB held after the updates)."""
+    best_up = best_sel = 0.0
+    for _ in range(repeat):
+        store = make()
+        t0 = time.perf_counter()
+        for user_id, arm_id, reward in updates:
+            store.update(user_id, arm_id, reward)
+        t1 = time.perf_counter()
+        for user_id, candidates in windows:
+            store.select(user_id, candidates)
+        t2 = time.perf_counter()
+        best_up = max(best_up, len(updates) / (t1 - t0))
+        best_sel = max(best_sel, len(windows) / (t2 - t1))
+    # tracemalloc slows allocation, so memory gets its own untimed pass
+    return best_up, best_sel, _held_mib(make, updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--arms', type=int, default=500)
+    parser.add_argument('--updates', type=int, default=200000)
+    parser.add_argument('--selects', type=int, default=100000)
+    parser.add_argument('--window', type=int, default=20, help='candidates per select (rerank window, 5-20)')
+    parser.add_argument('--epsilon', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    updates, windows = _workload(args)
+    variants = (('dict (unsafe)', DictBandits), ('dict + lock', LockedDictBandits), ('BanditStore', BanditStore))
+    for name, cls in variants:
+        random.seed(args.seed)
+        ups, sels, mib = bench(lambda: cls(args.epsilon), updates, windows, args.repeat)
+        print(f"{name:<14} update {ups:>10,.0f}/s   select {sels:>10,.0f}/s   state {mib:>7.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Compare fit time and peak RSS of the sparse CollaborativeRecommender against
+the previous dense implementation. Each variant runs in its own process so
+ru_maxrss reflects only that variant.
+
+    python scripts/bench_cf_sparse.py --users 20000 --items 5000 --events 400000
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.recommenders.collaborative import CollaborativeRecommender  # noqa: E402
+
+
+def dense_fit(events):
+    # reference: the dense fit CollaborativeRecommender used before CSR
+    users = sorted({e['user_id'] for e in events})
+    items = sorted({e['item_id'] for e in events})
+    user_index = {u: i for i, u in enumerate(users)}
+    item_index = {it: i for i, it in enumerate(items)}
+    M = np.zeros((len(users), len(items)), dtype=np.float32)
+    for e in events:
+        M[user_index[e['user_id']], item_index[e['item_id']]] += CollaborativeRecommender._event_weight(e)
+    norms = np.linalg.norm(M, axis=1, keepdims=True) + 1e-8
+    return M / norms
+
+
+def sparse_fit(events):
+    cf = CollaborativeRecommender()
+    cf.fit(events)
+    return cf.user_item
+
+
+def make_events(n_users, n_items, n_events, seed=0):
+    rng = np.random.default_rng(seed)
+    types = np.array(['view', 'like', 'complete', 'quiz'])
+    us = rng.integers(0, n_users, n_events)
+    its = rng.zipf(1.3, n_events) % n_items
+    ts = rng.integers(0, len(types), n_events)
+    return [
+        {'user_id': f'u{u}', 'item_id': f'i{i}', 'type': types[t], 'score': 0.5}
+        for u, i, t in zip(us, its, ts)
+    ]
+
+
+def _run(variant, args, out):
+    events = make_events(args.users, args.items, args.events)
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    fit = dense_fit if variant == 'dense' else sparse_fit
+    t0 = time.perf_counter()
+    fit(events)
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux
+    out.put({'variant': variant, 'fit_s': round(elapsed, 4), 'peak_rss_mb': round(peak / 1024, 1),
+             'fit_rss_mb': round(max(peak - base, 0) / 1024, 1)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--events', type=int, default=400000)
+    parser.add_argument('--skip-dense', action='store_true', help='only run the sparse fit (dense may not fit in RAM)')
+    args = parser.parse_args()
+
+    ctx = mp.get_context('spawn')
+    results = []
+    for variant in (['sparse'] if args.skip_dense else ['dense', 'sparse']):
+        out = ctx.Queue()
+        p = ctx.Process(target=_run, args=(variant, args, out))
+        p.start()
+        results.append(out.get())
+        p.join()
+    print(json.dumps({'users': args.users, 'items': args.items, 'events': args.events, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
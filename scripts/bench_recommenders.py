@@ -0,0 +1,161 @@
+"""
+Benchmark fit and serve cost of the recommenders across scale points on
+synthetic data (see synth_data.py). Each scale point runs in its own process
+so peak RSS belongs to that point only. The JSON report is stable across
+runs of the same code, so reports from two versions can be diffed directly
+or compared with --baseline.
+
+    python scripts/bench_recommenders.py --scales 1000x500x20000 10000x2000x200000 --out bench.json
+    python scripts/bench_recommenders.py --scales 10000x2000x200000 --baseline bench.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.recommenders.collaborative import CollaborativeRecommender  # noqa: E402
+from app.recommenders.content_based import ContentBasedRecommender  # noqa: E402
+from app.recommenders.hybrid import HybridRecommender  # noqa: E402
+from app.recommenders.torch_mf import ALSRecommender  # noqa: E402
+from synth_data import generate  # noqa: E402
+
+
+def _rss_mb():
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return round(time.perf_counter() - t0, 4)
+
+
+def _latency(samples):
+    ms = np.asarray(samples) * 1000.0
+    return {'p50_ms': round(float(np.percentile(ms, 50)), 3), 'p99_ms': round(float(np.percentile(ms, 99)), 3),
+            'mean_ms': round(float(ms.mean()), 3), 'n': int(ms.size)}
+
+
+def run_scale(scale, args):
+    n_users, n_items, n_events = scale
+    items, users, events = generate(n_users, n_items, n_events, seed=args.seed)
+    result = {'users': n_users, 'items': n_items, 'events': n_events, 'rss_data_mb': _rss_mb()}
+
+    result['cbf_fit_s'] = _timed(ContentBasedRecommender().fit, items)
+    for mode in args.cf_modes:
+        cf = ALSRecommender() if mode == 'als' else CollaborativeRecommender(mode=mode)
+        result[f'cf_{mode}_fit_s'] = _timed(cf.fit, events)
+    result['rss_fit_mb'] = _rss_mb()
+
+    rng = np.random.default_rng(args.seed)
+    sample = [users[i] for i in rng.choice(len(users), size=min(args.requests, len(users)), replace=False)]
+    for mode in args.cf_modes:
+        rec = HybridRecommender(epsilon=args.epsilon, cf_mode=mode, max_candidates=args.max_candidates)
+        result[f'hybrid_{mode}_fit_s'] = _timed(rec.fit, items, events)
+        for u in sample[:5]:
+            rec.recommend(u, limit=args.limit)  # warm profile cache and lazy state
+        lat = []
+        for u in sample:
+            t0 = time.perf_counter()
+            rec.recommend(u, limit=args.limit)
+            lat.append(time.perf_counter() - t0)
+        result[f'hybrid_{mode}_recommend'] = _latency(lat)
+        del rec
+    result['rss_peak_mb'] = _rss_mb()
+    return result
+
+
+def _child(scale, args, out):
+    out.put(run_scale(scale, args))
+
+
+def _parse_scale(s):
+    parts = [int(x) for x in s.lower().split('x')]
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError('scale must be USERSxITEMSxEVENTS')
+    return tuple(parts)
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """Print new/old ratios for every numeric metric present in both reports."""
+    old = {(r['users'], r['items'], r['events']): r for r in baseline['results']}
+    for r in report['results']:
+        key = (r['users'], r['items'], r['events'])
+        if key not in old:
+            continue
+        print('x'.join(map(str, key)))
+        for name, value in r.items():
+            prev = old[key].get(name)
+            if isinstance(value, dict) and isinstance(prev, dict):
+                for sub in ('p50_ms', 'p99_ms'):
+                    if prev.get(sub):
+                        print(f'  {name}.{sub}: {prev[sub]} -> {value[sub]} ({value[sub] / prev[sub]:.2f}x)')
+            elif isinstance(value, (int, float)) and name not in ('users', 'items', 'events') and prev:
+                print(f'  {name}: {prev} -> {value} ({value / prev:.2f}x)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', type=_parse_scale, default=[(1000, 500, 20000), (10000, 2000, 200000)],
+                        help='USERSxITEMSxEVENTS scale points')
+    parser.add_argument('--cf-modes', nargs='+', default=['user', 'item'], choices=['user', 'item', 'als'])
+    parser.add_argument('--requests', type=int, default=500, help='recommend() calls timed per CF mode')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--epsilon', type=float, default=0.1)
+    parser.add_argument('--max-candidates', type=int, default=int(os.getenv('REC_MAX_CANDIDATES', '200')))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='previous report to compare against')
+    args = parser.parse_args()
+
+    ctx = mp.get_context('spawn')
+    results = []
+    for scale in args.scales:
+        out = ctx.Queue()
+        p = ctx.Process(target=_child, args=(scale, args, out))
+        p.start()
+        results.append(out.get())
+        p.join()
+        print(f"done {'x'.join(map(str, scale))}", file=sys.stderr)
+
+    report = {
+        'git_rev': _git_rev(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpus': os.cpu_count(),
+        'params': {'cf_modes': args.cf_modes, 'requests': args.requests, 'limit': args.limit,
+                   'epsilon': args.epsilon, 'max_candidates': args.max_candidates, 'seed': args.seed},
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
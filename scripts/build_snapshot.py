@@ -0,0 +1,50 @@
+"""
+Fit the hybrid recommender from Mongo and write a memory-mappable snapshot.
+Point REC_SNAPSHOT_DIR at the same directory so app workers load it on startup.
+
+    python scripts/build_snapshot.py --out snapshots/
+"""
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.recommenders.collaborative import CollaborativeRecommender  # noqa: E402
+from app.recommenders.hybrid import from_env  # noqa: E402
+from app.recommenders.persistence import save_snapshot  # noqa: E402
+from app.utils.event_log import EventLog  # noqa: E402
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default=os.getenv('REC_SNAPSHOT_DIR') or 'snapshots')
+    parser.add_argument('--keep', type=int, default=int(os.getenv('REC_SNAPSHOT_KEEP', '3')),
+                        help='snapshots kept after CURRENT moves; older ones are removed')
+    args = parser.parse_args()
+
+    uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
+    db_name = os.getenv('MONGO_DB', 'learning_rec')
+    db = MongoClient(uri)[db_name]
+
+    t0 = time.perf_counter()
+    items = list(db.items.find({}, {'_id': 1, 'title': 1, 'description': 1, 'tags': 1, 'type': 1}))
+    events = EventLog(CollaborativeRecommender._event_weight)
+    events.sync(db.events, batch_size=int(os.getenv('REC_LOAD_BATCH_SIZE', '5000')))
+    users = {u['_id']: u for u in db.users.find({}, {'_id': 1, 'interests': 1, 'goals': 1})}
+    # same REC_* configuration the app workers use, so the snapshot matches what they would fit
+    rec = from_env()
+    rec.fit_log(items, events)
+    path = save_snapshot(rec, args.out, users=users, keep=args.keep)
+    print(f"Wrote {path} ({len(items)} items, {len(events)} events, {len(users)} users) "
+          f"in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Offline evaluation of the recommenders on a temporal leave-last-N-out split.
+
+For every user with enough history, the last N events by ``ts`` are held out
+and the models are fitted on everything else. Each model then ranks the
+unseen catalog for those users and is scored on recall@k, NDCG@k, catalog
+coverage and per-user latency. Models: the hybrid (bandit disabled), its CF
+and CBF components, and a popularity baseline. Users are scored on a fork
+based process pool that shares the fitted model copy-on-write.
+
+    python scripts/evaluate.py --synth 5000x1000x100000 --cf-modes user item als --out eval.json
+    python scripts/evaluate.py --mongo --holdout 2 --k 10 --max-candidates 0 200
+    python scripts/evaluate.py --data data/synth --workers 4
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.recommenders.hybrid import HybridRecommender  # noqa: E402
+from app.utils import topk  # noqa: E402
+from app.utils.event_log import _to_epoch  # noqa: E402
+from synth_data import generate, read_jsonl  # noqa: E402
+
+# fitted state for the current run; set before the pool forks so workers inherit it
+_MODEL = None
+_TEST = None
+
+
+def load_data(args):
+    if args.mongo:
+        from dotenv import load_dotenv
+        from pymongo import MongoClient
+
+        load_dotenv()
+        db = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))[os.getenv('MONGO_DB', 'learning_rec')]
+        items = list(db.items.find({}, {'_id': 1, 'title': 1, 'description': 1, 'tags': 1, 'type': 1}))
+        users = list(db.users.find({}, {'_id': 1, 'interests': 1, 'goals': 1}))
+        events = list(db.events.find({}, {'_id': 0, 'user_id': 1, 'item_id': 1, 'type': 1, 'score': 1, 'ts': 1}))
+        return items, users, events
+    if args.data:
+        return read_jsonl(args.data)
+    n_users, n_items, n_events = args.synth
+    return generate(n_users, n_items, n_events, seed=args.seed)
+
+
+def temporal_split(events, holdout, min_train=1):
+    """
+    (train events, {user_id: held-out item ids}). Per user, the last ``holdout``
+    events by ts are held out; held-out items the user already saw in train
+    are dropped since no model may recommend them.
+    """
+    by_user = {}
+    for i, e in enumerate(events):
+        by_user.setdefault(e['user_id'], []).append(i)
+    ts = np.array([_to_epoch(e.get('ts')) for e in events])
+    ts = np.where(np.isnan(ts), -np.inf, ts)
+    train, test = [], {}
+    for user_id, idx in by_user.items():
+        # stable on ties: insertion order breaks them
+        idx = [idx[j] for j in np.argsort(ts[idx], kind='stable')]
+        if len(idx) < holdout + min_train:
+            train.extend(idx)
+            continue
+        head, tail = idx[:-holdout], idx[-holdout:]
+        train.extend(head)
+        seen = {events[i]['item_id'] for i in head}
+        held = list(dict.fromkeys(events[i]['item_id'] for i in tail if events[i]['item_id'] not in seen))
+        if held:
+            test[user_id] = held
+    return [events[i] for i in sorted(train)], test
+
+
+def _top_unseen(rec, scores, user_id, k):
+    # scores over catalog positions -> top-k ids excluding the user's train items
+    return [rec.item_ids[j] for j in topk.top_k(scores, k, rec.seen.get(user_id))]
+
+
+def _cf_catalog_scores(rec, user_id):
+    scores = np.zeros(len(rec.item_ids))
+    cf_all = rec.cf.score_all(user_id)
+    if cf_all is not None:
+        known = rec._cf_pos >= 0
+        scores[known] = cf_all[rec._cf_pos[known]]
+    return scores
+
+
+MODELS = {
+    'hybrid': lambda rec, user, k: rec.rank(user, limit=k)[:k],
+    'cf': lambda rec, user, k: _top_unseen(rec, _cf_catalog_scores(rec, user['_id']), user['_id'], k),
+    'cbf': lambda rec, user, k: _top_unseen(
+        rec, rec.cbf.score_profile(rec._user_profile(user), np.arange(len(rec.item_ids))), user['_id'], k),
+    'popularity': lambda rec, user, k: _top_unseen(rec, rec.popularity, user['_id'], k),
+}
+
+
+def _score_chunk(task):
+    model, users, k = task
+    rec, fn = _MODEL, MODELS[model]
+    out = []
+    for user in users:
+        t0 = time.perf_counter()
+        ids = fn(rec, user, k)
+        elapsed = time.perf_counter() - t0
+        held = _TEST[user['_id']]
+        hits = [1.0 if i in held else 0.0 for i in ids]
+        dcg = sum(h / np.log2(r + 2) for r, h in enumerate(hits))
+        idcg = sum(1.0 / np.log2(r + 2) for r in range(min(len(held), k)))
+        out.append((sum(hits) / len(held), dcg / idcg if idcg else 0.0, elapsed, ids))
+    return out
+
+
+def evaluate(model, rec, users, test, k, workers, chunk_size):
+    global _MODEL, _TEST
+    _MODEL, _TEST = rec, test
+    chunks = [(model, users[i:i + chunk_size], k) for i in range(0, len(users), chunk_size)]
+    t0 = time.perf_counter()
+    if workers > 1:
+        with mp.get_context('fork').Pool(workers) as pool:
+            rows = [r for part in pool.imap(_score_chunk, chunks) for r in part]
+    else:
+        rows = [r for c in chunks for r in _score_chunk(c)]
+    wall = time.perf_counter() - t0
+    recall, ndcg, lat, recs = zip(*rows)
+    ms = np.asarray(lat) * 1000.0
+    covered = {i for ids in recs for i in ids}
+    return {
+        f'recall@{k}': round(float(np.mean(recall)), 5),
+        f'ndcg@{k}': round(float(np.mean(ndcg)), 5),
+        'coverage': round(len(covered) / max(len(rec.item_ids), 1), 5),
+        'latency_ms': {'p50': round(float(np.percentile(ms, 50)), 3), 'p99': round(float(np.percentile(ms, 99)), 3),
+                       'mean': round(float(ms.mean()), 3)},
+        'wall_s': round(wall, 3),
+        'users': len(rows),
+    }
+
+
+def _parse_scale(s):
+    parts = [int(x) for x in s.lower().split('x')]
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError('scale must be USERSxITEMSxEVENTS')
+    return tuple(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument('--mongo', action='store_true', help='read items/users/events from MONGO_URI/MONGO_DB')
+    src.add_argument('--data', help='directory written by synth_data.py --out')
+    src.add_argument('--synth', type=_parse_scale, default=(2000, 500, 40000), help='USERSxITEMSxEVENTS')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--holdout', type=int, default=1, help='last N events per user held out')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--cf-modes', nargs='+', default=['user', 'item'], choices=['user', 'item', 'als'])
+    parser.add_argument('--max-candidates', nargs='+', type=int, default=[0, int(os.getenv('REC_MAX_CANDIDATES', '200'))],
+                        help='candidate caps to compare (0 = no cap)')
+    parser.add_argument('--max-users', type=int, default=0, help='evaluate a random sample of test users (0 = all)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=64)
+    parser.add_argument('--out', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args()
+
+    items, users, events = load_data(args)
+    train, test = temporal_split(events, args.holdout)
+    user_docs = {u['_id']: u for u in users}
+    eval_users = [user_docs.get(uid, {'_id': uid}) for uid in sorted(test)]
+    if args.max_users and len(eval_users) > args.max_users:
+        rng = np.random.default_rng(args.seed)
+        eval_users = [eval_users[i] for i in sorted(rng.choice(len(eval_users), args.max_users, replace=False))]
+
+    results = []
+    for cf_mode in args.cf_modes:
+        for cap in args.max_candidates:
+            rec = HybridRecommender(epsilon=0.0, cf_mode=cf_mode, max_candidates=cap)
+            t0 = time.perf_counter()
+            rec.fit(items, train)
+            fit_s = round(time.perf_counter() - t0, 3)
+            models = ['hybrid']
+            if cap == args.max_candidates[0]:
+                # components do not depend on the cap; CBF and popularity not on the CF engine either
+                models.append('cf')
+                if cf_mode == args.cf_modes[0]:
+                    models += ['cbf', 'popularity']
+            for model in models:
+                row = {'model': model, 'cf_mode': cf_mode if model in ('hybrid', 'cf') else None,
+                       'max_candidates': cap if model == 'hybrid' else None, 'fit_s': fit_s}
+                row.update(evaluate(model, rec, eval_users, test, args.k, args.workers, args.chunk_size))
+                results.append(row)
+                print(f"{model:>10} {row['cf_mode'] or '':>5} cap={row['max_candidates']}: "
+                      f"recall@{args.k}={row[f'recall@{args.k}']} ndcg@{args.k}={row[f'ndcg@{args.k}']} "
+                      f"coverage={row['coverage']} p50={row['latency_ms']['p50']}ms", file=sys.stderr)
+
+    try:
+        rev = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                      stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = None
+    report = {
+        'git_rev': rev,
+        'params': {'holdout': args.holdout, 'k': args.k, 'seed': args.seed, 'workers': args.workers,
+                   'source': 'mongo' if args.mongo else (args.data or 'x'.join(map(str, args.synth)))},
+        'split': {'items': len(items), 'train_events': len(train), 'test_users': len(test),
+                  'evaluated_users': len(eval_users)},
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
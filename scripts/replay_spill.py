@@ -0,0 +1,65 @@
+"""
+Write ops that the write-behind queue gave up on (WRITE_BEHIND_SPILL) back
+to Mongo, once it is reachable again. The file is first moved aside, so a
+running app keeps spilling into a fresh one; ops that fail again are
+appended back to the spill file.
+
+Inserts keep their _id and cannot be duplicated. Upserts re-apply their
+$inc, so only replay a spill once (a replayed file is removed).
+
+    python scripts/replay_spill.py
+    python scripts/replay_spill.py --path .cache/write-behind-spill.jsonl --dry-run
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+
+from bson import json_util
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.write_behind import replay_spill  # noqa: E402
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default=os.getenv('WRITE_BEHIND_SPILL', ''))
+    parser.add_argument('--dry-run', action='store_true', help='only count the spilled ops per collection')
+    args = parser.parse_args()
+    if not args.path:
+        parser.error('no spill file: pass --path or set WRITE_BEHIND_SPILL')
+    if not os.path.exists(args.path):
+        print(f"Nothing to replay: {args.path} does not exist")
+        return
+
+    if args.dry_run:
+        with open(args.path, encoding='utf-8') as f:
+            records = [json_util.loads(line) for line in f if line.strip()]
+        counts = Counter((r['kind'], r['collection']) for r in records)
+        for (kind, collection), n in sorted(counts.items()):
+            print(f"{collection:<16} {kind:<7} {n}")
+        return
+
+    replaying = args.path + '.replaying'
+    if os.path.exists(replaying):
+        sys.exit(f"{replaying} exists: an earlier replay was interrupted; check it, then replay it with --path")
+    os.replace(args.path, replaying)
+
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))[os.getenv('MONGO_DB', 'learning_rec')]
+    written, failed = replay_spill(db, replaying)
+    if failed:
+        with open(args.path, 'a', encoding='utf-8') as f:
+            for record in failed:
+                f.write(json_util.dumps(record) + '\n')
+    os.remove(replaying)
+    print(f"Replayed {written} ops; {len(failed)} failed again" + (f" and were re-spilled to {args.path}" if failed else ""))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Quick local check that the recommenders fit and serve on a small synthetic
+dataset, without Mongo. Exits non-zero if any CF mode returns nothing.
+
+    python scripts/smoke_local.py --users 500 --items 200 --events 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.recommenders.hybrid import HybridRecommender  # noqa: E402
+from synth_data import generate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--limit', type=int, default=5)
+    args = parser.parse_args()
+
+    items, users, events = generate(args.users, args.items, args.events)
+    failed = False
+    for mode in ('user', 'item', 'als'):
+        rec = HybridRecommender(cf_mode=mode, max_candidates=int(os.getenv('REC_MAX_CANDIDATES', '200')))
+        t0 = time.perf_counter()
+        rec.fit(items, events)
+        fit_s = time.perf_counter() - t0
+        recs = rec.recommend(users[0], limit=args.limit)
+        batch = dict(rec.recommend_many(users[:50], limit=args.limit))
+        similar = rec.cbf.similar_items(items[0]['_id'], top_k=args.limit)
+        ok = len(recs) == args.limit and len(batch) == 50 and len(similar) > 0
+        failed |= not ok
+        print(f"{mode:>4}: fit {fit_s:.2f}s  {users[0]['_id']} -> {recs}  {'ok' if ok else 'FAILED'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
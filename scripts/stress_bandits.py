@@ -0,0 +1,121 @@
+"""
+Concurrency stress test for BanditStore: writer threads hammer ``update``
+(what POST /feedback does) while reader threads call ``select``, then every
+(user, arm) count and reward total is checked against what the writers
+sent. Exits non-zero if any update was lost or a reader failed.
+
+    python scripts/stress_bandits.py --threads 1 2 4 8 --updates 50000
+    python scripts/stress_bandits.py --users 10 --arms 5 --switch-interval 1e-6
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.recommenders.bandit import BanditStore  # noqa: E402
+
+
+def _workload(thread, n, users, arms, seed):
+    # deterministic per thread, so the expected totals are known up front
+    rng = np.random.default_rng(seed + thread)
+    u = rng.integers(0, users, n)
+    a = rng.integers(0, arms, n)
+    # 0/1 rewards keep float32 totals exact
+    r = rng.integers(0, 2, n)
+    return [(f'u{x}', f'a{y}', float(z)) for x, y, z in zip(u, a, r)]
+
+
+def run(store, workloads, readers, users, arms):
+    done = threading.Event()
+    errors = []
+    start = threading.Barrier(len(workloads) + readers + 1)
+
+    def write(ops):
+        start.wait()
+        for user_id, arm_id, reward in ops:
+            store.update(user_id, arm_id, reward)
+
+    def read(i):
+        candidates = [f'a{k}' for k in range(arms)]
+        start.wait()
+        j = i
+        while not done.is_set():
+            try:
+                store.select(f'u{j % users}', candidates)
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            j += 1
+
+    writers = [threading.Thread(target=write, args=(ops,)) for ops in workloads]
+    reader_threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    for t in writers + reader_threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in writers:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    done.set()
+    for t in reader_threads:
+        t.join()
+    return elapsed, errors
+
+
+def check(store, workloads):
+    """Number of (user, arm) pairs whose count or reward differs from what was sent."""
+    counts, rewards = Counter(), Counter()
+    for ops in workloads:
+        for user_id, arm_id, reward in ops:
+            counts[user_id, arm_id] += 1
+            rewards[user_id, arm_id] += reward
+    mismatched = 0
+    for user_id in {u for u, _ in counts}:
+        state = store.state(user_id)
+        for (u, arm_id), n in counts.items():
+            if u != user_id:
+                continue
+            got = state.get(arm_id, {'count': 0.0, 'total_reward': 0.0})
+            if got['count'] != n or got['total_reward'] != rewards[u, arm_id]:
+                mismatched += 1
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', nargs='+', type=int, default=[1, 2, 4, 8], help='writer thread counts')
+    parser.add_argument('--updates', type=int, default=50000, help='updates per writer thread')
+    parser.add_argument('--readers', type=int, default=2, help='threads calling select() meanwhile')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--arms', type=int, default=50)
+    parser.add_argument('--switch-interval', type=float, default=0.0,
+                        help='sys.setswitchinterval override; tiny values force more interleaving')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.switch_interval:
+        sys.setswitchinterval(args.switch_interval)
+    failed = False
+    for n_threads in args.threads:
+        workloads = [_workload(t, args.updates, args.users, args.arms, args.seed) for t in range(n_threads)]
+        store = BanditStore(epsilon=0.1)
+        elapsed, errors = run(store, workloads, args.readers, args.users, args.arms)
+        mismatched = check(store, workloads)
+        ok = mismatched == 0 and not errors
+        failed |= not ok
+        total = n_threads * args.updates
+        print(f"threads={n_threads:>2}: {total / elapsed:>10,.0f} updates/s  "
+              f"mismatched pairs={mismatched} reader errors={len(errors)}  {'ok' if ok else 'FAILED'}")
+        if errors:
+            print(f"  first reader error: {errors[0]}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Generate a synthetic catalog, user base and event stream at any scale.
+
+Item popularity and user activity both follow power laws; items and users
+draw their tags from per-topic vocabularies so content and CF signals agree.
+Writes to Mongo (items/users/events collections) or to JSONL files:
+
+    python scripts/synth_data.py --users 10000 --items 2000 --events 200000 --out data/synth
+    python scripts/synth_data.py --users 10000 --items 2000 --events 200000 --mongo --drop
+
+Other scripts import ``generate`` to get the same data as in-memory lists.
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+TOPICS = {
+    'python': ['python', 'basics', 'loops', 'functions', 'oop', 'scripting'],
+    'data': ['data', 'pandas', 'numpy', 'sql', 'statistics', 'visualization'],
+    'ml': ['ml', 'supervised', 'regression', 'classification', 'features', 'sklearn'],
+    'deep': ['deep', 'pytorch', 'tensorflow', 'cnn', 'transformers', 'nlp'],
+    'web': ['web', 'javascript', 'react', 'html', 'css', 'flask'],
+    'cloud': ['cloud', 'docker', 'kubernetes', 'devops', 'aws', 'linux'],
+    'security': ['security', 'networking', 'cryptography', 'pentesting', 'linux', 'auth'],
+    'mobile': ['mobile', 'android', 'kotlin', 'flutter', 'ios', 'swift'],
+}
+TYPES = ['video', 'pdf', 'exercise', 'quiz']
+EVENT_TYPES = np.array(['view', 'like', 'complete', 'quiz'])
+EVENT_P = [0.6, 0.15, 0.15, 0.1]
+
+
+def generate(n_users, n_items, n_events, seed=0, topic_affinity=0.8, zipf_a=1.2):
+    """
+    (items, users, events) as lists of dicts shaped like the Mongo documents.
+    ``topic_affinity`` is the share of a user's events that stay inside the
+    user's own topics; the rest follow global popularity.
+    """
+    rng = np.random.default_rng(seed)
+    topics = list(TOPICS)
+
+    # items: one main topic, 2-4 tags mostly from it
+    item_topic = rng.integers(0, len(topics), n_items)
+    items = []
+    for i in range(n_items):
+        vocab = TOPICS[topics[item_topic[i]]]
+        tags = list(rng.choice(vocab, size=rng.integers(2, 5), replace=False))
+        if rng.random() < 0.2:
+            tags.append(str(rng.choice(TOPICS[topics[rng.integers(0, len(topics))]])))
+        items.append({
+            '_id': f'i{i}',
+            'title': f"{tags[0].title()} {rng.choice(['Basics', 'Deep Dive', 'Workshop', 'Crash Course', 'Projects'])}",
+            'description': ' '.join(rng.choice(vocab, size=5)),
+            'tags': [str(t) for t in dict.fromkeys(tags)],
+            'type': str(rng.choice(TYPES)),
+        })
+
+    # users: 1-2 topics of interest
+    user_topics = [rng.choice(len(topics), size=rng.integers(1, 3), replace=False) for _ in range(n_users)]
+    users = []
+    for u, ts in enumerate(user_topics):
+        interests = [str(rng.choice(TOPICS[topics[t]])) for t in ts]
+        users.append({'_id': f'u{u}', 'interests': list(dict.fromkeys(interests)),
+                      'goals': [f'learn {topics[ts[0]]}']})
+
+    # power-law popularity: a random permutation of zipf ranks, per topic and global
+    pop = 1.0 / np.arange(1, n_items + 1) ** zipf_a
+    pop = pop[rng.permutation(n_items)]
+    global_p = pop / pop.sum()
+    by_topic = []
+    for t in range(len(topics)):
+        members = np.flatnonzero(item_topic == t)
+        p = pop[members]
+        by_topic.append((members, p / p.sum() if p.size else p))
+
+    # power-law user activity
+    activity = rng.pareto(1.5, n_users) + 1.0
+    ev_users = rng.choice(n_users, size=n_events, p=activity / activity.sum())
+    ev_items = rng.choice(n_items, size=n_events, p=global_p)
+    # topic-local events: one of the user's topics, then popularity within it
+    pair = np.array([[ts[0], ts[-1]] for ts in user_topics], dtype=np.int64).reshape(-1, 2)
+    ev_topic = pair[ev_users, rng.integers(0, 2, n_events)]
+    local = rng.random(n_events) < topic_affinity
+    for t, (members, p) in enumerate(by_topic):
+        mask = local & (ev_topic == t)
+        if members.size and mask.any():
+            ev_items[mask] = rng.choice(members, size=int(mask.sum()), p=p)
+    ev_types = rng.choice(len(EVENT_TYPES), size=n_events, p=EVENT_P)
+    scores = np.round(rng.random(n_events), 2)
+    start = datetime.now(timezone.utc) - timedelta(days=90)
+    offsets = np.sort(rng.integers(0, 90 * 86400, n_events))
+    events = [
+        {'user_id': f'u{u}', 'item_id': f'i{i}', 'type': str(EVENT_TYPES[t]), 'score': float(s),
+         'ts': (start + timedelta(seconds=int(o))).isoformat()}
+        for u, i, t, s, o in zip(ev_users, ev_items, ev_types, scores, offsets)
+    ]
+    return items, users, events
+
+
+def write_jsonl(out_dir, items, users, events):
+    os.makedirs(out_dir, exist_ok=True)
+    for name, docs in (('items', items), ('users', users), ('events', events)):
+        with open(os.path.join(out_dir, f'{name}.jsonl'), 'w') as f:
+            for d in docs:
+                f.write(json.dumps(d) + '\n')
+
+
+def read_jsonl(in_dir):
+    """Inverse of write_jsonl: (items, users, events)."""
+    out = []
+    for name in ('items', 'users', 'events'):
+        with open(os.path.join(in_dir, f'{name}.jsonl')) as f:
+            out.append([json.loads(line) for line in f])
+    return tuple(out)
+
+
+def write_mongo(items, users, events, drop=False, batch_size=10000):
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    db = client[os.getenv('MONGO_DB', 'learning_rec')]
+    for name, docs in (('items', items), ('users', users), ('events', events)):
+        if drop:
+            db[name].delete_many({})
+        for start in range(0, len(docs), batch_size):
+            db[name].insert_many(docs[start:start + batch_size], ordered=False)
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--topic-affinity', type=float, default=0.8)
+    parser.add_argument('--out', help='directory for items/users/events.jsonl')
+    parser.add_argument('--mongo', action='store_true', help='insert into MONGO_URI/MONGO_DB')
+    parser.add_argument('--drop', action='store_true', help='clear the collections before inserting')
+    args = parser.parse_args()
+    if not args.out and not args.mongo:
+        parser.error('pass --out DIR and/or --mongo')
+
+    items, users, events = generate(args.users, args.items, args.events, seed=args.seed,
+                                    topic_affinity=args.topic_affinity)
+    if args.out:
+        write_jsonl(args.out, items, users, events)
+    if args.mongo:
+        write_mongo(items, users, events, drop=args.drop)
+    print(f'Generated {len(items)} items, {len(users)} users, {len(events)} events.')
+
+
+if __name__ == '__main__':
+    main()
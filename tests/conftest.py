@@ -0,0 +1,47 @@
+import os
+import sys
+
+import mongomock
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, main  # noqa: E402
+from app.recommenders.collaborative import CollaborativeRecommender  # noqa: E402
+from app.utils import db  # noqa: E402
+from app.utils.event_log import EventLog  # noqa: E402
+
+ITEMS = [
+    {'_id': 'i0', 'title': 'Intro to Python', 'tags': ['python'], 'type': 'video', 'description': ''},
+    {'_id': 'i1', 'title': 'Python for Data Science', 'tags': ['python', 'data'], 'type': 'course', 'description': ''},
+    {'_id': 'i2', 'title': 'Machine Learning Crash Course', 'tags': ['ml', 'data'], 'type': 'course',
+     'description': ''},
+    {'_id': 'i3', 'title': 'Deep Learning', 'tags': ['ml', 'deep'], 'type': 'video', 'description': ''},
+    {'_id': 'i4', 'title': 'Python Loops', 'tags': ['python'], 'type': 'article', 'description': ''},
+]
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """An in-memory Mongo with a small catalog, installed as the app's database."""
+    client = mongomock.MongoClient()
+    database = client['test']
+    database.items.insert_many([dict(item) for item in ITEMS])
+    database.users.insert_many([{'_id': 'u1', 'interests': ['python']}, {'_id': 'u2', 'interests': ['ml']}])
+    monkeypatch.setattr(db, '_client', client)
+    monkeypatch.setattr(db, '_db', database)
+    return database
+
+
+@pytest.fixture
+def api(mongo, monkeypatch):
+    """Flask test client over ``mongo`` with fresh module state in app.main."""
+    monkeypatch.setenv('WRITE_BEHIND', '0')
+    monkeypatch.setenv('REC_SNAPSHOT_DIR', '')
+    monkeypatch.delenv('REC_SHARED_MODEL', raising=False)
+    for name in ('_TRAINER', '_WRITES', '_PUBLISHER'):
+        monkeypatch.setattr(main, name, None)
+    monkeypatch.setattr(main, '_EVENT_LOG', EventLog(CollaborativeRecommender._event_weight))
+    main._REC_CACHE.clear()
+    main._USER_GEN.clear()
+    return create_app().test_client()
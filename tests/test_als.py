@@ -0,0 +1,51 @@
+import numpy as np
+
+from app.recommenders.torch_mf import ALSRecommender
+
+
+def _fitted():
+    rng = np.random.default_rng(0)
+    events = [{'user_id': f'u{rng.integers(30)}', 'item_id': f'i{rng.integers(20)}', 'type': 'view'}
+              for _ in range(300)]
+    als = ALSRecommender(factors=8, iterations=3)
+    als.fit(events)
+    return als
+
+
+def test_new_users_and_items_grow_in_place():
+    als = _fitted()
+    before = als.score_many(['u1'])
+    for k in range(100):
+        als.add_interaction(f'new{k}', f'i{k % 20}', 1.0)
+    als.add_interaction('u1', 'fresh', 2.0)
+    assert als.user_factors.shape == (len(als.users), 8)
+    assert als.item_factors.shape == (len(als.items), 8)
+    # rows come from a buffer with spare capacity, not a copy per new user
+    assert als._user_buf.shape[0] >= len(als.users)
+    assert before.shape == (1, 20)
+    scores = als.score_many(['u1', 'new5', 'nobody'])
+    assert scores.shape == (3, len(als.items))
+    np.testing.assert_allclose(scores[1], als.score_all('new5'), rtol=1e-4, atol=1e-6)
+    assert scores[1].any() and not scores[2].any()
+    # new items score 0 until the next fit
+    assert scores[0][als.item_index['fresh']] == 0
+
+
+def test_state_round_trip_holds_only_live_rows():
+    als = _fitted()
+    for k in range(5):
+        als.add_interaction(f'new{k}', 'i3', 1.0)
+    meta, arrays = als.get_state()
+    assert arrays['user_factors'].shape == (len(als.users), 8)
+    assert arrays['item_factors'].shape == (len(als.items), 8)
+
+    for arr in arrays.values():
+        arr.flags.writeable = False
+    restored = ALSRecommender(factors=8)
+    restored.set_state(meta, arrays)
+    np.testing.assert_allclose(restored.score_many(['new2']), als.score_many(['new2']), rtol=1e-5)
+    # read-only (shared/memory-mapped) state is copied on the first write
+    restored.add_interaction('later', 'i1', 1.0)
+    assert restored.score_all('later') is not None
+    assert arrays['user_factors'].shape == (len(als.users), 8)
+
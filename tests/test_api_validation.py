@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+
+@pytest.mark.parametrize('limit', ['abc', '0', '-1', '2.5'])
+def test_similar_items_rejects_bad_limit(api, limit):
+    resp = api.get(f'/items/i0/similar?limit={limit}')
+    assert resp.status_code == 400
+
+
+def test_similar_items_limit(api):
+    resp = api.get('/items/i0/similar?limit=2')
+    assert resp.status_code == 200
+    similar = resp.get_json()['similar']
+    assert len(similar) == 2 and 'i0' not in [item['_id'] for item in similar]
+    assert api.get('/items/nope/similar').status_code == 404
+
+
+@pytest.mark.parametrize('user_ids', [[{'id': 'u1'}], ['u1', 7], [None], 'u1', []])
+def test_batch_rejects_bad_user_ids(api, user_ids):
+    resp = api.post('/recommendations/batch', json={'user_ids': user_ids})
+    assert resp.status_code == 400
+
+
+def test_batch_streams_one_line_per_user(api):
+    resp = api.post('/recommendations/batch', json={'user_ids': ['u1', 'nope', 'u2'], 'limit': 2})
+    assert resp.status_code == 200
+    rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert {row['user_id'] for row in rows} == {'u1', 'nope', 'u2'}
+    assert [row for row in rows if row['user_id'] == 'nope'][0]['error'] == 'unknown user'
+    assert all(len(row['recommendations']) == 2 for row in rows if 'error' not in row)
@@ -0,0 +1,86 @@
+import random
+import sys
+import threading
+from collections import Counter
+
+import pytest
+
+from app.recommenders.bandit import BanditStore
+
+
+@pytest.fixture
+def tight_switching():
+    # switch threads far more often than the default 5 ms, so races show up in a short run
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(previous)
+
+
+def test_concurrent_updates_are_not_lost(tight_switching):
+    store = BanditStore(epsilon=0.1)
+    # many (user, arm) pairs: writers keep racing to create the same users and arm slots
+    users, arms = [f'u{u}' for u in range(500)], [f'a{a}' for a in range(50)]
+    workloads = []
+    for t in range(8):
+        rng = random.Random(t)
+        workloads.append([(rng.choice(users), rng.choice(arms), float(rng.randint(0, 1))) for _ in range(20000)])
+    done = threading.Event()
+    errors = []
+
+    def write(ops):
+        for user_id, arm_id, reward in ops:
+            store.update(user_id, arm_id, reward)
+
+    def read():
+        while not done.is_set():
+            try:
+                for user_id in users:
+                    assert store.select(user_id, arms) in arms
+                    store.averages(user_id, arms)
+            except Exception as e:
+                errors.append(e)
+                return
+
+    writers = [threading.Thread(target=write, args=(ops,)) for ops in workloads]
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for t in writers + readers:
+        t.start()
+    for t in writers:
+        t.join()
+    done.set()
+    for t in readers:
+        t.join()
+
+    assert not errors
+    counts, rewards = Counter(), Counter()
+    for ops in workloads:
+        for user_id, arm_id, reward in ops:
+            counts[user_id, arm_id] += 1
+            rewards[user_id, arm_id] += reward
+    state = {user_id: store.state(user_id) for user_id in users}
+    assert sum(arm['count'] for s in state.values() for arm in s.values()) == 8 * 20000
+    for (user_id, arm_id), n in counts.items():
+        assert state[user_id][arm_id] == {'count': n, 'total_reward': rewards[user_id, arm_id]}
+
+
+def test_select_exploits_best_average():
+    store = BanditStore(epsilon=0.0)
+    store.update('u1', 'a', 0.2)
+    store.update('u1', 'b', 1.0)
+    store.update('u1', 'b', 0.0)
+    store.update('u1', 'c', 0.9)
+    assert store.select('u1', ['a', 'b', 'c', 'never']) == 'c'
+    # unknown user: first candidate
+    assert store.select('u2', ['x', 'y']) == 'x'
+    assert list(store.averages('u1', ['b', 'never'])) == [0.5, 0.0]
+
+
+def test_load_merges_persisted_state():
+    store = BanditStore()
+    store.update('u1', 'a', 1.0)
+    n = store.load([{'user_id': 'u1', 'arm': 'a', 'count': 3, 'total_reward': 2},
+                    {'user_id': 'u2', 'arm': 'b', 'count': 1}])
+    assert n == 2
+    assert store.state('u1') == {'a': {'count': 4.0, 'total_reward': 3.0}}
+    assert store.state('u2') == {'b': {'count': 1.0, 'total_reward': 0.0}}
@@ -0,0 +1,155 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app.chatbot import FakeModel, GeminiChatbot, fake_search
+from app.utils import cache
+from app.utils.cache import DiskCache, TieredCache
+
+
+class FakeClock:
+    """Stands in for the time module in app.utils.cache: both clocks move together."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def disk(tmp_path):
+    return DiskCache(str(tmp_path / 'chatbot.sqlite3'))
+
+
+def _bot(disk, model=None, ttl=60):
+    return GeminiChatbot(model=model or FakeModel(), search=fake_search,
+                         chat_cache=TieredCache('chat', ttl, disk=disk),
+                         search_cache=TieredCache('serp', ttl, disk=disk))
+
+
+def test_disk_hit_is_promoted_to_memory(disk):
+    first = _bot(disk)
+    answer = first.chat('What is Python?')['response']
+    assert first.model.calls == 1
+
+    # a new process: empty memory tier over the same SQLite file
+    model = FakeModel()
+    second = _bot(disk, model)
+    assert second.chat('What is Python?')['response'] == answer
+    assert second.chat_cache.stats['disk_hits'] == 1
+    assert second.chat('What is Python?')['response'] == answer
+    assert second.chat_cache.stats['memory_hits'] == 1
+    assert model.calls == 0
+
+
+def test_entries_expire_after_ttl(clock, disk):
+    tiered = TieredCache('chat', 10, disk=disk)
+    tiered.set('k', {'response': 'hi'})
+    clock.now += 9
+    assert tiered.get('k') == {'response': 'hi'}
+    clock.now += 2
+    assert tiered.get('k') is None
+    assert tiered.stats == {'memory_hits': 1, 'disk_hits': 0, 'misses': 1, 'disk_errors': 0}
+
+
+def test_promoted_entry_keeps_the_disk_expiry(clock, disk):
+    TieredCache('chat', 10, disk=disk).set('k', 'v')
+    clock.now += 8
+    fresh = TieredCache('chat', 10, disk=disk)
+    assert fresh.get('k') == 'v'
+    # 2 s were left on disk, not a new 10 s in memory
+    clock.now += 3
+    assert fresh.get('k') is None
+
+
+def test_chat_answer_expires(clock, disk):
+    bot = _bot(disk, ttl=30)
+    bot.chat('What is Python?')
+    clock.now += 31
+    bot.chat('What is Python?')
+    assert bot.model.calls == 2
+
+
+def test_keys_ignore_case_whitespace_and_trailing_punctuation(disk):
+    bot = _bot(disk)
+    bot.chat('What is Python?')
+    for variant in ('what is python', '  WHAT   is\tPython?! ', 'What is Python.'):
+        bot.chat(variant)
+    assert bot.model.calls == 1
+    assert bot.chat_cache.stats['memory_hits'] == 3
+
+    # different question or different user context: a new answer
+    bot.chat('What is Python 3?')
+    bot.chat('What is Python?', context='User is interested in: ml')
+    assert bot.model.calls == 3
+
+
+def test_search_keys_are_normalized(disk):
+    calls = []
+
+    def search(query, num_results):
+        calls.append(query)
+        return fake_search(query, num_results)
+
+    bot = GeminiChatbot(model=FakeModel(), search=search, chat_cache=TieredCache('chat', 60, disk=disk),
+                        search_cache=TieredCache('serp', 60, disk=disk))
+    bot.search_web('Latest Python news', 3)
+    bot.search_web('latest  python NEWS?', 3)
+    # the result count is part of the key
+    bot.search_web('latest python news', 5)
+    assert len(calls) == 2
+
+
+def test_hit_and_miss_counters(disk):
+    tiered = TieredCache('chat', 60, disk=disk)
+    assert tiered.get('a') is None
+    tiered.set('a', 1)
+    assert tiered.get('a') == 1
+    other = TieredCache('chat', 60, disk=disk)
+    assert other.get('a') == 1
+    assert tiered.stats == {'memory_hits': 1, 'disk_hits': 0, 'misses': 1, 'disk_errors': 0}
+    assert other.stats == {'memory_hits': 0, 'disk_hits': 1, 'misses': 0, 'disk_errors': 0}
+    assert tiered.memory.hits == 1 and tiered.memory.misses == 1
+
+
+def test_disk_errors_count_as_misses(disk, monkeypatch):
+    tiered = TieredCache('chat', 60, disk=disk)
+
+    def broken(*args):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(disk, 'get', broken)
+    monkeypatch.setattr(disk, 'set', broken)
+    tiered.set('a', 1)
+    assert tiered.get('a') == 1
+    assert tiered.get('b') is None
+    assert tiered.stats == {'memory_hits': 1, 'disk_hits': 0, 'misses': 1, 'disk_errors': 2}
+
+
+def test_counters_are_exact_under_concurrent_lookups():
+    tiered = TieredCache('chat', 60)
+    tiered.set('hit', 1)
+
+    def lookups():
+        for _ in range(1000):
+            tiered.get('hit')
+            tiered.get('miss')
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert tiered.stats['memory_hits'] == 8000 and tiered.stats['misses'] == 8000
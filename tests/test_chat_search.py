@@ -0,0 +1,107 @@
+import threading
+import time
+
+from app.chatbot import CircuitBreaker, FakeModel, GeminiChatbot, fake_search
+from app.utils.cache import TieredCache
+
+
+def _bot(search, budget=1.0, breaker=None):
+    return GeminiChatbot(model=FakeModel(), search=search, chat_cache=TieredCache('chat', 60),
+                         search_cache=TieredCache('serp', 60), search_budget=budget,
+                         breaker=breaker or CircuitBreaker(threshold=2, reset_after=60))
+
+
+def _failing_search(query, num_results):
+    raise ConnectionError('serp down')
+
+
+def test_search_results_within_budget():
+    bot = _bot(fake_search)
+    result = bot.chat('latest python news')
+    assert result['has_search'] and len(result['web_results']) == 3
+    assert bot.search_stats == {'ok': 1, 'failed': 0, 'skipped': 0, 'dropped': 0}
+
+
+def test_slow_search_is_dropped_at_the_budget():
+    done = threading.Event()
+
+    def slow_search(query, num_results):
+        time.sleep(0.5)
+        done.set()
+        return fake_search(query, num_results)
+
+    bot = _bot(slow_search, budget=0.05)
+    start = time.monotonic()
+    result = bot.chat('latest python news')
+    assert time.monotonic() - start < 0.4
+    assert not result['has_search'] and result['web_results'] == []
+    assert bot.search_stats['dropped'] == 1
+
+    # the search kept running and still fills the cache for the next request
+    assert done.wait(2)
+    time.sleep(0.05)
+    assert bot.search_web('latest python news 2024 2025', 3)
+    assert bot.search_stats['ok'] == 1
+
+
+def test_failures_open_the_breaker_and_skip_search():
+    calls = []
+
+    def search(query, num_results):
+        calls.append(query)
+        raise ConnectionError('serp down')
+
+    bot = _bot(search)
+    assert bot.search_web('a') == [] and bot.search_web('b') == []
+    assert bot.breaker.is_open
+    assert bot.search_web('c') == []
+    assert len(calls) == 2
+    assert bot.search_stats == {'ok': 0, 'failed': 2, 'skipped': 1, 'dropped': 0}
+
+
+def test_half_open_trial_success_closes_the_breaker():
+    backend = {'fn': _failing_search}
+    bot = _bot(lambda q, n: backend['fn'](q, n), breaker=CircuitBreaker(threshold=1, reset_after=0.05))
+    bot.search_web('a')
+    assert bot.breaker.is_open and bot.search_web('b') == []
+
+    time.sleep(0.06)
+    backend['fn'] = fake_search
+    assert bot.search_web('c')
+    assert not bot.breaker.is_open
+    assert bot.search_stats == {'ok': 1, 'failed': 1, 'skipped': 1, 'dropped': 0}
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(threshold=1, reset_after=0.05)
+    breaker.record(False)
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.allow() and breaker.allow()
+
+
+def test_half_open_trial_failure_reopens_the_breaker():
+    bot = _bot(_failing_search, breaker=CircuitBreaker(threshold=1, reset_after=0.05))
+    bot.search_web('a')
+    time.sleep(0.06)
+    # the trial call goes through and fails
+    assert bot.search_web('b') == []
+    assert bot.search_stats['failed'] == 2
+    assert bot.breaker.is_open
+    assert bot.search_web('c') == []
+    assert bot.search_stats['skipped'] == 1
+
+
+def test_stats_are_exact_under_concurrent_searches():
+    # ttl 0: nothing is cached, every call reaches the backend
+    bot = GeminiChatbot(model=FakeModel(), search=fake_search, chat_cache=TieredCache('chat', 0),
+                        search_cache=TieredCache('serp', 0), search_budget=1.0)
+    threads = [threading.Thread(target=lambda: [bot.search_web('q', 1) for _ in range(500)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert bot.search_stats['ok'] == 4000
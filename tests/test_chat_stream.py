@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from app import create_app, main
+from app.chatbot import FakeModel, GeminiChatbot, fake_search
+from app.utils import metrics
+from app.utils.cache import TieredCache
+
+
+class FailingModel(FakeModel):
+    """Streams a couple of words, then loses the connection."""
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+
+        def chunks():
+            yield self._Response('partial')
+            yield self._Response(' answer')
+            raise ConnectionError('stream reset')
+
+        return chunks()
+
+
+def _frames(body):
+    frames = []
+    for block in body.strip().split('\n\n'):
+        event, data = block.split('\n')
+        frames.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return frames
+
+
+@pytest.fixture
+def client():
+    return create_app().test_client()
+
+
+def _use_bot(monkeypatch, model):
+    bot = GeminiChatbot(model=model, search=fake_search, chat_cache=TieredCache('chat', 60),
+                        search_cache=TieredCache('serp', 60))
+    monkeypatch.setattr(main, '_CHATBOT', bot)
+    return bot
+
+
+def test_cached_answer_is_replayed_as_a_stream(client, monkeypatch):
+    model = FakeModel()
+    _use_bot(monkeypatch, model)
+    first = _frames(client.post('/chat/stream', json={'message': 'What is Python?'}).get_data(as_text=True))
+    assert [kind for kind, _ in first][0] == 'meta'
+    assert first[-1][0] == 'done'
+
+    resp = client.post('/chat/stream', json={'message': '  what is python  '})
+    assert resp.mimetype == 'text/event-stream'
+    replay = _frames(resp.get_data(as_text=True))
+    assert [kind for kind, _ in replay] == ['meta', 'token', 'done']
+    assert replay[1][1]['text'] == replay[2][1]['response'] == first[-1][1]['response']
+    assert model.calls == 1
+
+
+def test_error_mid_stream_emits_error_frame(client, monkeypatch):
+    bot = _use_bot(monkeypatch, FailingModel())
+    frames = _frames(client.post('/chat/stream', json={'message': 'What is Rust?'}).get_data(as_text=True))
+    assert [kind for kind, _ in frames] == ['meta', 'token', 'token', 'error']
+    assert 'stream reset' in frames[-1][1]['response']
+    # failed answers are not cached
+    assert bot.chat_cache.stats['memory_hits'] == 0
+    assert _frames(client.post('/chat/stream', json={'message': 'What is Rust?'})
+                   .get_data(as_text=True))[-1][0] == 'error'
+
+
+@pytest.mark.skipif(not metrics.ENABLED, reason='metrics disabled')
+def test_latency_covers_the_whole_stream(client, monkeypatch):
+    # ~8 words at 20 ms each: far longer than returning the headers
+    _use_bot(monkeypatch, FakeModel(delay=0.02))
+    labels = ('/chat/stream', 'POST')
+
+    def observed():
+        counts, total = metrics.HTTP_SECONDS._values.get(labels, [[0], 0.0])
+        return sum(counts), total
+
+    before_n, before_sum = observed()
+    resp = client.post('/chat/stream', json={'message': 'What is Go?'})
+    assert observed()[0] == before_n
+    resp.get_data()
+    n, total = observed()
+    assert n == before_n + 1
+    assert total - before_sum >= 0.1
@@ -0,0 +1,62 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.recommenders.collaborative import CollaborativeRecommender
+
+
+class RacingIndex(dict):
+    """user_index that lets a concurrent add_interaction for ``key`` run while ``key`` is looked up."""
+
+    def __init__(self, data, cf, key):
+        super().__init__(data)
+        self.cf = cf
+        self.key = key
+
+    def get(self, key, default=None):
+        if key == self.key and not dict.__contains__(self, key):
+            writer = threading.Thread(target=self.cf.add_interaction, args=(key, 'i1', 1.0))
+            writer.start()
+            # completes unless the lookup holds the model lock
+            writer.join(0.2)
+        return dict.get(self, key, default)
+
+
+def _fitted(mode):
+    cf = CollaborativeRecommender(mode=mode)
+    cf.fit([{'user_id': f'u{u}', 'item_id': f'i{i}', 'type': 'view'} for u in range(5) for i in range(u, 8, 2)])
+    return cf
+
+
+@pytest.mark.parametrize('mode', ['user', 'item'])
+def test_score_many_with_user_added_concurrently(mode):
+    cf = _fitted(mode)
+    expected = cf.score_many(['u1'])[0]
+    cf.user_index = RacingIndex(cf.user_index, cf, 'new')
+    scores = cf.score_many(['u1', 'new'], cols=np.arange(4))
+    np.testing.assert_allclose(scores[0], expected[:4], rtol=1e-6)
+    # the new user arrived after the matrix was taken: scored as unknown this time
+    assert not scores[1].any()
+    assert cf.score_many(['new']).shape == (1, len(cf.items))
+
+
+@pytest.mark.parametrize('mode', ['user', 'item'])
+def test_score_many_matches_score_all(mode):
+    cf = _fitted(mode)
+    cf.add_interaction('u1', 'i7', 3.0)
+    cf.add_interaction('u9', 'i0', 1.0)
+    scores = cf.score_many(['u1', 'u9', 'nobody'])
+    np.testing.assert_allclose(scores[0], cf.score_all('u1'), rtol=1e-5)
+    np.testing.assert_allclose(scores[1], cf.score_all('u9'), rtol=1e-5)
+    assert not scores[2].any()
+
+
+def test_neighbor_scores_with_user_added_concurrently():
+    cf = _fitted('item')
+    expected = cf.neighbor_scores(['u1']).toarray()[0]
+    cf.user_index = RacingIndex(cf.user_index, cf, 'new')
+    scores = cf.neighbor_scores(['u1', 'new']).toarray()
+    np.testing.assert_allclose(scores[0], expected, rtol=1e-6)
+    assert not scores[1].any()
+    assert cf.neighbor_scores(['new']).shape == (1, len(cf.items))
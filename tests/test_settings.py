@@ -0,0 +1,13 @@
+from app import main
+
+
+def test_served_model_uses_recommender_settings(monkeypatch, api):
+    monkeypatch.setenv('REC_MAX_CANDIDATES', '3')
+    monkeypatch.setenv('REC_CF_MODE', 'item')
+    monkeypatch.setenv('REC_EPSILON', '0')
+    rec = main._get_rec()
+    assert rec.max_candidates == 3
+    assert rec.cf.mode == 'item'
+    assert rec.bandits.epsilon == 0
+    resp = api.get('/recommendations?user_id=u1&limit=2')
+    assert resp.status_code == 200 and len(resp.get_json()['recommendations']) == 2
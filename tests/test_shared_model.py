@@ -0,0 +1,140 @@
+import multiprocessing as mp
+import os
+import time
+
+import pytest
+from bson import ObjectId
+
+from app.recommenders.hybrid import HybridRecommender
+from app.serving import _fold_delta
+from app.shared_model import ModelPublisher, SharedModelReader
+from app.trainer import BackgroundTrainer, ModelSnapshot
+
+from conftest import ITEMS
+
+EVENTS = [{'user_id': 'u1', 'item_id': 'i0', 'type': 'view'}, {'user_id': 'u2', 'item_id': 'i2', 'type': 'view'}]
+
+
+def _event(user_id, item_id):
+    return {'_id': ObjectId(), 'user_id': user_id, 'item_id': item_id, 'type': 'view'}
+
+
+def _snapshot(version=1):
+    rec = HybridRecommender(epsilon=0.0)
+    rec.fit(ITEMS, EVENTS)
+    return ModelSnapshot(rec, ITEMS, None, {}, version, time.time())
+
+
+def _seen(reader, user_id, item_id):
+    rec = reader.current.rec
+    return rec.item_pos[item_id] in set(rec.seen.get(user_id, []))
+
+
+@pytest.fixture
+def publisher():
+    pub = ModelPublisher(f'test{os.getpid()}', delta_slots=64)
+    yield pub
+    pub.close()
+
+
+@pytest.fixture
+def readers(publisher):
+    publisher.publish(_snapshot())
+    invalidated = []
+    made = []
+    for _ in range(2):
+        reader = SharedModelReader(publisher.prefix, HybridRecommender, on_delta=invalidated.append)
+        reader.refresh()
+        made.append(reader)
+    return made, invalidated
+
+
+def test_writes_reach_other_workers_without_a_new_generation(publisher, readers):
+    (a, b), invalidated = readers
+    a.apply_delta({'kind': 'event', 'event': _event('u1', 'i3')})
+    a.apply_delta({'kind': 'feedback', 'user_id': 'u1', 'item_id': 'i3', 'reward': 1.0})
+    assert _seen(a, 'u1', 'i3') and not _seen(b, 'u1', 'i3')
+    b.catch_up()
+    assert _seen(b, 'u1', 'i3')
+    assert b.current.rec.bandits.state('u1') == {'i3': {'count': 1.0, 'total_reward': 1.0}}
+    assert publisher.generation == 1 and invalidated == ['u1', 'u1']
+
+
+def test_refit_only_on_request(publisher, readers):
+    (a, b), _ = readers
+    trainer = BackgroundTrainer(lambda version: _snapshot(version), _snapshot())
+    refits = []
+    trainer.request_refit = lambda: refits.append(True)
+    a.apply_delta({'kind': 'event', 'event': _event('u1', 'i3')})
+    b.apply_delta({'kind': 'feedback', 'user_id': 'u1', 'item_id': 'i3', 'reward': 1.0})
+    assert publisher.consume(lambda delta: _fold_delta(trainer, delta)) == (2, False)
+    assert refits == [] and trainer.dirty
+    assert trainer.current.rec.bandits.state('u1') == {'i3': {'count': 1.0, 'total_reward': 1.0}}
+    a.request_refit()
+    publisher.consume(lambda delta: _fold_delta(trainer, delta))
+    assert refits == [True]
+
+
+def test_swap_replays_only_writes_after_the_generation(publisher, readers):
+    (a, b), _ = readers
+    trainer = BackgroundTrainer(lambda version: _snapshot(version), _snapshot())
+    a.apply_delta({'kind': 'event', 'event': _event('u1', 'i3')})
+    a.apply_delta({'kind': 'feedback', 'user_id': 'u1', 'item_id': 'i3', 'reward': 1.0})
+    publisher.consume(lambda delta: _fold_delta(trainer, delta))
+    publisher.publish(trainer.current)
+    # logged after the publish: not covered by generation 2
+    a.apply_delta({'kind': 'event', 'event': _event('u2', 'i4')})
+    a.apply_delta({'kind': 'feedback', 'user_id': 'u1', 'item_id': 'i3', 'reward': 0.5})
+    for reader in (a, b):
+        assert reader.refresh() and reader.generation == 2
+        assert _seen(reader, 'u1', 'i3') and _seen(reader, 'u2', 'i4')
+        assert reader.current.rec.bandits.state('u1') == {'i3': {'count': 2.0, 'total_reward': 1.5}}
+    pop = a.current.rec.popularity[a.current.rec.item_pos['i3']]
+    assert pop == trainer.current.rec.popularity[trainer.current.rec.item_pos['i3']]
+    # a worker started now gets the published bandit state plus the feedback after it
+    late = SharedModelReader(publisher.prefix, HybridRecommender)
+    late.refresh()
+    assert late.current.rec.bandits.state('u1') == {'i3': {'count': 2.0, 'total_reward': 1.5}}
+    assert _seen(late, 'u2', 'i4')
+
+
+def test_overrun_requests_a_refit(publisher, readers):
+    (a, b), _ = readers
+    for _ in range(publisher.deltas.slots + 1):
+        a.apply_delta({'kind': 'feedback', 'user_id': 'u1', 'item_id': 'i0', 'reward': 1.0})
+    assert b.catch_up() == 0
+    head = publisher.deltas.head
+    assert publisher.deltas.read(head - 1) == ([(head, {'kind': 'refit'})], head, False)
+
+
+def test_long_deltas_span_slots(publisher):
+    interests = [f'topic-{k}' for k in range(100)]
+    seq = publisher.deltas.append({'kind': 'user', 'user': {'_id': 'u1', 'interests': interests}})
+    assert seq > 1
+    records, position, overrun = publisher.deltas.read(0)
+    assert records == [(seq, {'kind': 'user', 'user': {'_id': 'u1', 'interests': interests}})]
+    assert position == seq and not overrun
+
+
+def _append_many(prefix, lock, worker, n):
+    reader = SharedModelReader(prefix, HybridRecommender, lock=lock)
+    for k in range(n):
+        reader.deltas.append({'kind': 'feedback', 'user_id': f'w{worker}', 'item_id': str(k), 'reward': 1.0})
+
+
+def test_appends_from_several_processes():
+    publisher = ModelPublisher(f'test{os.getpid()}', delta_slots=8192)
+    try:
+        ctx = mp.get_context('spawn')
+        lock = ctx.Lock()
+        procs = [ctx.Process(target=_append_many, args=(publisher.prefix, lock, w, 2000)) for w in range(3)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(60)
+        records, position, overrun = publisher.deltas.read(0)
+        assert not overrun and position == 6000
+        for w in range(3):
+            assert [d['item_id'] for _, d in records if d['user_id'] == f'w{w}'] == [str(k) for k in range(2000)]
+    finally:
+        publisher.close()
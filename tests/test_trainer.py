@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from app.recommenders.collaborative import CollaborativeRecommender
+from app.recommenders.hybrid import HybridRecommender
+from app.trainer import BackgroundTrainer, ModelSnapshot
+from app.utils.event_log import EventLog
+
+from conftest import ITEMS
+
+
+def _event(user_id, item_id, type='view'):
+    return {'_id': ObjectId(), 'user_id': user_id, 'item_id': item_id, 'type': type}
+
+
+def _apply(trainer, event):
+    # what app.main._apply_event does once the write is queued
+    trainer.apply_delta({'kind': 'event', 'event': event})
+
+
+def _popularity(snap, item_id):
+    return snap.rec.popularity[snap.rec.item_pos[item_id]]
+
+
+class Builder:
+    """Refits from the mongo fixture like app.main._build_snapshot; can pause after reading or fail."""
+
+    def __init__(self, mongo):
+        self.mongo = mongo
+        self.log = EventLog(CollaborativeRecommender._event_weight)
+        self.loaded = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def __call__(self, version):
+        if self.error:
+            raise self.error
+        items = list(self.mongo.items.find())
+        self.log.sync(self.mongo.events)
+        users = {u['_id']: u for u in self.mongo.users.find()}
+        rec = HybridRecommender()
+        rec.fit_log(items, self.log)
+        self.loaded.set()
+        assert self.release.wait(5)
+        return ModelSnapshot(rec, items, self.log, users, version, time.time())
+
+
+@pytest.fixture
+def builder(mongo):
+    return Builder(mongo)
+
+
+def _trainer(builder, **kwargs):
+    empty = ModelSnapshot(HybridRecommender(), [], None, {}, 0, time.time())
+    trainer = BackgroundTrainer(builder, empty, **kwargs)
+    assert trainer.refit_now()
+    return trainer
+
+
+def test_writes_during_a_build_survive_the_swap(mongo, builder):
+    trainer = _trainer(builder)
+    old = trainer.current
+    # in Mongo before the build reads it: loaded by the build, must not be replayed on top
+    loaded = _event('u1', 'i2')
+    mongo.events.insert_one(dict(loaded))
+    _apply(trainer, loaded)
+
+    builder.loaded.clear()
+    builder.release.clear()
+    refit = threading.Thread(target=trainer.refit_now)
+    refit.start()
+    assert builder.loaded.wait(5)
+    # lands while the build is running, still in the write-behind queue: the build never saw it
+    late = _event('u2', 'i3', 'complete')
+    _apply(trainer, late)
+    assert trainer.current is old and _popularity(old, 'i3') == 1
+    builder.release.set()
+    refit.join(5)
+
+    snap = trainer.current
+    assert snap is not old and snap.version == old.version + 1
+    assert _popularity(snap, 'i2') == 1
+    assert _popularity(snap, 'i3') == 1
+    assert snap.rec.item_pos['i3'] in snap.rec.seen['u2']
+    assert snap.rec.cf.score_all('u2') is not None
+
+    # once Mongo has it, the next build loads it and the replay stops
+    mongo.events.insert_one(dict(late))
+    assert trainer.refit_now()
+    assert _popularity(trainer.current, 'i3') == 1
+    assert trainer._unloaded == []
+
+
+def test_unloaded_writes_are_capped_while_builds_fail(mongo, builder, caplog):
+    trainer = _trainer(builder, max_unloaded=3)
+    builder.error = ConnectionError('mongo down')
+    events = [_event('u1', f'i{k}') for k in range(5)]
+    with caplog.at_level(logging.WARNING, logger='app.trainer'):
+        for event in events:
+            _apply(trainer, event)
+            assert not trainer.refit_now()
+    assert len(trainer._unloaded) == 3 and trainer.dropped_unloaded == 2
+    assert 'mongo down' in caplog.text
+    # still served from the live snapshot
+    assert all(_popularity(trainer.current, f'i{k}') == 1 for k in range(5))
+
+    builder.error = None
+    with caplog.at_level(logging.WARNING, logger='app.trainer'):
+        assert trainer.refit_now()
+    snap = trainer.current
+    # the newest three were replayed; the dropped two were never written to Mongo here
+    assert [_popularity(snap, f'i{k}') for k in range(5)] == [0, 0, 1, 1, 1]
+    assert 'Dropped 2 writes' in caplog.text
+    assert trainer.dropped_unloaded == 0
+
+
+def _scores_by_item(rec, user_id):
+    scores = rec.cf.score_all(user_id)
+    return {item_id: scores[j] for j, item_id in enumerate(rec.cf.items)}
+
+
+def test_incremental_events_match_a_refit():
+    rng = np.random.default_rng(0)
+    users = [f'u{u}' for u in range(12)]
+    types = ['view', 'like', 'complete', 'quiz']
+
+    def events(n):
+        return [{'user_id': users[rng.integers(len(users))], 'item_id': ITEMS[rng.integers(len(ITEMS))]['_id'],
+                 'type': types[rng.integers(len(types))], 'score': float(rng.random())} for _ in range(n)]
+
+    base = events(40)
+    # includes brand-new users and repeats of known (user, item) pairs
+    more = events(30) + [{'user_id': 'newbie', 'item_id': 'i4', 'type': 'like'}]
+    incremental = HybridRecommender(cf_mode='user')
+    incremental.fit(ITEMS, base)
+    for event in more:
+        incremental.add_event(event)
+    refit = HybridRecommender(cf_mode='user')
+    refit.fit(ITEMS, base + more)
+
+    np.testing.assert_allclose(incremental.popularity, refit.popularity)
+    assert incremental.seen.keys() == refit.seen.keys()
+    for user_id in refit.seen:
+        np.testing.assert_array_equal(incremental.seen[user_id], refit.seen[user_id])
+        got, want = _scores_by_item(incremental, user_id), _scores_by_item(refit, user_id)
+        assert got.keys() == want.keys()
+        for item_id in want:
+            assert got[item_id] == pytest.approx(want[item_id], rel=1e-4, abs=1e-6)
+        user = {'_id': user_id, 'interests': ['python']}
+        assert incremental.rank(user, limit=3) == refit.rank(user, limit=3)
@@ -0,0 +1,159 @@
+import json
+
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+from app.utils.write_behind import WriteBehindQueue, replay_spill
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.target = db.store[name]
+        self.name = name
+
+    def _call(self, method, *args, **kwargs):
+        self.db.calls.append((self.name, method))
+        if self.db.down:
+            self.db.down -= 1
+            raise AutoReconnect('connection refused')
+        return getattr(self.target, method)(*args, **kwargs)
+
+    def insert_many(self, docs, ordered=True):
+        return self._call('insert_many', docs, ordered=ordered)
+
+    def bulk_write(self, ops, ordered=True):
+        return self._call('bulk_write', ops, ordered=ordered)
+
+    def insert_one(self, doc):
+        return self._call('insert_one', doc)
+
+    def update_one(self, filt, update, upsert=False):
+        return self._call('update_one', filt, update, upsert=upsert)
+
+
+class FakeDB:
+    """mongomock underneath; the next ``down`` calls fail as if Mongo were unreachable."""
+
+    def __init__(self):
+        self.store = mongomock.MongoClient()['test']
+        self.calls = []
+        self.down = 0
+
+    def __getitem__(self, name):
+        return FakeCollection(self, name)
+
+
+@pytest.fixture
+def db():
+    return FakeDB()
+
+
+def _queue(db, **kwargs):
+    # no background flushes unless a test asks: flush() and close() drive the queue
+    kwargs.setdefault('flush_interval', 60)
+    return WriteBehindQueue(lambda: db, **kwargs)
+
+
+def test_upserts_coalesce_into_one_op(db):
+    q = _queue(db)
+    for reward in (1.0, 0.0, 0.5):
+        q.upsert('rl_state', {'user_id': 'u1', 'arm': 'i1'}, inc={'count': 1, 'total_reward': reward},
+                 set_fields={'last_reward': reward})
+    q.upsert('rl_state', {'user_id': 'u1', 'arm': 'i2'}, inc={'count': 1})
+    assert q.stats['queue_depth'] == 2
+    assert q.pending('rl_state', {'user_id': 'u1', 'arm': 'i1'}) == {'last_reward': 0.5}
+    q.flush()
+    assert db.calls == [('rl_state', 'bulk_write')]
+    doc = db.store.rl_state.find_one({'user_id': 'u1', 'arm': 'i1'}, {'_id': 0})
+    assert doc == {'user_id': 'u1', 'arm': 'i1', 'count': 3, 'total_reward': 1.5, 'last_reward': 0.5}
+    assert q.stats['flushed_ops'] == 2 and q.pending('rl_state', {'user_id': 'u1', 'arm': 'i1'}) is None
+
+
+def test_inserts_are_batched_per_collection(db):
+    q = _queue(db)
+    for k in range(5):
+        q.insert('events', {'_id': ObjectId(), 'user_id': 'u1', 'item_id': f'i{k}'})
+    q.flush()
+    assert db.calls == [('events', 'insert_many')]
+    assert db.store.events.count_documents({}) == 5
+
+
+def test_failed_flush_is_retried(db):
+    q = _queue(db, retry_backoff=0.0)
+    q.insert('events', {'_id': ObjectId(), 'user_id': 'u1', 'item_id': 'i1'})
+    q.upsert('rl_state', {'user_id': 'u1', 'arm': 'i1'}, inc={'count': 1}, set_fields={'last_reward': 1.0})
+    db.down = 2
+    q.flush()
+    assert q.stats['retry_depth'] == 2 and q.stats['failed_ops'] == 2
+    # still readable while waiting for the retry
+    assert q.pending('rl_state', {'user_id': 'u1', 'arm': 'i1'}) == {'last_reward': 1.0}
+    q._flush_once()
+    assert db.store.events.count_documents({}) == 1
+    assert db.store.rl_state.find_one({'user_id': 'u1'})['count'] == 1
+    assert q.stats['retry_depth'] == 0 and q.stats['retried_ops'] == 2
+
+
+def test_ops_out_of_retries_are_spilled(db, tmp_path):
+    spill = tmp_path / 'spill.jsonl'
+    q = _queue(db, max_retries=1, retry_backoff=0.0, spill_path=str(spill))
+    event_id = ObjectId()
+    q.insert('events', {'_id': event_id, 'user_id': 'u1', 'item_id': 'i1'})
+    q.upsert('rl_state', {'user_id': 'u1', 'arm': 'i1'}, inc={'count': 1, 'total_reward': 1.0})
+    db.down = 100
+    q.flush()
+    q._flush_once()
+    assert q.stats['spilled_ops'] == 2 and q.stats['retry_depth'] == 0
+    records = [json.loads(line) for line in spill.read_text().splitlines()]
+    assert sorted((r['kind'], r['collection']) for r in records) == [('insert', 'events'), ('upsert', 'rl_state')]
+
+    # Mongo is back: the spill replays, and inserts cannot be duplicated by a second replay
+    db.down = 0
+    assert replay_spill(db, str(spill)) == (2, [])
+    replay_spill(db, str(spill))
+    assert db.store.events.find_one({'_id': event_id})['item_id'] == 'i1'
+    assert db.store.events.count_documents({}) == 1
+    assert db.store.rl_state.find_one({'user_id': 'u1'})['total_reward'] == 2.0
+
+
+def test_replay_reports_ops_that_fail_again(db, tmp_path):
+    spill = tmp_path / 'spill.jsonl'
+    q = _queue(db, max_retries=0, spill_path=str(spill))
+    q.insert('events', {'_id': ObjectId(), 'user_id': 'u1', 'item_id': 'i1'})
+    db.down = 1
+    q.flush()
+    db.down = 1
+    written, failed = replay_spill(db, str(spill))
+    assert written == 0 and [r['collection'] for r in failed] == ['events']
+
+
+def test_close_flushes_buffered_writes(db):
+    q = _queue(db)
+    q.insert('events', {'_id': ObjectId(), 'user_id': 'u1', 'item_id': 'i1'})
+    q.upsert('user_history', {'user_id': 'u1'}, set_fields={'skill_level': 'Beginner'})
+    q.close()
+    assert db.store.events.count_documents({}) == 1
+    assert db.store.user_history.find_one({'user_id': 'u1'})['skill_level'] == 'Beginner'
+    # later writes go straight to Mongo
+    q.insert('events', {'_id': ObjectId(), 'user_id': 'u1', 'item_id': 'i2'})
+    assert db.store.events.count_documents({}) == 2
+    assert q.stats['sync_writes'] == 1
+
+
+def test_close_spills_what_still_fails(db, tmp_path):
+    spill = tmp_path / 'spill.jsonl'
+    q = _queue(db, retry_backoff=60, spill_path=str(spill))
+    q.insert('events', {'_id': ObjectId(), 'user_id': 'u1', 'item_id': 'i1'})
+    db.down = 100
+    q.close()
+    assert q.stats['spilled_ops'] == 1 and q.stats['retry_depth'] == 0
+    assert len(spill.read_text().splitlines()) == 1
+
+
+def test_disabled_queue_writes_synchronously(db):
+    q = _queue(db, enabled=False)
+    q.upsert('rl_state', {'user_id': 'u1', 'arm': 'i1'}, inc={'count': 2})
+    assert db.calls == [('rl_state', 'update_one')]
+    assert db.store.rl_state.find_one({'user_id': 'u1'})['count'] == 2